@@ -0,0 +1,40 @@
+"""
+Stubs and payloads shared by the benchmarks, so they can be run without the test suite.
+"""
+import typing
+
+#: DIDL-Lite item mixing escaped, numeric, undefined and unescaped references, as served by some media servers
+malformed_references = ('<DIDL-Lite xmlns:dc="http://purl.org/dc/elements/1.1/" '
+                        'xmlns:upnp="urn:schemas-upnp-org:metadata-1-0/upnp/" '
+                        'xmlns="urn:schemas-upnp-org:metadata-1-0/DIDL-Lite/">'
+                        """
+<item id="64$1$4" parentID="64$1" restricted="1">
+<dc:title>&quot;Heroes&quot; &#39;77 &#x2013; Bowie &amp; Eno & Friends &apos;Live&apos;</dc:title>
+<upnp:class>object.item.audioItem.musicTrack</upnp:class>
+</item></DIDL-Lite>""")
+
+
+class ContentDirectoryStub(object):
+    """
+    ContentDirectory service answering every Browse request with the same DIDL-Lite document.
+    """
+    service_type = 'urn:schemas-upnp-org:service:ContentDirectory:1'
+
+    def __init__(self, result: str):
+        self.result = result
+
+    async def async_call_action(self, action: str, **kwargs) -> typing.Dict[str, typing.Any]:
+        return {'Result': self.result}
+
+
+class MediaServerDeviceStub(object):
+    friendly_name = 'Benchmark MediaServer'
+    udn = 'uuid:5d1b6a4c-2f4e-4b8e-9c1a-b3e8f1d0a7c2'
+
+    def __init__(self, content_directory: ContentDirectoryStub):
+        self.content_directory = content_directory
+
+    def service(self, service_type):
+        if service_type == ContentDirectoryStub.service_type:
+            return self.content_directory
+        return None
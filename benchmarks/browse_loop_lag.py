@@ -0,0 +1,76 @@
+"""
+Benchmark of the event loop lag caused by parsing large Browse results.
+
+A ticker task measures how late it is woken up while a media server is browsed repeatedly,
+with inline parsing and with parsing offloaded to a thread or process pool (see `parse_pool`).
+
+Usage: python -m benchmarks.browse_loop_lag [--items N] [--browses B]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from upnpavcontrol.core import didllite
+from upnpavcontrol.core.mediaserver import MediaServer
+from upnpavcontrol.core.parse_pool import ParsePool
+from .corpus import create_document
+from ._support import ContentDirectoryStub, MediaServerDeviceStub
+
+_TICK = 0.001
+
+
+async def _ticker(lags, stop: asyncio.Event):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(_TICK)
+        lags.append(time.perf_counter() - start - _TICK)
+
+
+async def _run(pool: ParsePool, document: str, browses: int):
+    server = MediaServer(MediaServerDeviceStub(ContentDirectoryStub(document)), pool=pool)
+    lags = []
+    stop = asyncio.Event()
+    ticker = asyncio.ensure_future(_ticker(lags, stop))
+    await asyncio.sleep(_TICK)
+    start = time.perf_counter()
+    for _ in range(browses):
+        didllite.shared_cache.clear()
+        didl = await server.browse('0', use_cache=False)
+        for _ in didl.iter_records():
+            pass
+        # like a real request would, give other tasks a chance to run in between
+        await asyncio.sleep(_TICK)
+    elapsed = time.perf_counter() - start
+    # let the ticker record the lag caused by the last browse
+    await asyncio.sleep(2 * _TICK)
+    stop.set()
+    await ticker
+    return elapsed, lags
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=5000)
+    parser.add_argument('--browses', type=int, default=5)
+    args = parser.parse_args()
+
+    document = create_document(args.items)
+    variants = {
+        'inline': ParsePool(threshold=None),
+        'thread': ParsePool(threshold=0, executor_kind='thread'),
+        'process': ParsePool(threshold=0, executor_kind='process', max_workers=1),
+    }
+    print(f'{args.browses} browses of {args.items} items ({len(document) / 1e6:.1f} MB)')
+    print(f'{"":<10}{"total":>12}{"max lag":>12}{"p99 lag":>12}{"mean lag":>12}')
+    for name, pool in variants.items():
+        try:
+            elapsed, lags = asyncio.run(_run(pool, document, args.browses))
+        finally:
+            pool.shutdown()
+        p99 = statistics.quantiles(lags, n=100, method='inclusive')[-1]
+        print(f'{name:<10}{elapsed * 1000:9.0f} ms{max(lags) * 1000:9.1f} ms{p99 * 1000:9.1f} ms'
+              f'{statistics.mean(lags) * 1000:9.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Benchmark corpora: synthetic DIDL-Lite documents and LastChange events as well as captured payloads.
+
+The synthetic documents are shaped like the ones served by the fake media server of the BDD tests
+(`tests/bdd/fake_upnp/foo_media_server.py`).
+"""
+from xml.sax.saxutils import quoteattr
+import pathlib
+import typing
+
+SIZES = (10, 1000, 10000, 100000)
+
+CAPTURED_DIR = pathlib.Path(__file__).parent / 'corpus'
+
+_track_template = """<item id="/a/176/l/179/t/{i}" parentID="/a/176/l/179/t" restricted="1">
+<upnp:class>object.item.audioItem.musicTrack</upnp:class>
+<dc:title>Song Title {i}</dc:title>
+<dc:creator>Artist 2</dc:creator>
+<upnp:album>Album 1</upnp:album>
+<upnp:artist role="artist">Artist {i}</upnp:artist>
+<dc:contributor>Artist 1</dc:contributor>
+<upnp:originalTrackNumber>{i}</upnp:originalTrackNumber>
+<upnp:genre>Keine Stilrichtung</upnp:genre>
+<upnp:albumArtURI xmlns:dlna="urn:schemas-dlna-org:metadata-1-0/" dlna:profileID="JPEG_TN">http://192.168.178.21:9002/music/091ab74a/cover_160x160_m.jpg</upnp:albumArtURI>
+<upnp:albumArtURI>http://192.168.178.21:9002/music/091ab74a/cover</upnp:albumArtURI>
+<pv:modificationTime>1257616464</pv:modificationTime>
+<pv:addedTime>1544479558</pv:addedTime>
+<pv:lastUpdated>1544479558</pv:lastUpdated>
+<res protocolInfo="http-get:*:audio/mpeg:DLNA.ORG_PN=MP3;DLNA.ORG_OP=11" size="4265996" duration="0:04:26.520" bitrate="16000" sampleFrequency="44100">http://192.168.178.21:9002/music/{i}/download.mp3</res>
+</item>"""  # noqa: E501
+
+_container_template = """<container id="/a/{i}" parentID="/a" restricted="1" searchable="0">
+<upnp:class>object.container</upnp:class>
+<dc:title>Artist {i}</dc:title>
+<pv:lastUpdated>1544479558</pv:lastUpdated>
+</container>"""
+
+_document_template = """<DIDL-Lite xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:upnp="urn:schemas-upnp-org:metadata-1-0/upnp/" xmlns:pv="http://www.pv.com/pvns/" xmlns="urn:schemas-upnp-org:metadata-1-0/DIDL-Lite/">{items}</DIDL-Lite>"""  # noqa: E501
+
+_last_change_template = """<Event xmlns="urn:schemas-upnp-org:metadata-1-0/AVT/">
+<InstanceID val="0">
+<TransportState val="PLAYING" />
+<CurrentTrackDuration val="0:04:26.520" />
+<CurrentTrackMetaData val={metadata} />
+<CurrentTrackURI val="http://192.168.178.21:9002/music/{i}/download.mp3" />
+</InstanceID>
+</Event>"""
+
+_shapes = {'tracks': _track_template, 'containers': _container_template}
+
+SHAPES = tuple(_shapes)
+
+
+def create_document(count: int, shape: str = 'tracks') -> str:
+    """
+    A DIDL-Lite document with `count` items of the given shape.
+    """
+    template = _shapes[shape]
+    return _document_template.format(items=''.join(template.format(i=i) for i in range(count)))
+
+
+def create_last_change_events(count: int) -> typing.List[str]:
+    """
+    AVTransport LastChange events, each one for a different track so no metadata is parsed twice.
+    """
+    events = []
+    for i in range(count):
+        metadata = _document_template.format(items=_track_template.format(i=i))
+        events.append(_last_change_template.format(i=i, metadata=quoteattr(metadata)))
+    return events
+
+
+def load_captured(directory: pathlib.Path = CAPTURED_DIR) -> typing.Dict[str, typing.Tuple[str, str]]:
+    """
+    All captured payloads, keyed by name, as tuple of kind (`didl` or `lastchange`) and payload.
+    """
+    captured = {}
+    for path in sorted(directory.glob('*.xml')):
+        name, kind, _ = path.name.rsplit('.', 2)
+        captured[name] = (kind, path.read_text(encoding='utf-8'))
+    return captured
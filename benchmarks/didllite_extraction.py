@@ -0,0 +1,48 @@
+"""
+Microbenchmark comparing DIDL object field extraction via `DictAdapter`/`from_orm`
+with the precompiled single pass extraction plans, both validated into pydantic
+models and as validation free `DidlRecord` instances.
+
+Usage: python -m benchmarks.didllite_extraction [--items N] [--repeat R]
+"""
+import argparse
+import timeit
+import defusedxml.ElementTree as etree
+from upnpavcontrol.core import didllite
+from .corpus import create_document
+
+
+def _extract_with_dict_adapter(elements):
+    for element in elements:
+        didllite.MusicTrack.from_orm(element)
+
+
+def _extract_with_plan(elements):
+    plan = didllite._extraction_plans[didllite.MusicTrack]
+    for element in elements:
+        didllite.MusicTrack.parse_obj(plan.extract(element))
+
+
+def _extract_records(elements):
+    plan = didllite._extraction_plans[didllite.MusicTrack]
+    record_class = didllite._record_classes[didllite.MusicTrack]
+    for element in elements:
+        record_class.from_extracted(plan.extract(element))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    elements = list(etree.fromstring(create_document(args.items)))
+    variants = (('DictAdapter', _extract_with_dict_adapter), ('ExtractionPlan', _extract_with_plan),
+                ('DidlRecord', _extract_records))
+    for name, f in variants:
+        best = min(timeit.repeat(lambda: f(elements), number=1, repeat=args.repeat))
+        print(f'{name:>16}: {best * 1000:8.2f} ms total, {best / args.items * 1e6:6.2f} us/item')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+"""
+Benchmark suite for DIDL-Lite parsing, Browse post-processing and LastChange event handling.
+
+Runs every case on the synthetic corpus (see `benchmarks/corpus.py`) and on all captured payloads found
+in `benchmarks/corpus/`. For each case it reports
+
+* the best wall clock time out of several runs, and the resulting throughput in items and MB per second,
+* the peak memory allocated while running the case, as traced by tracemalloc,
+* the number of memory blocks per item still allocated for the result of the case.
+
+Results are written as JSON, so a run can be compared against a stored baseline:
+
+    python -m benchmarks.didllite_suite --output baseline.json
+    python -m benchmarks.didllite_suite --baseline baseline.json --max-regression 0.2
+
+Usage: python -m benchmarks.didllite_suite [--sizes 10,1000] [--cases FILTER] [--repeat R]
+                                           [--output FILE] [--baseline FILE] [--max-regression X]
+"""
+import argparse
+import asyncio
+import gc
+import json
+import platform
+import sys
+import timeit
+import tracemalloc
+import typing
+from dataclasses import dataclass, asdict
+from upnpavcontrol.core import didllite, xml_backend
+from upnpavcontrol.core.mediarenderer import PlaybackInfo, update_playback_info_from_event
+from upnpavcontrol.core.mediaserver import MediaServer
+from . import corpus
+from ._support import ContentDirectoryStub, MediaServerDeviceStub
+
+# stop repeating a case once it consumed this many seconds
+_TIME_BUDGET = 10.0
+
+
+@dataclass
+class Case:
+    name: str
+    items: int
+    size: int
+    run: typing.Callable[[], typing.Any]
+
+
+@dataclass
+class Result:
+    items: int
+    bytes: int
+    runs: int
+    best_seconds: float
+    items_per_second: float
+    mb_per_second: float
+    peak_memory_bytes: int
+    allocated_blocks_per_item: float
+
+
+def _parse_models(xmldata):
+    return didllite.from_xml_string(xmldata)
+
+
+def _parse_records(xmldata):
+    return didllite.records_from_xml_string(xmldata)
+
+
+def _browse(xmldata):
+    # what the library API does with a Browse result, without any cached documents
+    didllite.shared_cache.clear()
+    server = MediaServer(MediaServerDeviceStub(ContentDirectoryStub(xmldata)))
+    didl = asyncio.run(server.browse('0'))
+    return list(didl.iter_records())
+
+
+def _last_change(events):
+    didllite.shared_cache.clear()
+    infos = []
+    for event in events:
+        info = PlaybackInfo()
+        update_playback_info_from_event(info, event)
+        infos.append(info)
+    return infos
+
+
+def _document_cases(name: str, xmldata: str, items: int):
+    size = len(xmldata.encode('utf-8'))
+    yield Case(f'from_xml_string/{name}', items, size, lambda: _parse_models(xmldata))
+    yield Case(f'records/{name}', items, size, lambda: _parse_records(xmldata))
+    yield Case(f'browse/{name}', items, size, lambda: _browse(xmldata))
+
+
+def _event_case(name: str, events: typing.List[str]):
+    size = sum(len(event.encode('utf-8')) for event in events)
+    return Case(f'last_change/{name}', len(events), size, lambda: _last_change(events))
+
+
+def create_cases(sizes: typing.Sequence[int]) -> typing.Iterator[Case]:
+    for shape in corpus.SHAPES:
+        for count in sizes:
+            yield from _document_cases(f'{shape}-{count}', corpus.create_document(count, shape), count)
+    for count in sizes:
+        # a renderer sends one event per track change, anything beyond a few thousand is pointless
+        if count <= 10000:
+            yield _event_case(f'events-{count}', corpus.create_last_change_events(count))
+    for name, (kind, payload) in corpus.load_captured().items():
+        if kind == 'didl':
+            yield from _document_cases(f'captured-{name}', payload, len(didllite.DidlLite(payload).objects))
+        elif kind == 'lastchange':
+            yield _event_case(f'captured-{name}', [payload])
+
+
+def _measure_time(case: Case, repeat: int):
+    # small cases are run in loops, so each sample takes at least 0.2 seconds
+    timer = timeit.Timer(case.run)
+    number, elapsed = timer.autorange()
+    timings = [elapsed / number]
+    while len(timings) < repeat and sum(timings) * number < _TIME_BUDGET:
+        timings.append(timer.timeit(number) / number)
+    return min(timings), len(timings) * number
+
+
+def _measure_memory(case: Case):
+    gc.collect()
+    blocks_before = sys.getallocatedblocks()
+    tracemalloc.start()
+    try:
+        result = case.run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    gc.collect()
+    blocks = sys.getallocatedblocks() - blocks_before
+    del result
+    return peak, blocks
+
+
+def run_case(case: Case, repeat: int) -> Result:
+    best, runs = _measure_time(case, repeat)
+    peak, blocks = _measure_memory(case)
+    return Result(items=case.items,
+                  bytes=case.size,
+                  runs=runs,
+                  best_seconds=best,
+                  items_per_second=case.items / best,
+                  mb_per_second=case.size / best / 1e6,
+                  peak_memory_bytes=peak,
+                  allocated_blocks_per_item=blocks / max(case.items, 1))
+
+
+def compare(results: typing.Mapping[str, typing.Mapping[str, typing.Any]],
+            baseline: typing.Mapping[str, typing.Mapping[str, typing.Any]], max_regression: float):
+    """
+    Print time and memory ratios against the baseline, return the names of all cases that regressed.
+    """
+    regressions = []
+    print(f'{"case":<48}{"time":>10}{"peak memory":>14}')
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            print(f'{name:<48}{"new":>10}')
+            continue
+        time_ratio = result['best_seconds'] / reference['best_seconds']
+        memory_ratio = result['peak_memory_bytes'] / max(reference['peak_memory_bytes'], 1)
+        regressed = time_ratio > 1 + max_regression or memory_ratio > 1 + max_regression
+        marker = '  REGRESSION' if regressed else ''
+        print(f'{name:<48}{time_ratio:>9.2f}x{memory_ratio:>13.2f}x{marker}')
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default=','.join(str(size) for size in corpus.SIZES))
+    parser.add_argument('--cases', default='', help='only run cases containing this string')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='write results as JSON to this file instead of stdout')
+    parser.add_argument('--baseline', help='JSON results of a previous run to compare with')
+    parser.add_argument('--max-regression', type=float, default=0.2)
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    results = {}
+    for case in create_cases(sizes):
+        if args.cases not in case.name:
+            continue
+        result = run_case(case, args.repeat)
+        print(f'{case.name:<48}{result.best_seconds * 1000:10.2f} ms {result.items_per_second:12.0f} items/s '
+              f'{result.peak_memory_bytes / 1e6:10.2f} MB peak',
+              file=sys.stderr)
+        results[case.name] = asdict(result)
+
+    report = {
+        'python': platform.python_version(),
+        'xml_backend': xml_backend.active_backend().name,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline['results'], args.max_regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
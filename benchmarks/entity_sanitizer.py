@@ -0,0 +1,41 @@
+"""
+Benchmark of the entity sanitizer applied to Browse results, compared to the former per call regex.
+
+Usage: python -m benchmarks.entity_sanitizer [--repeat R]
+"""
+import argparse
+import re
+import timeit
+from upnpavcontrol.core.xml_sanitizer import sanitize_entities, iter_sanitized
+from .corpus import create_document
+from ._support import malformed_references
+
+
+def _previous_sanitizer(text):
+    regex = re.compile(r"&(?!amp;|lt;|gt;)")
+    return regex.sub("&amp;", text)
+
+
+def _chunked(text, size=64 * 1024):
+    return ''.join(iter_sanitized(text[i:i + size] for i in range(0, len(text), size)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    documents = {
+        'valid, 5000 items': create_document(5000),
+        'valid with &amp;, 5000 items': create_document(5000).replace('Title', 'Title &amp; more'),
+        'malformed, 5000 items': malformed_references * 5000,
+    }
+    variants = {'previous regex': _previous_sanitizer, 'sanitize_entities': sanitize_entities, 'chunked': _chunked}
+    print(f'{"":<32}' + ''.join(f'{name:>20}' for name in variants))
+    for name, document in documents.items():
+        timings = [min(timeit.repeat(lambda: f(document), number=1, repeat=args.repeat)) for f in variants.values()]
+        print(f'{name:<32}' + ''.join(f'{t * 1000:17.2f} ms' for t in timings))
+
+
+if __name__ == '__main__':
+    main()
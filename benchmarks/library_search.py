@@ -0,0 +1,100 @@
+"""
+Benchmark of the library search on a synthetic index.
+
+Fills a `LibraryIndex` with artists, albums and tracks made up of random words and measures the latency of
+searches for frequent and rare terms, prefixes and short terms not covered by the trigram index.
+
+Usage: python -m benchmarks.library_search [--objects N] [--repeat R] [--database PATH]
+"""
+import argparse
+import random
+import statistics
+import time
+import types
+from upnpavcontrol.core.library_index import LibraryIndex
+
+_WORDS = ('love night day heart fire rain blue dream light time world road home sun moon star river city '
+          'ocean summer winter gold silver black white wild golden broken lost young free shadow dance song '
+          'angel devil storm thunder morning evening paradise highway memory echo island mountain garden').split()
+
+_GENRES = ('Rock', 'Pop', 'Jazz', 'Classical', 'Electronic', 'Hip-Hop', 'Folk', 'Blues', 'Metal', 'Soundtrack')
+
+_UDN = 'benchmark-server'
+
+
+def _phrase(rng: random.Random, words: int) -> str:
+    return ' '.join(rng.choice(_WORDS).capitalize() for _ in range(words))
+
+
+def _record(**values):
+    # stands in for a DIDL-Lite record, parsing 500k objects would dominate the benchmark
+    return types.SimpleNamespace(res=[], **values)
+
+
+def _records(count: int, seed: int = 1):
+    rng = random.Random(seed)
+    artists = [f'{_phrase(rng, 2)} {i}' for i in range(max(1, count // 200))]
+    emitted = 0
+    album_number = 0
+    while emitted < count:
+        album_number += 1
+        album_id = f'album{album_number}'
+        artist = rng.choice(artists)
+        album = _phrase(rng, rng.randint(1, 3))
+        genre = rng.choice(_GENRES)
+        date = f'{rng.randint(1950, 2023)}-01-01'
+        yield _record(id=album_id, parentID='0', upnpclass='object.container.album.musicAlbum', title=album,
+                      artist=artist, genre=genre)
+        for track in range(1, 13):
+            yield _record(id=f'{album_id}${track}',
+                          parentID=album_id,
+                          upnpclass='object.item.audioItem.musicTrack',
+                          title=_phrase(rng, rng.randint(1, 4)),
+                          artist=artist,
+                          album=album,
+                          genre=genre,
+                          date=date,
+                          originalTrackNumber=str(track))
+        emitted += 13
+
+
+def _fill(index: LibraryIndex, count: int, batch: int = 5000):
+    records = []
+    position = 0
+    for record in _records(count):
+        records.append(record)
+        if len(records) == batch:
+            index.store(_UDN, records, starting_index=position)
+            position += len(records)
+            records = []
+    index.store(_UDN, records, starting_index=position)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--objects', type=int, default=500000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--database', default=':memory:')
+    args = parser.parse_args()
+
+    index = LibraryIndex(args.database)
+    if index.count() == 0:
+        start = time.perf_counter()
+        _fill(index, args.objects)
+        print(f'indexed {index.count()} objects in {time.perf_counter() - start:.1f} s')
+    print(f'trigram index: {index.search_enabled}')
+    queries = ['love', 'lov', 'paradise highway', 'Thunder Isl', 'ght', 'ocean 12', 'xyz', 'su']
+    print(f'{"":<24}{"results":>10}{"median":>12}{"max":>12}')
+    for query in queries:
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            results = index.search(query, limit=50)
+            timings.append(time.perf_counter() - start)
+        print(f'{query!r:<24}{len(results):>10}{statistics.median(timings) * 1000:9.1f} ms'
+              f'{max(timings) * 1000:9.1f} ms')
+    index.close()
+
+
+if __name__ == '__main__':
+    main()
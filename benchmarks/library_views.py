@@ -0,0 +1,59 @@
+"""
+Benchmark of the library views by artist, album, genre and decade on a synthetic index.
+
+Measures the latency of the first page of each view, of a page deep into the view using keyset paging
+(`after`) and, for comparison, using an offset.
+
+Usage: python -m benchmarks.library_views [--objects N] [--repeat R] [--database PATH]
+"""
+import argparse
+import statistics
+import time
+from upnpavcontrol.core.library_index import LibraryIndex
+from upnpavcontrol.core.library_views import LibraryViews
+from .library_search import _fill
+
+_PAGE = 50
+
+
+def _measure(call, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = call()
+        timings.append(time.perf_counter() - start)
+    return result, statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--objects', type=int, default=500000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--database', default=':memory:')
+    args = parser.parse_args()
+
+    index = LibraryIndex(args.database)
+    if index.count() == 0:
+        start = time.perf_counter()
+        _fill(index, args.objects)
+        print(f'indexed {index.count()} objects in {time.perf_counter() - start:.1f} s')
+    views = LibraryViews(index)
+    first_album = views.children('albums', limit=1)[0]
+    first_artist = views.children('artists', limit=1)[0]
+    containers = ['0', 'artists', 'albums', 'genres', 'decades', 'genre:Rock', 'decade:1990', first_artist.id,
+                  first_album.id]
+    print(f'{"":<40}{"first page":>12}{"keyset":>12}{"offset":>12}')
+    for view_id in containers:
+        page, first = _measure(lambda: views.children(view_id, limit=_PAGE), args.repeat)
+        # page 100, or the last page of short views
+        deep = views.children(view_id, limit=100 * _PAGE)
+        offset = max(0, len(deep) - _PAGE)
+        after = deep[offset - 1] if offset else None
+        _, keyset = _measure(lambda: views.children(view_id, after=after, limit=_PAGE), args.repeat)
+        _, offset_time = _measure(lambda: views.children(view_id, offset=offset, limit=_PAGE), args.repeat)
+        print(f'{view_id[:38]:<40}{first * 1000:9.2f} ms{keyset * 1000:9.2f} ms{offset_time * 1000:9.2f} ms')
+    index.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""
+Benchmark comparing the available XML backends on Browse results and LastChange events.
+
+Usage: python -m benchmarks.xml_backend [--repeat R]
+"""
+import argparse
+import timeit
+from upnpavcontrol.core import didllite, xml_backend
+from upnpavcontrol.core.mediarenderer import PlaybackInfo, update_playback_info_from_event
+from .corpus import create_document, load_captured
+
+
+_, _last_change_event = load_captured()['avtransport_track_metadata']
+
+
+def _parse_last_change():
+    # bypass the metadata cache, otherwise only the first event would actually be parsed
+    didllite.shared_cache.clear()
+    update_playback_info_from_event(PlaybackInfo(), _last_change_event)
+
+
+def _benchmarks():
+    for count in (100, 1000, 5000):
+        document = create_document(count)
+        yield f'Browse {count} items (models)', 1, lambda: didllite.from_xml_string(document)
+        yield f'Browse {count} items (records)', 1, lambda: didllite.records_from_xml_string(document)
+    yield 'LastChange x100', 100, _parse_last_change
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    backends = xml_backend.available_backends()
+    if 'lxml' not in backends:
+        print('lxml is not installed, only the defusedxml backend will be measured')
+    print(f'{"":<32}' + ''.join(f'{name:>14}' for name in backends))
+    for name, number, f in _benchmarks():
+        timings = []
+        for backend in backends:
+            xml_backend.use_backend(backend)
+            timings.append(min(timeit.repeat(f, number=number, repeat=args.repeat)))
+        print(f'{name:<32}' + ''.join(f'{t * 1000:11.2f} ms' for t in timings))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,6 @@
 from upnpavcontrol.core import AVControlPoint
 from upnpavcontrol.core.notification_backend import NotificationBackend
+from upnpavcontrol.core.settings import ControlPointSettings
 from upnpavcontrol.core.discovery.events import DiscoveryEvent, DiscoveryEventType
 from ..testsupport import UpnpTestRequester, NotificationTestEndpoint
 from async_upnp_client.client import UpnpDevice
@@ -37,7 +38,9 @@ class TestContext(object):
 
         self.control_point = AVControlPoint(device_discovery_events=self._discovery_events,
                                             notifcation_backend=notification_backend,
-                                            device_factory=device_factory)
+                                            device_factory=device_factory,
+                                            # prefetching would make the browse cache statistics unpredictable
+                                            settings=ControlPointSettings(prefetch_budget=0))
         self.webclient: typing.Optional[TestClient] = None
 
     def get_device(self, name: str):
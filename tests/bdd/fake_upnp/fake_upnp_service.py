@@ -29,6 +29,14 @@ def _format_last_change_notification(value: str):
     return ET.tostring(root).decode('utf-8')
 
 
+def _format_property_notification(variables: typing.Mapping[str, typing.Any]):
+    root = ET.Element('{urn:schemas-upnp-org:event-1-0}propertyset')
+    for key, value in variables.items():
+        prop = ET.SubElement(root, '{urn:schemas-upnp-org:event-1-0}property')
+        ET.SubElement(prop, key).text = str(value)
+    return ET.tostring(root).decode('utf-8')
+
+
 def _format_last_change_payload(instance_xml_namespace: str, variables: typing.Mapping[str, typing.Any]):
     lcroot = ET.Element('{urn:schemas-upnp-org:metadata-1-0/upnp/}Event')
     instance = ET.SubElement(lcroot, instance_xml_namespace + 'InstanceID')
@@ -102,10 +110,15 @@ class UpnpServiceMock(object):
         return 200, headers, ''
 
     async def trigger_notification(self, instance_xml_namespace, variables):
+        last_change_value = _format_last_change_payload(instance_xml_namespace, variables)
+        await self._send_notification(_format_last_change_notification(last_change_value))
+
+    async def trigger_property_notification(self, variables: typing.Mapping[str, typing.Any]):
+        await self._send_notification(_format_property_notification(variables))
+
+    async def _send_notification(self, body: str):
         path = self._event_endpoint.callback_url
         host = urlparse(path).netloc
-        last_change_value = _format_last_change_payload(instance_xml_namespace, variables)
-        body = _format_last_change_notification(last_change_value)
         for sid in self._event_subscritions:
             headers = {
                 'host': host,
@@ -120,10 +133,10 @@ class UpnpServiceMock(object):
         self._seq = self._seq + 1
 
     def notify_changed_state_variables(self, changed):
-        if 'LastChange' in changed and self.on_event:
-            var = FakeUpnpVariable('LastChange', value=changed['LastChange'])
+        if changed and self.on_event:
+            variables = [FakeUpnpVariable(name, value=value) for name, value in changed.items()]
             # pylint: disable=not-callable
-            self.on_event(self, [var])
+            self.on_event(self, variables)
 
     def handle_event_unsubscription_request(self, headers, body=None):
         sid = headers['SID']
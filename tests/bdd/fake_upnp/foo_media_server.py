@@ -118,6 +118,7 @@ class FakeContentDirectoryService(UpnpServiceMock):
     def __init__(self, device):
         super().__init__(service_type="urn:schemas-upnp-org:service:ContentDirectory:1", device=device)
         self.add_async_action('Browse', self._browse)
+        self.system_update_id = 1
 
     async def _browse(self, ObjectID, BrowseFlag, StartingIndex, RequestedCount, SortCriteria, Filter):
         if BrowseFlag == 'BrowseMetadata':
@@ -137,6 +138,13 @@ class FakeContentDirectoryService(UpnpServiceMock):
         else:
             return {'Result': didl_musictrack, 'NumberReturned': 1, 'TotalMatches': 1, 'UpdateID': 1}
 
+    async def announce_container_update(self, container_id: str):
+        self.system_update_id += 1
+        await self.trigger_property_notification({
+            'SystemUpdateID': self.system_update_id,
+            'ContainerUpdateIDs': f'{container_id},{self.system_update_id}'
+        })
+
     def get_metadata(self, ObjectID):
         for item in fakeMusicDidl:
             if item.id == ObjectID:
@@ -42,3 +42,21 @@ Feature: Library API
       | 0          | 5        | 0             | 4            |
       | 3          | 3        | 9             | 11           |
       | 3          | 5        | 15            | 19           |
+
+  Scenario: Browse results are cached
+    Given a device FooMediaServer already present on the network
+    When the client requests the contents of the root element
+    And the client requests the contents of item Foo MediaServer
+    And the client requests the contents of the same item again
+    And the client requests the contents of the same item bypassing the cache
+    And the client requests the browse cache statistics of Foo MediaServer
+    Then the browse cache statistics will report 1 hit and 1 bypass
+
+  Scenario: Library changes invalidate cached browse results
+    Given a device FooMediaServer already present on the network
+    When the client requests the contents of the root element
+    And the client requests the contents of item Foo MediaServer
+    And the client requests the contents of item Music
+    And FooMediaServer announces a change of container /music
+    And the client requests the browse cache statistics of Foo MediaServer
+    Then the browse cache statistics will report 1 invalidation
@@ -15,6 +15,18 @@ Feature: Playback
       | 0/1/1   | FooMediaServer |
 
 
+  Scenario: Enqueue all items of a container
+    Given a device AcmeRenderer already present on the network
+    And a device FooMediaServer already present on the network
+    And a client subscribed to playback notifications from AcmeRenderer
+    And the playback queue for AcmeRenderer is empty
+    When the client adds container with id /music from FooMediaServer to AcmeRenderer playback queue
+    Then the playback queue of AcmeRenderer contains the following items:
+      | item id             | dms            |
+      | /a/176/l/179/t/2836 | FooMediaServer |
+      | /x                  | FooMediaServer |
+
+
   Scenario: Enqueue files and start playback
     Given a device AcmeRenderer already present on the network
     And a device FooMediaServer already present on the network
@@ -32,9 +32,33 @@ async def the_client_requests_children_of_item(test_context, webclient, item_nam
     item = find_item_with_title(response_json, item_name)
     item_id = item['id']
     uri = f'/api/library/{item_id}'
+    test_context.last_item_id = item_id
     test_context.last_response = await webclient.get(uri)
 
 
+@when('the client requests the contents of the same item again')
+@sync
+async def the_client_requests_same_item_again(test_context, webclient):
+    test_context.last_response = await webclient.get(f'/api/library/{test_context.last_item_id}')
+    assert test_context.last_response.status_code == 200
+
+
+@when('the client requests the contents of the same item bypassing the cache')
+@sync
+async def the_client_requests_same_item_bypassing_cache(test_context, webclient):
+    test_context.last_response = await webclient.get(f'/api/library/{test_context.last_item_id}',
+                                                     query_string={'bypass_cache': 'true'})
+    assert test_context.last_response.status_code == 200
+
+
+@when(parsers.cfparse('the client requests the browse cache statistics of {server_name}'))
+@sync
+async def the_client_requests_browse_cache_statistics(test_context, webclient, server_name):
+    response = await webclient.get('/api/library/')
+    item = find_item_with_title(response.json(), server_name)
+    test_context.last_response = await webclient.get(f'/api/library/{item["id"]}/cache')
+
+
 @when(parsers.cfparse('the client requests the metadata of item {item_name}'))
 @sync
 async def the_client_requests_metadata_of_item(test_context, webclient, item_name):
@@ -74,6 +98,29 @@ def the_response_will_contain_elements_from_index_first_element_to_index_last_el
         assert received_item['title'] == expected_item.title
 
 
+@when(parsers.parse('{server_name} announces a change of container {container_id}'))
+@sync
+async def server_announces_container_change(test_context, server_name, container_id):
+    device = test_context.get_device(server_name)
+    content_directory = device.service('urn:schemas-upnp-org:service:ContentDirectory:1')
+    await content_directory.announce_container_update(container_id)
+
+
+@then(parsers.parse('the browse cache statistics will report {invalidations:d} invalidation'))
+def the_browse_cache_statistics_will_report_invalidations(test_context, invalidations):
+    assert test_context.last_response.status_code == 200
+    assert test_context.last_response.json()['invalidations'] == invalidations
+
+
+@then(parsers.parse('the browse cache statistics will report {hits:d} hit and {bypasses:d} bypass'))
+def the_browse_cache_statistics_will_report(test_context, hits, bypasses):
+    assert test_context.last_response.status_code == 200
+    statistics = test_context.last_response.json()
+    assert statistics['hits'] == hits
+    assert statistics['bypasses'] == bypasses
+    assert statistics['entries'] == 1
+
+
 @then('the response will contain FooMediaServer as an entry')
 def the_response_will_contain_foomediaserver(test_context):
     assert test_context.last_response.status_code == 200
@@ -1,7 +1,9 @@
 from pytest_bdd import scenarios, when, then, parsers, given
 from .async_utils import sync
+import asyncio
 import logging
 from .common_steps import *  # noqa: F401, F403
+from upnpavcontrol.core.mediarenderer import TransportState
 from upnpavcontrol.web.api.library import create_library_item_id
 
 _logger = logging.getLogger(__name__)
@@ -24,6 +26,23 @@ async def _wait_for_playback_state_notification(event_bus_connection, state):
     assert info['transport'] == state
 
 
+async def _wait_for_renderer_playing(test_context, dmr):
+    # The next queue item is played by the control point in the background. Don't rely on lookups of this step
+    # taking longer than that, they may share the requests of the control point still in flight.
+    renderer = test_context.control_point.get_mediarenderer_by_UDN(test_context.get_device(dmr).udn)
+    playing = asyncio.get_running_loop().create_future()
+
+    async def on_playback_info(info):
+        if info.transport == TransportState.PLAYING and not playing.done():
+            playing.set_result(True)
+
+    subscription = await renderer.subscribe_notifcations(on_playback_info)
+    try:
+        await asyncio.wait_for(playing, 5)
+    finally:
+        await subscription.unsubscribe()
+
+
 @given('the playback queue for AcmeRenderer is empty')
 @sync
 async def clear_playback_queue(test_context):
@@ -63,6 +82,16 @@ async def enqueue_on_dmr(test_context, object_id, dms, dmr, webclient):
     assert response.status_code == 201
 
 
+@when(parsers.cfparse('the client adds container with id {object_id} from {dms} to {dmr} playback queue'))
+@sync
+async def enqueue_container_on_dmr(test_context, object_id, dms, dmr, webclient):
+    dmr_udn = test_context.get_device(dmr).udn
+    dms_udn = test_context.get_device(dms).udn
+    payload = {'id': create_library_item_id(dms_udn, object_id)}
+    response = await webclient.post(f'/api/player/{dmr_udn}/queue/container', json=payload)
+    assert response.status_code == 202
+
+
 @when(parsers.cfparse('the client replaces the content of the queue of AcmeRenderer with the following items:\n{table}')
       )
 @sync
@@ -133,6 +162,7 @@ async def check_playback_state_with_api(test_context, dmr, state, webclient):
 @then(parsers.cfparse('the device {dmr} is playing item {object_id} from {dms}'))
 @sync
 async def check_renderer_is_playing_object(test_context, dmr, object_id, dms):
+    await _wait_for_renderer_playing(test_context, dmr)
     dms_device = test_context.get_device(dms)
     server = test_context.control_point.get_mediaserver_by_UDN(dms_device.udn)
     didl = await server.browse_metadata(object_id)
@@ -1,5 +1,8 @@
 from .asyncmock_stub import AsyncMock
 from .upnp_test_requester import UpnpTestRequester
 from .notification_test_endpoint import NotificationTestEndpoint
+from .content_directory_stub import ContentDirectoryStub, MediaServerDeviceStub
 
-__all__ = ['AsyncMock', 'UpnpTestRequester', 'NotificationTestEndpoint']
+__all__ = [
+    'AsyncMock', 'UpnpTestRequester', 'NotificationTestEndpoint', 'ContentDirectoryStub', 'MediaServerDeviceStub'
+]
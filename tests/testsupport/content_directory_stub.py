@@ -0,0 +1,38 @@
+import typing
+
+
+class ContentDirectoryStub(object):
+    """
+    Minimal ContentDirectory service, answering Browse requests with preconfigured results.
+
+    The Result is looked up by ObjectID in `results`, falling back to `default_result`.
+    All calls are recorded in `calls`.
+    """
+    service_type = 'urn:schemas-upnp-org:service:ContentDirectory:1'
+
+    def __init__(self, default_result: str = '', update_id: typing.Optional[int] = None):
+        self.default_result = default_result
+        self.results: typing.Dict[str, str] = {}
+        self.update_id = update_id
+        self.calls: typing.List[typing.Tuple[str, typing.Dict[str, typing.Any]]] = []
+
+    async def async_call_action(self, action: str, **kwargs):
+        self.calls.append((action, kwargs))
+        result = self.results.get(kwargs.get('ObjectID'), self.default_result)
+        payload = {'Result': result}
+        if self.update_id is not None:
+            payload['UpdateID'] = self.update_id
+        return payload
+
+
+class MediaServerDeviceStub(object):
+    friendly_name = 'Stub MediaServer'
+    udn = 'uuid:c9d4d2ea-1a47-4e34-9ff3-5e7e7d1b2c4a'
+
+    def __init__(self, content_directory: ContentDirectoryStub):
+        self.content_directory = content_directory
+
+    def service(self, service_type):
+        if service_type == ContentDirectoryStub.service_type:
+            return self.content_directory
+        return None
@@ -32,6 +32,9 @@ class _UpnpServiceMock(object):
     def action(self, name):
         return self._actions[name]
 
+    async def async_call_action(self, name, **kwargs):
+        return await self.action(name).async_call(**kwargs)
+
     def add_action_mock(self, name, *args, **kwargs):
         self._actions[name] = _AsyncActionMock(*args, name=name, **kwargs)
 
@@ -0,0 +1,37 @@
+# DIDL-Lite documents with the kind of broken escaping observed with various media servers,
+# reduced to the relevant parts.
+
+header = ('<DIDL-Lite xmlns:dc="http://purl.org/dc/elements/1.1/" '
+          'xmlns:upnp="urn:schemas-upnp-org:metadata-1-0/upnp/" '
+          'xmlns="urn:schemas-upnp-org:metadata-1-0/DIDL-Lite/">')
+
+# unescaped ampersands in titles and in resource URLs with query strings
+unescaped_ampersands = header + """
+<item id="64$1$3" parentID="64$1" restricted="1">
+<dc:title>Bridge Over Troubled Water & Other Songs</dc:title>
+<upnp:artist>Simon & Garfunkel</upnp:artist>
+<upnp:class>object.item.audioItem.musicTrack</upnp:class>
+<upnp:albumArtURI>http://192.168.1.10:9000/art?id=12&size=300</upnp:albumArtURI>
+<res protocolInfo="http-get:*:audio/flac:*">http://192.168.1.10:9000/stream?id=12&format=flac&seek=0</res>
+</item></DIDL-Lite>"""
+
+# properly escaped and character references next to broken ones, the former must be kept as they are
+mixed_references = header + """
+<item id="64$1$4" parentID="64$1" restricted="1">
+<dc:title>&quot;Heroes&quot; &#39;77 &#x2013; Bowie &amp; Eno & Friends &apos;Live&apos;</dc:title>
+<upnp:class>object.item.audioItem.musicTrack</upnp:class>
+</item></DIDL-Lite>"""
+
+# HTML entities aren't defined in XML
+html_entities = header + """
+<item id="64$1$5" parentID="64$1" restricted="1">
+<dc:title>Caf&eacute;&nbsp;del Mar</dc:title>
+<upnp:class>object.item.audioItem.musicTrack</upnp:class>
+</item></DIDL-Lite>"""
+
+# dangling ampersand at the end of a text, immediately followed by markup
+dangling_ampersand = header + """
+<container id="64$2" parentID="64" restricted="1">
+<dc:title>Rock &</dc:title>
+<upnp:class>object.container.album.musicAlbum</upnp:class>
+</container></DIDL-Lite>"""
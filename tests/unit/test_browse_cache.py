@@ -0,0 +1,143 @@
+from upnpavcontrol.core.browse_cache import BrowseCache
+from upnpavcontrol.core.mediaserver import MediaServer, BrowseFlags
+from .test_didllite import didl1, didl_musictrack
+from ..testsupport import ContentDirectoryStub, MediaServerDeviceStub
+import pytest
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _children_key(object_id, start=0, count=0):
+    return (object_id, 'BrowseDirectChildren', start, count, '*', '')
+
+
+def _metadata_key(object_id):
+    return (object_id, 'BrowseMetadata', 0, 0, '*', '')
+
+
+def test_browse_cache_get_put():
+    cache = BrowseCache()
+    assert cache.get(_children_key('0')) is None
+    cache.put(_children_key('0'), 'result', 10)
+    assert cache.get(_children_key('0')) == 'result'
+    assert cache.get(_children_key('0', 0, 5)) is None
+    stats = cache.statistics
+    assert (stats.hits, stats.misses, stats.entries, stats.size) == (1, 2, 1, 10)
+
+
+def test_browse_cache_entries_expire():
+    clock = FakeClock()
+    cache = BrowseCache(ttl=10, clock=clock)
+    cache.put(_children_key('0'), 'result', 10)
+    clock.now = 9.9
+    assert cache.get(_children_key('0')) == 'result'
+    clock.now = 10
+    assert cache.get(_children_key('0')) is None
+    assert cache.statistics.expirations == 1
+    assert len(cache) == 0
+
+
+def test_browse_cache_retains_expired_entries_as_stale():
+    clock = FakeClock()
+    cache = BrowseCache(ttl=10, max_stale=100, clock=clock)
+    cache.put(_children_key('A'), 'A', 1, update_id=1, containers=['A'])
+    cache.put(_children_key('B'), 'B', 1, containers=['B'])
+    assert cache.get_stale(_children_key('A')) == 'A'
+    clock.now = 50
+    assert cache.get(_children_key('A')) is None
+    assert cache.get_stale(_children_key('A')) == 'A'
+    # outdated results are not served, not even as stale ones
+    cache.invalidate_container('A', 2)
+    assert cache.get_stale(_children_key('A')) is None
+    clock.now = 110
+    assert cache.get_stale(_children_key('B')) is None
+    assert cache.get(_children_key('B')) is None
+    stats = cache.statistics
+    assert (stats.stale_hits, stats.expirations, stats.entries) == (2, 1, 0)
+
+
+def test_browse_cache_is_bounded():
+    cache = BrowseCache(max_entries=2, max_size=100)
+    for i in range(3):
+        cache.put(_children_key(str(i)), i, 10)
+    assert cache.get(_children_key('0')) is None
+    cache.put(_children_key('big'), 'big', 95)
+    assert len(cache) == 1
+    assert cache.statistics.evictions == 3
+
+
+def test_browse_cache_invalidate_container():
+    cache = BrowseCache()
+    cache.put(_children_key('A', 0, 10), 'A page 1', 1, update_id=1, containers=['A'])
+    cache.put(_children_key('A', 10, 10), 'A page 2', 1, update_id=1, containers=['A'])
+    cache.put(_metadata_key('A/1'), 'A/1', 1, containers=['A/1', 'A'])
+    cache.put(_metadata_key('A'), 'A', 1, update_id=1, containers=['A', 'root'])
+    cache.put(_children_key('B'), 'B', 1, update_id=1, containers=['B'])
+
+    # already known state of A
+    assert cache.invalidate_container('A', update_id=1) == 1
+    assert cache.get(_metadata_key('A/1')) is None
+    assert cache.get(_children_key('A', 0, 10)) == 'A page 1'
+
+    assert cache.invalidate_container('A', update_id=2) == 3
+    assert cache.get(_children_key('A', 10, 10)) is None
+    assert cache.get(_metadata_key('A')) is None
+    assert cache.get(_children_key('B')) == 'B'
+    assert cache.statistics.invalidations == 4
+
+
+def test_browse_cache_drops_results_with_outdated_update_id():
+    cache = BrowseCache()
+    cache.put(_children_key('A', 0, 10), 'A page 1', 1, update_id=1, containers=['A'])
+    cache.put(_children_key('A', 10, 10), 'A page 2', 1, update_id=2, containers=['A'])
+    assert cache.get(_children_key('A', 0, 10)) is None
+    assert cache.get(_children_key('A', 10, 10)) == 'A page 2'
+
+
+def test_browse_cache_system_update_id():
+    cache = BrowseCache()
+    cache.put(_children_key('A'), 'A', 1, containers=['A'])
+    assert cache.update_system_update_id(5) == 0
+    assert cache.update_system_update_id(5) == 0
+    assert cache.update_system_update_id(6, precise=True) == 0
+    assert cache.update_system_update_id(7) == 1
+    assert len(cache) == 0
+
+
+def test_browse_cache_disabled():
+    cache = BrowseCache(ttl=0)
+    cache.put(_children_key('A'), 'A', 1)
+    assert cache.get(_children_key('A')) is None
+
+
+@pytest.mark.asyncio
+async def test_mediaserver_browse_uses_cache():
+    content_directory = ContentDirectoryStub(didl1, update_id=3)
+    content_directory.results['29$40850$40862'] = didl_musictrack
+    server = MediaServer(MediaServerDeviceStub(content_directory), cache=BrowseCache())
+
+    result = await server.browse('29$40850')
+    assert result.update_id == 3
+    assert await server.browse('29$40850') is result
+    assert len(content_directory.calls) == 1
+    assert await server.browse('29$40850', use_cache=False) is not result
+    assert await server.browse('29$40850', requested_count=10) is not result
+    assert len(content_directory.calls) == 3
+
+    metadata = await server.browse('29$40850$40862', browse_flag=BrowseFlags.BrowseMetadata)
+    server.browse_cache.invalidate_container(metadata.records[0].parentID)
+    assert await server.browse('29$40850$40862', browse_flag=BrowseFlags.BrowseMetadata) is not metadata
+    assert await server.browse('29$40850') is result
+    server.browse_cache.invalidate_container('29$40850')
+    assert await server.browse('29$40850') is not result
+
+    stats = server.browse_cache.statistics
+    assert stats.bypasses == 1
+    assert stats.hits == 2
@@ -0,0 +1,56 @@
+from upnpavcontrol.core.cache import LRUCache
+
+
+def test_lru_cache_get_put():
+    cache = LRUCache[str, int](max_entries=2)
+    assert cache.get('a') is None
+    cache.put('a', 1)
+    assert cache.get('a') == 1
+    assert 'a' in cache
+    assert len(cache) == 1
+    stats = cache.statistics
+    assert stats.hits == 1
+    assert stats.misses == 1
+    assert stats.evictions == 0
+    assert stats.entries == 1
+
+
+def test_lru_cache_evicts_least_recently_used_entry():
+    cache = LRUCache[str, int](max_entries=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+    assert 'a' in cache
+    assert 'b' not in cache
+    assert 'c' in cache
+    assert cache.statistics.evictions == 1
+
+
+def test_lru_cache_respects_size_bound():
+    cache = LRUCache[str, int](max_entries=10, max_size=100)
+    cache.put('a', 1, size=40)
+    cache.put('b', 2, size=40)
+    cache.put('c', 3, size=40)
+    assert 'a' not in cache
+    assert cache.statistics.size == 80
+    assert cache.statistics.evictions == 1
+    # too large to be cached at all
+    cache.put('d', 4, size=101)
+    assert 'd' not in cache
+    assert len(cache) == 2
+
+
+def test_lru_cache_replace_and_pop_entries():
+    cache = LRUCache[str, int](max_entries=10, max_size=100)
+    cache.put('a', 1, size=40)
+    cache.put('a', 2, size=50)
+    assert cache.get('a') == 2
+    assert cache.statistics.size == 50
+    assert cache.pop('a') == 2
+    assert cache.pop('a') is None
+    assert cache.statistics.size == 0
+    cache.put('b', 2, size=10)
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.statistics.size == 0
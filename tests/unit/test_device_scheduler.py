@@ -0,0 +1,173 @@
+from upnpavcontrol.core.device_scheduler import DeviceScheduler, Priority, with_priority, current_priority
+from upnpavcontrol.core.mediaserver import MediaServer
+from upnpavcontrol.core.browse_cache import BrowseCache
+from .test_didllite import didl1
+from ..testsupport import ContentDirectoryStub, MediaServerDeviceStub
+import asyncio
+import pytest
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class Device(object):
+    """
+    Records the order in which requests are processed, each one is finished by `finish()`.
+    """
+
+    def __init__(self):
+        self.active = 0
+        self.max_active = 0
+        self.started = []
+        self._pending = []
+
+    async def request(self, name):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        self.started.append(name)
+        done = asyncio.Event()
+        self._pending.append(done)
+        await done.wait()
+        self.active -= 1
+        return name
+
+    async def finish(self):
+        await asyncio.sleep(0)
+        self._pending.pop(0).set()
+        await asyncio.sleep(0)
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_limits_concurrency():
+    scheduler = DeviceScheduler(max_concurrency=2)
+    device = Device()
+    tasks = [asyncio.ensure_future(scheduler.run(lambda i=i: device.request(i))) for i in range(5)]
+    await _settle()
+    assert device.active == 2
+    assert scheduler.statistics.lanes['interactive'].queued == 3
+    for _ in range(5):
+        await device.finish()
+        await _settle()
+    assert await asyncio.gather(*tasks) == [0, 1, 2, 3, 4]
+    assert device.max_active == 2
+    assert scheduler.active == 0
+    stats = scheduler.statistics.lanes['interactive']
+    assert stats.admitted == 5
+    assert stats.max_queued == 3
+    assert stats.queued == 0
+
+
+@pytest.mark.asyncio
+async def test_serves_higher_priority_first_and_fifo_within_priority():
+    scheduler = DeviceScheduler(max_concurrency=1)
+    device = Device()
+    tasks = [asyncio.ensure_future(scheduler.run(lambda: device.request('first')))]
+    await _settle()
+    for name, priority in [('bg1', Priority.BACKGROUND), ('play', Priority.PLAYBACK), ('bg2', Priority.BACKGROUND),
+                           ('ui1', Priority.INTERACTIVE), ('ui2', Priority.INTERACTIVE)]:
+        tasks.append(asyncio.ensure_future(scheduler.run(lambda name=name: device.request(name), priority)))
+    await _settle()
+    for _ in tasks:
+        await device.finish()
+        await _settle()
+    await asyncio.gather(*tasks)
+    assert device.started == ['first', 'ui1', 'ui2', 'play', 'bg1', 'bg2']
+
+
+@pytest.mark.asyncio
+async def test_promoted_requests_keep_their_place_in_the_higher_lane():
+    clock = FakeClock()
+    scheduler = DeviceScheduler(max_concurrency=1, clock=clock)
+    device = Device()
+    first = asyncio.ensure_future(scheduler.run(lambda: device.request('first')))
+    await _settle()
+    assert scheduler.admitted(first)
+    tasks = {}
+    for name, priority in [('bg1', Priority.BACKGROUND), ('bg2', Priority.BACKGROUND), ('ui', Priority.INTERACTIVE)]:
+        clock.now += 1
+        tasks[name] = asyncio.ensure_future(scheduler.run(lambda name=name: device.request(name), priority))
+        await _settle()
+    # not asking for admission yet, promoted as soon as it does
+    tasks['bg3'] = asyncio.ensure_future(scheduler.run(lambda: device.request('bg3'), Priority.BACKGROUND))
+    scheduler.promote(tasks['bg3'], Priority.INTERACTIVE)
+    await _settle()
+    scheduler.promote(tasks['bg2'], Priority.INTERACTIVE)
+    scheduler.promote(first, Priority.INTERACTIVE)
+    for _ in range(5):
+        await device.finish()
+        await _settle()
+    await asyncio.gather(first, *tasks.values())
+    assert device.started == ['first', 'bg2', 'ui', 'bg3', 'bg1']
+    assert scheduler.statistics.lanes['interactive'].admitted == 4
+    assert scheduler.admitted(tasks['bg1'])
+
+
+@pytest.mark.asyncio
+async def test_long_waiting_requests_are_not_starved():
+    clock = FakeClock()
+    scheduler = DeviceScheduler(max_concurrency=1, max_wait=5, clock=clock)
+    device = Device()
+    tasks = [asyncio.ensure_future(scheduler.run(lambda: device.request('first')))]
+    await _settle()
+    tasks.append(asyncio.ensure_future(scheduler.run(lambda: device.request('bg'), Priority.BACKGROUND)))
+    await _settle()
+    clock.now = 6
+    tasks.append(asyncio.ensure_future(scheduler.run(lambda: device.request('ui'), Priority.INTERACTIVE)))
+    await _settle()
+    for _ in tasks:
+        await device.finish()
+        await _settle()
+    await asyncio.gather(*tasks)
+    assert device.started == ['first', 'bg', 'ui']
+    assert scheduler.statistics.lanes['background'].max_wait == 6
+
+
+@pytest.mark.asyncio
+async def test_cancelled_request_leaves_queue():
+    scheduler = DeviceScheduler(max_concurrency=1)
+    device = Device()
+    first = asyncio.ensure_future(scheduler.run(lambda: device.request('first')))
+    await _settle()
+    cancelled = asyncio.ensure_future(scheduler.run(lambda: device.request('cancelled')))
+    last = asyncio.ensure_future(scheduler.run(lambda: device.request('last')))
+    await _settle()
+    cancelled.cancel()
+    await _settle()
+    await device.finish()
+    await _settle()
+    await device.finish()
+    await asyncio.gather(first, last)
+    assert device.started == ['first', 'last']
+    assert scheduler.active == 0
+
+
+@pytest.mark.asyncio
+async def test_priority_is_taken_from_context():
+    assert current_priority() is Priority.INTERACTIVE
+    scheduler = DeviceScheduler(max_concurrency=1)
+    with with_priority(Priority.BACKGROUND):
+        await scheduler.run(lambda: asyncio.sleep(0))
+    assert current_priority() is Priority.INTERACTIVE
+    assert scheduler.statistics.lanes['background'].admitted == 1
+
+
+@pytest.mark.asyncio
+async def test_browse_is_scheduled():
+    scheduler = DeviceScheduler(max_concurrency=1)
+    server = MediaServer(MediaServerDeviceStub(ContentDirectoryStub(didl1)), cache=BrowseCache(), scheduler=scheduler)
+    with with_priority(Priority.BACKGROUND):
+        await server.browse('0')
+    await server.browse('1')
+    assert scheduler.statistics.lanes['background'].admitted == 1
+    assert scheduler.statistics.lanes['interactive'].admitted == 1
@@ -1,5 +1,10 @@
 # -*- coding: utf-8 -*-
 from upnpavcontrol.core import didllite
+from datetime import time
+import defusedxml
+import defusedxml.ElementTree as etree
+import pickle
+import pytest
 
 didl1 = """
 <DIDL-Lite xmlns="urn:schemas-upnp-org:metadata-1-0/DIDL-Lite/" xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:upnp="urn:schemas-upnp-org:metadata-1-0/upnp/" xmlns:sec="http://www.sec.co.kr/" xmlns:dlna="urn:schemas-dlna-org:metadata-1-0/">
@@ -98,3 +103,186 @@ def test_didl_musictrack_parse():
 def test_didle_musictracks_parse():
     result = list(didllite.from_xml_string(didl_musictrack2))
     assert len(result) == 2
+
+
+def test_didl_iterative_parse():
+    iterator = didllite.iter_xml_string(didl_musictrack2)
+    first = next(iterator)
+    assert first.id == '/a/176/l/179/t/2836'
+    assert first.title == 'Song Title 1'
+    remaining = list(iterator)
+    assert len(remaining) == 1
+    assert remaining[0].id == '/x'
+
+
+def test_didl_iterative_parse_matches_full_parse():
+    expected = didllite.from_xml_string(didl1)
+    result = list(didllite.iter_xml_string(didl1.encode('utf-8')))
+    assert result == expected
+
+
+def test_didllite_iter_objects_does_not_retain_objects():
+    didl = didllite.DidlLite(didl1)
+    titles = [x.title for x in didl.iter_objects()]
+    assert titles == ['= All Songs =', 'Album1', 'Album2']
+    assert didl._objects is None
+    assert [x.title for x in didl.objects] == titles
+    assert [x.title for x in didl.iter_objects()] == titles
+
+
+@pytest.mark.parametrize("xmldata", [didl1, didl_musictrack, didl_musictrack2])
+def test_extraction_plan_matches_dict_adapter(xmldata):
+    root = etree.fromstring(xmldata)
+    for element in root:
+        cls = didllite._didl_class_for(didllite._find_upnp_class(element))
+        assert didllite._to_didl_element(element) == cls.from_orm(element)
+
+
+def test_extraction_plan_takes_first_match_only():
+    result = didllite.from_xml_string(didl_musictrack2)
+    assert result[0].albumArtURI.uri == 'http://192.168.178.21:9002/music/091ab74a/cover_160x160_m.jpg'
+    assert len(result[0].res) == 1
+    assert result[0].res[0].duration == time(0, 4, 26, 520000)
+    assert result[0].originalTrackNumber == 5
+
+
+def test_records_parse():
+    records = didllite.records_from_xml_string(didl_musictrack)
+    assert len(records) == 1
+    track = records[0]
+    assert isinstance(track, didllite.DidlRecord)
+    assert track.id == '26$40260$@40260'
+    assert track.parentID == '26$40260'
+    assert track.title == 'SomeTitle'
+    assert track.album == 'SomeAlbumTitle'
+    assert track.upnpclass == 'object.item.audioItem.musicTrack'
+    # values are not validated or converted
+    assert track.originalTrackNumber == '1'
+    assert track.res[0].duration == '0:04:08.000'
+    assert track.albumArtURI.uri == 'http://192.168.0.1:123456/ebdart/40260.jpg'
+
+
+def test_records_use_slots_and_model_attributes():
+    container = didllite.records_from_xml_string(didl1)[0]
+    assert not hasattr(container, '__dict__')
+    assert getattr(container, 'album', None) is None
+    with pytest.raises(AttributeError):
+        container.foo = 'bar'
+
+
+@pytest.mark.parametrize("xmldata", [didl1, didl_musictrack, didl_musictrack2])
+def test_records_convert_to_models(xmldata):
+    records = didllite.records_from_xml_string(xmldata)
+    assert [r.to_model() for r in records] == didllite.from_xml_string(xmldata)
+
+
+def test_records_can_be_pickled():
+    records = didllite.records_from_xml_string(didl_musictrack2)
+    restored = pickle.loads(pickle.dumps(records))
+    assert restored == records
+    assert isinstance(restored[0], type(records[0]))
+
+
+def test_didllite_records():
+    didl = didllite.DidlLite(didl1)
+    assert [x.title for x in didl.iter_records()] == ['= All Songs =', 'Album1', 'Album2']
+    assert didl._records is None
+    assert [x.id for x in didl.records] == ['29$40850$0', '29$40850$40862', '29$40850$40850']
+
+
+def test_didl_cache_returns_parsed_documents():
+    cache = didllite.DidlCache()
+    first = cache.objects(didl1)
+    second = cache.objects(str(didl1.encode('utf-8'), 'utf-8'))
+    assert first is second
+    assert len(first) == 3
+    assert cache.records(didl1) is cache.records(didl1)
+    stats = cache.statistics
+    assert stats.hits == 2
+    assert stats.misses == 2
+    assert stats.entries == 2
+
+
+def test_didl_cache_is_bounded():
+    cache = didllite.DidlCache(max_entries=10, max_bytes=len(didl1) + len(didl_musictrack))
+    cache.objects(didl1)
+    cache.objects(didl_musictrack)
+    cache.objects(didl_musictrack + '\n')
+    assert cache.statistics.evictions == 1
+    assert cache.statistics.size <= len(didl1) + len(didl_musictrack)
+    assert not didllite.DidlCache(max_bytes=10).accepts(didl1)
+
+
+def test_from_xml_string_uses_cache():
+    cache = didllite.DidlCache()
+    first = didllite.from_xml_string(didl_musictrack, cache=cache)
+    second = didllite.from_xml_string(didl_musictrack, cache=cache)
+    assert first == second
+    assert first[0] is second[0]
+    assert cache.statistics.hits == 1
+
+
+def test_didllite_uses_cache():
+    cache = didllite.DidlCache()
+    objects = didllite.DidlLite(didl1, cache=cache).objects
+    assert didllite.DidlLite(didl1, cache=cache).objects is objects
+    records = list(didllite.DidlLite(didl1, cache=cache).iter_records())
+    assert didllite.DidlLite(didl1, cache=cache).records[0] is records[0]
+    assert cache.statistics.hits == 2
+
+
+def test_record_copy():
+    record = didllite.records_from_xml_string(didl_musictrack)[0]
+    copied = record.copy()
+    assert copied == record
+    copied.id = 'foo'
+    assert record.id == '26$40260$@40260'
+
+
+def test_didllite_objects_are_converted_on_access():
+    didl = didllite.DidlLite(didl1)
+    assert len(didl.objects) == 3
+    assert didl.objects.converted == 0
+    assert didl.objects[1].title == 'Album1'
+    assert didl.objects[-1].title == 'Album2'
+    assert didl.objects.converted == 2
+    assert [x.title for x in didl.objects[:2]] == ['= All Songs =', 'Album1']
+    assert didl.objects == didllite.from_xml_string(didl1)
+    assert didl.records[0].title == '= All Songs ='
+    assert didl.records.converted == 1
+    with pytest.raises(IndexError):
+        didl.objects[3]
+
+
+@pytest.mark.parametrize('xmldata', [didl1, didl_musictrack, didl_musictrack2])
+def test_didl_element_index_matches_full_parse(xmldata):
+    objects = didllite.from_xml_string(xmldata)
+    for data in (xmldata, xmldata.encode('utf-8')):
+        index = didllite.DidlElementIndex(data)
+        assert len(index) == len(objects)
+        assert [didllite._to_didl_element(index.element(i)) for i in range(len(index))] == objects
+
+
+def test_didl_element_index_edge_cases():
+    assert len(didllite.DidlElementIndex('<DIDL-Lite></DIDL-Lite>')) == 0
+    assert len(didllite.DidlElementIndex('<DIDL-Lite/>')) == 0
+    index = didllite.DidlElementIndex('<?xml version="1.0" encoding="iso-8859-1"?>'
+                                      '<DIDL-Lite><item id="a>b"/> <item id="ä"><x/></item></DIDL-Lite>')
+    assert [index.element(i).get('id') for i in range(len(index))] == ['a>b', 'ä']
+
+
+def test_didl_element_index_forbids_entities():
+    xmldata = '<!DOCTYPE DIDL-Lite [<!ENTITY a "aaaa">]><DIDL-Lite><item>&a;</item></DIDL-Lite>'
+    with pytest.raises(defusedxml.EntitiesForbidden):
+        didllite.DidlElementIndex(xmldata)
+
+
+def test_didllite_fragment_contains_original_item_xml():
+    didl = didllite.DidlLite(didl1)
+    fragment = didl.fragment(1)
+    assert fragment.startswith(didl1[:didl1.index('<container')])
+    assert fragment.endswith('</DIDL-Lite>\n')
+    assert fragment.count('<container') == 1
+    assert '<dc:title>Album1</dc:title>' in fragment
+    assert didllite.from_xml_string(fragment) == [didl.objects[1]]
+    assert didllite.DidlLite(didl_musictrack).fragment(0) is didl_musictrack
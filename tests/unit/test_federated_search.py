@@ -0,0 +1,130 @@
+from upnpavcontrol.core.browse_cache import BrowseCache
+from upnpavcontrol.core.federated_search import federated_search, search_server, SearchStatus
+from upnpavcontrol.core.mediaserver import MediaServer, text_search_criteria
+from upnpavcontrol.web.api.library import format_server_search_result
+from .test_didllite import didl_musictrack
+from ..testsupport import ContentDirectoryStub, MediaServerDeviceStub
+import asyncio
+import pytest
+
+
+class SearchingContentDirectory(ContentDirectoryStub):
+    """
+    Answers Search requests with `default_result` after `delay` seconds, fails them if `delay` is negative.
+    """
+
+    def __init__(self, capabilities: str = 'dc:title,upnp:artist', delay: float = 0):
+        super().__init__(didl_musictrack)
+        self.capabilities = capabilities
+        self.delay = delay
+
+    async def async_call_action(self, action: str, **kwargs):
+        if action == 'GetSearchCapabilities':
+            self.calls.append((action, kwargs))
+            return {'SearchCaps': self.capabilities}
+        if action == 'Search':
+            await asyncio.sleep(max(self.delay, 0))
+            if self.delay < 0:
+                raise RuntimeError('Search failed')
+        payload = await super().async_call_action(action, **kwargs)
+        payload['TotalMatches'] = 42
+        return payload
+
+
+async def _refuse_connection():
+    raise ConnectionRefusedError()
+
+
+def _server(content_directory, name):
+    device = MediaServerDeviceStub(content_directory)
+    device.udn = f'uuid:{name}'
+    device.friendly_name = name
+    return MediaServer(device, cache=BrowseCache())
+
+
+def test_text_search_criteria():
+    assert text_search_criteria('love', ['dc:title']) == 'dc:title contains "love"'
+    assert text_search_criteria('"yes\\"', ['*'], ['dc:title']) == 'dc:title contains "\\"yes\\\\\\""'
+    assert text_search_criteria('a b', ['dc:title', 'upnp:artist', 'upnp:genre']) == \
+        '(dc:title contains "a" or upnp:artist contains "a") and (dc:title contains "b" or upnp:artist contains "b")'
+    assert text_search_criteria('love', ['upnp:genre']) is None
+    assert text_search_criteria('  ', ['*']) is None
+
+
+@pytest.mark.asyncio
+async def test_search_server_uses_capabilities():
+    content_directory = SearchingContentDirectory()
+    server = _server(content_directory, 'server')
+    result = await search_server(server, 'some title', requested_count=10)
+    await search_server(server, 'other')
+
+    assert result.status is SearchStatus.OK
+    assert [record.title for record in result.records] == ['SomeTitle']
+    assert result.total_matches == 42
+    actions = [action for action, _ in content_directory.calls]
+    assert actions == ['GetSearchCapabilities', 'Search', 'Search']
+    search = content_directory.calls[1][1]
+    assert search['ContainerID'] == '0'
+    assert search['RequestedCount'] == 10
+    assert search['SearchCriteria'] == ('(dc:title contains "some" or upnp:artist contains "some") and '
+                                        '(dc:title contains "title" or upnp:artist contains "title")')
+    # search results must not end up in the browse cache
+    assert len(server.browse_cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_federated_search_yields_results_as_servers_answer():
+    servers = [
+        _server(SearchingContentDirectory(delay=0.05), 'slow'),
+        _server(SearchingContentDirectory(delay=0.4), 'hanging'),
+        _server(SearchingContentDirectory(), 'fast'),
+        _server(SearchingContentDirectory(capabilities=''), 'unsupported'),
+        _server(SearchingContentDirectory(delay=-1), 'broken'),
+    ]
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    results = [(result.server.friendly_name, result.status) async for result in federated_search(servers, 'x', 0.2)]
+
+    assert loop.time() - start < 0.3
+    assert set(results[:3]) == {('fast', SearchStatus.OK), ('unsupported', SearchStatus.UNSUPPORTED),
+                                ('broken', SearchStatus.FAILED)}
+    assert results[3:] == [('slow', SearchStatus.OK), ('hanging', SearchStatus.TIMEOUT)]
+    # the abandoned Search action still completes
+    await asyncio.sleep(0.3)
+
+
+@pytest.mark.asyncio
+async def test_federated_search_can_be_closed_early():
+    servers = [_server(SearchingContentDirectory(), 'fast'), _server(SearchingContentDirectory(delay=0.2), 'hanging')]
+    search = federated_search(servers, 'x', timeout=20)
+    first = await search.__anext__()
+    assert first.server.friendly_name == 'fast'
+    await asyncio.wait_for(search.aclose(), 0.1)
+    with pytest.raises(StopAsyncIteration):
+        await search.__anext__()
+    await asyncio.sleep(0.25)
+
+
+@pytest.mark.asyncio
+async def test_format_server_search_result():
+    server = _server(SearchingContentDirectory(), 'server')
+    formatted = format_server_search_result(await search_server(server, 'x'))
+    payload = formatted.dict()
+    assert payload['id'] == 'server'
+    assert payload['title'] == 'server'
+    assert payload['status'] == 'ok'
+    assert payload['total_matches'] == 42
+    assert [item['id'] for item in payload['items']] == ['server.26%2440260%24%4040260']
+
+
+@pytest.mark.asyncio
+async def test_federated_search_skips_unreachable_servers():
+    content_directory = SearchingContentDirectory()
+    server = _server(content_directory, 'sleeping')
+    await server.get_search_capabilities()
+    for _ in range(2):
+        with pytest.raises(ConnectionRefusedError):
+            await server.health.run(_refuse_connection)
+    results = [result async for result in federated_search([server], 'x', timeout=20)]
+    assert [result.status for result in results] == [SearchStatus.UNAVAILABLE]
+    assert [action for action, _ in content_directory.calls] == ['GetSearchCapabilities']
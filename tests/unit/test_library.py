@@ -11,3 +11,207 @@ async def test_encode_decode_library_item(udn, objectID):
     decoded_udn, decoded_objectID = split_library_item_id(encoded)
     assert decoded_udn == udn
     assert decoded_objectID == objectID
+
+
+def test_library_item_metadata_from_record():
+    from upnpavcontrol.core import didllite
+    from upnpavcontrol.web import models
+    from upnpavcontrol.web.api.library import _fixup_item_ids, _fixup_item_media_urls
+    from .test_didllite import didl_musictrack
+    record = didllite.records_from_xml_string(didl_musictrack)[0]
+    metadata = models.LibraryItemMetadata.from_orm(_fixup_item_ids(_fixup_item_media_urls(record), '10-20-30'))
+    assert metadata.id == create_library_item_id('10-20-30', '26$40260$@40260')
+    assert metadata.albumArtURI.startswith('/api/proxy/')
+    assert metadata.title == 'SomeTitle'
+    assert metadata.album == 'SomeAlbumTitle'
+    assert metadata.originalTrackNumber == 1
+    assert metadata.genre == 'Alternative'
+
+
+def test_format_indexed_object():
+    from upnpavcontrol.core.library_index import IndexedObject
+    from upnpavcontrol.web import models
+    from upnpavcontrol.web.api.library import format_indexed_object
+    item = IndexedObject('10-20-30', 'a/1', 'a', 0, 'object.container.album.musicAlbum', 'Album',
+                         artwork_uri='http://127.0.0.1/cover.jpg')
+    formatted = models.LibraryListItem(**format_indexed_object(item))
+    assert formatted.id == create_library_item_id('10-20-30', 'a/1')
+    assert formatted.parentID == create_library_item_id('10-20-30', 'a')
+    assert formatted.upnpclass == models.LibraryItemType.CONTAINER
+    assert formatted.image.startswith('/api/proxy/')
+
+
+@pytest.mark.asyncio
+async def test_browse_library_falls_back_to_index_for_servers_gone():
+    import types
+    from fastapi import HTTPException, Response
+    from upnpavcontrol.core.library_index import LibraryIndex
+    from upnpavcontrol.web.api.library import browse_library, get_library_item, STALE_WARNING
+
+    def get_mediaserver_by_UDN(udn):
+        raise KeyError(udn)
+
+    index = LibraryIndex(':memory:')
+    index.store('10-20-30', [
+        types.SimpleNamespace(id='1', parentID='0', upnpclass='object.item.audioItem.musicTrack', title='Track',
+                              artist='Artist', album='Album', res=[])
+    ])
+    index.set_container_update_id('10-20-30', '0', None)
+    control_point = types.SimpleNamespace(get_mediaserver_by_UDN=get_mediaserver_by_UDN,
+                                          library_indexer=types.SimpleNamespace(index=index))
+    request = types.SimpleNamespace(app=types.SimpleNamespace(av_control_point=control_point))
+
+    response = Response()
+    items = await browse_library(request, response, create_library_item_id('10-20-30'))
+    assert [x['id'] for x in items] == [create_library_item_id('10-20-30', '1')]
+    assert response.headers['Warning'] == STALE_WARNING
+
+    response = Response()
+    metadata = await get_library_item(request, response, create_library_item_id('10-20-30', '1'))
+    assert (metadata.title, metadata.artist, metadata.parentID) == ('Track', 'Artist', create_library_item_id(
+        '10-20-30', '0'))
+    assert response.headers['Warning'] == STALE_WARNING
+
+    with pytest.raises(HTTPException) as error:
+        await browse_library(request, Response(), create_library_item_id('10-20-30', 'unknown'))
+    assert error.value.status_code == 404
+    index.close()
+
+
+@pytest.mark.asyncio
+async def test_unavailable_servers_are_reported_as_such():
+    import types
+    from fastapi import HTTPException, Response
+    from upnpavcontrol.core.server_health import ServerUnavailableError
+    from upnpavcontrol.web.api.library import browse_library, get_library_item
+
+    async def browse(*args, **kwargs):
+        raise ServerUnavailableError(retry_in=12.5)
+
+    server = types.SimpleNamespace(browse=browse)
+    control_point = types.SimpleNamespace(get_mediaserver_by_UDN=lambda udn: server, library_indexer=None)
+    request = types.SimpleNamespace(app=types.SimpleNamespace(av_control_point=control_point))
+    for endpoint in [browse_library, get_library_item]:
+        with pytest.raises(HTTPException) as error:
+            await endpoint(request, Response(), create_library_item_id('10-20-30', '1'))
+        assert error.value.status_code == 503
+        assert error.value.headers['Retry-After'] == '13'
+
+
+@pytest.mark.parametrize('cursor', ['', 'not a cursor', 'MTow', 'LTE6NQ', 'MTo1Og'])
+def test_malformed_cursors_are_rejected(cursor):
+    from upnpavcontrol.web.api.library import decode_cursor, encode_cursor
+    assert decode_cursor(encode_cursor(10, 5)) == (10, 5, None)
+    assert decode_cursor(encode_cursor(10, 5, 'views.artist:AC/DC')) == (10, 5, 'views.artist:AC/DC')
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+@pytest.mark.asyncio
+async def test_browse_library_page_with_cursors_and_etag():
+    import types
+    from fastapi import Response
+    from upnpavcontrol.core.browse_cache import BrowseCache
+    from upnpavcontrol.core.mediaserver import MediaServer
+    from upnpavcontrol.core.prefetch import Prefetcher
+    from upnpavcontrol.web.api.library import browse_library_page
+    from .test_media_server import PagingContentDirectory
+    from ..testsupport import MediaServerDeviceStub
+
+    content_directory = PagingContentDirectory({'0': [f'i{n}' for n in range(5)]})
+    content_directory.update_ids['0'] = 7
+    server = MediaServer(MediaServerDeviceStub(content_directory), cache=BrowseCache(), prefetcher=Prefetcher(0))
+    control_point = types.SimpleNamespace(get_mediaserver_by_UDN=lambda udn: server, library_indexer=None)
+    request = types.SimpleNamespace(app=types.SimpleNamespace(av_control_point=control_point))
+    id = create_library_item_id(server.udn)
+
+    async def browse(cursor=None, if_none_match=None):
+        response = Response()
+        page = await browse_library_page(request, response, id, cursor=cursor, pagesize=2, if_none_match=if_none_match)
+        return page, response
+
+    first, response = await browse()
+    assert (first.number_returned, first.total_matches, first.update_id, first.previous) == (2, 5, 7, None)
+    assert response.headers['ETag'] == 'W/"c7"'
+    last, _ = await browse((await browse(first.next))[0].next)
+    assert [item.title for item in last.items] == ['i4']
+    assert last.next is None
+    assert (await browse(last.previous))[0].items[0].title == 'i2'
+
+    calls = len(content_directory.calls)
+    not_modified = await browse(if_none_match='"x", W/"c7"')
+    assert not_modified[0].status_code == 304
+    assert len(content_directory.calls) == calls
+
+    # the container changed, the page is browsed again
+    server.browse_cache.invalidate_container('0')
+    content_directory.update_ids['0'] = 8
+    page, response = await browse(if_none_match='W/"c7"')
+    assert page.update_id == 8
+    assert response.headers['ETag'] == 'W/"c8"'
+
+
+@pytest.mark.asyncio
+async def test_pages_of_views_and_index_continue_after_last_item():
+    import types
+    from fastapi import Response
+    from upnpavcontrol.core.library_index import LibraryIndex
+    from upnpavcontrol.core.library_views import VIEWS_UDN
+    from upnpavcontrol.web.api.library import browse_library_page
+    from .test_library_views import _track
+
+    def get_mediaserver_by_UDN(udn):
+        raise KeyError(udn)
+
+    index = LibraryIndex(':memory:')
+    index.store('10-20-30', [_track(str(n), f'Artist {n}', 'Album') for n in range(4)])
+    index.set_container_update_id('10-20-30', '0', None)
+    control_point = types.SimpleNamespace(get_mediaserver_by_UDN=get_mediaserver_by_UDN,
+                                          library_indexer=types.SimpleNamespace(index=index))
+    request = types.SimpleNamespace(app=types.SimpleNamespace(av_control_point=control_point))
+
+    async def titles(id, cursor=None):
+        page = await browse_library_page(request, Response(), id, cursor=cursor, pagesize=2)
+        return [item.title for item in page.items], page.next
+
+    # items added in front of the next page don't shift it
+    artists, next = await titles(create_library_item_id(VIEWS_UDN, 'artists'))
+    assert artists == ['Artist 0', 'Artist 1']
+    index.store('10-20-30', [_track('new', 'Artist 00', 'Album')], starting_index=4)
+    assert (await titles(create_library_item_id(VIEWS_UDN, 'artists'), next))[0] == ['Artist 2', 'Artist 3']
+
+    tracks, next = await titles(create_library_item_id('10-20-30', '0'))
+    assert tracks == ['Track 0', 'Track 1']
+    index.store('10-20-30', [_track('0a', 'Artist 0', 'Album')], starting_index=0)
+    assert (await titles(create_library_item_id('10-20-30', '0'), next))[0] == ['Track 2', 'Track 3']
+    index.close()
+
+
+@pytest.mark.asyncio
+async def test_revalidated_pages_are_not_prefetched_after():
+    import asyncio
+    import types
+    from fastapi import Response
+    from upnpavcontrol.core.browse_cache import BrowseCache
+    from upnpavcontrol.core.mediaserver import MediaServer
+    from upnpavcontrol.core.prefetch import Prefetcher
+    from upnpavcontrol.web.api.library import browse_library_page
+    from .test_media_server import PagingContentDirectory
+    from ..testsupport import MediaServerDeviceStub
+
+    content_directory = PagingContentDirectory({'0': [f'i{n}' for n in range(5)]})
+    content_directory.update_ids['0'] = 7
+    server = MediaServer(MediaServerDeviceStub(content_directory), cache=BrowseCache(), prefetcher=Prefetcher())
+    control_point = types.SimpleNamespace(get_mediaserver_by_UDN=lambda udn: server, library_indexer=None)
+    request = types.SimpleNamespace(app=types.SimpleNamespace(av_control_point=control_point))
+    id = create_library_item_id(server.udn)
+
+    not_modified = await browse_library_page(request, Response(), id, pagesize=2, if_none_match='W/"c7"')
+    assert not_modified.status_code == 304
+    await asyncio.sleep(0.01)
+    assert server.prefetcher.statistics.scheduled == 0
+    assert len(content_directory.calls) == 1
+
+    await browse_library_page(request, Response(), id, pagesize=2, if_none_match=None)
+    await asyncio.sleep(0.01)
+    assert server.prefetcher.statistics.scheduled == 1
@@ -0,0 +1,298 @@
+from upnpavcontrol.core import didllite
+from upnpavcontrol.core.browse_cache import BrowseCache
+from upnpavcontrol.core.device_scheduler import DeviceScheduler
+from upnpavcontrol.core.library_index import LibraryIndex
+from upnpavcontrol.core.library_indexer import LibraryIndexer, CrawlProgress
+from upnpavcontrol.core.mediaserver import MediaServer
+from .test_didllite import didl1, didl_musictrack
+from .test_media_server import FakeVariable, PagingContentDirectory, tree
+from ..testsupport import MediaServerDeviceStub
+import asyncio
+import pytest
+import threading
+import types
+
+udn = 'c9d4d2ea-1a47-4e34-9ff3-5e7e7d1b2c4a'
+
+
+@pytest.fixture
+def index():
+    index = LibraryIndex(':memory:')
+    yield index
+    index.close()
+
+
+def test_store_and_lookup(index):
+    index.store(udn, didllite.records_from_xml_string(didl1), starting_index=10)
+    index.store(udn, didllite.records_from_xml_string(didl_musictrack))
+    assert index.count(udn) == 4
+    assert index.count('other') == 0
+
+    children = index.children(udn, '29$40850')
+    assert [child.id for child in children] == ['29$40850$0', '29$40850$40862', '29$40850$40850']
+    assert [child.position for child in children] == [10, 11, 12]
+    assert children[1].is_container
+    assert [child.id for child in index.children(udn, '29$40850', offset=1, limit=1)] == ['29$40850$40862']
+
+    track = index.get(udn, '26$40260$@40260')
+    assert not track.is_container
+    assert track.title == 'SomeTitle'
+    assert track.album == 'SomeAlbumTitle'
+    assert track.genre == 'Alternative'
+    assert track.track_number == 1
+    assert track.uri is not None
+    assert track.protocol_info.startswith('http-get')
+    assert track.artwork_uri is not None
+    assert index.get(udn, 'unknown') is None
+
+
+def test_complete_crawl_drops_objects_of_previous_crawls(index):
+    generation = index.begin_crawl(udn, 'Server')
+    index.store(udn, didllite.records_from_xml_string(didl1), generation=generation)
+    index.finish_crawl(udn, generation, system_update_id=3)
+    generation = index.begin_crawl(udn, 'Server')
+    index.store(udn, didllite.records_from_xml_string(didl_musictrack), generation=generation)
+    assert index.count(udn) == 4
+    assert index.finish_crawl(udn, generation, system_update_id=4) == 3
+    assert index.count(udn) == 1
+    server = index.server(udn)
+    assert server.friendly_name == 'Server'
+    assert server.system_update_id == 4
+    assert server.indexed_at is not None
+
+
+def test_remove_server(index):
+    index.begin_crawl(udn)
+    index.store(udn, didllite.records_from_xml_string(didl1))
+    index.remove_server(udn)
+    assert index.count(udn) == 0
+    assert index.server(udn) is None
+
+
+def _object(id, title, artist=None, album=None, upnpclass='object.item.audioItem.musicTrack'):
+    return types.SimpleNamespace(id=id, parentID='0', upnpclass=upnpclass, title=title, artist=artist, album=album,
+                                 res=[])
+
+
+def _search(index, query, **kwargs):
+    return [result.id for result in index.search(query, **kwargs)]
+
+
+def test_search_ranks_title_prefixes_first(index):
+    index.store(udn, [
+        _object('album', 'Songs of Love', artist='Various', upnpclass='object.container.album.musicAlbum'),
+        _object('spread', 'Night', artist='Love Parade'),
+        _object('artist', 'Blue', artist='The Lovers', album='Love Night'),
+        _object('album_only', 'Dawn', artist='Various', album='Love Songs'),
+        _object('prefix', 'love song'),
+        _object('exact', 'Love'),
+        _object('other', 'Hate'),
+    ])
+    assert _search(index, 'LOVE') == ['exact', 'prefix', 'album', 'spread', 'artist', 'album_only']
+    assert _search(index, 'love night') == ['artist', 'spread']
+    assert _search(index, '  love  ', offset=1, limit=3) == ['prefix', 'album', 'spread']
+    assert _search(index, 'ove', limit=2) == ['album', 'prefix']
+    assert _search(index, 'love', udns=['other']) == []
+    assert _search(index, '') == []
+
+
+def test_search_short_terms_and_special_characters(index):
+    index.store(udn, [
+        _object('1', 'Lo-Fi'),
+        _object('2', 'Slow'),
+        _object('3', '100% Hits'),
+        _object('4', '100 Hits'),
+        _object('5', 'Say "yes"'),
+    ])
+    # too short for a substring search, only beginnings of titles match
+    assert _search(index, 'lo') == ['1']
+    assert _search(index, '100%') == ['3']
+    assert _search(index, '"yes"') == ['5']
+    assert _search(index, 'hits 10') == ['3', '4']
+
+
+def test_search_excludes_tombstones_and_follows_updates(index):
+    generation = index.begin_crawl(udn)
+    index.store(udn, [_object('1', 'Yellow Submarine'), _object('2', 'Yellow')], generation=generation)
+    generation = index.begin_crawl(udn)
+    index.store(udn, [_object('1', 'Blue Submarine')], generation=generation)
+    index.finish_crawl(udn, generation)
+    assert _search(index, 'yellow') == []
+    assert _search(index, 'submarine') == ['1']
+
+
+def test_search_index_is_built_for_existing_databases(tmp_path):
+    path = str(tmp_path / 'index.sqlite')
+    index = LibraryIndex(path)
+    index.store(udn, [_object('1', 'Yellow Submarine')])
+    index._connection.executescript('DROP TABLE objects_search')
+    index.close()
+    index = LibraryIndex(path)
+    assert index.search_enabled
+    assert _search(index, 'marine') == ['1']
+    index.close()
+
+
+@pytest.mark.asyncio
+async def test_indexer_crawls_all_containers_with_background_priority(index):
+    content_directory = PagingContentDirectory(dict(tree, **{'0': ['artist', 'single']}))
+    scheduler = DeviceScheduler()
+    cache = BrowseCache()
+    server = MediaServer(MediaServerDeviceStub(content_directory), cache=cache, scheduler=scheduler)
+    indexer = LibraryIndexer(index, page_size=2)
+
+    progress = await indexer.start(server)
+
+    assert progress.done
+    assert progress.failed == 0
+    assert progress.pending == 0
+    assert progress.containers == 5
+    # 'artist' is listed by the root and by album2, but stored only once
+    assert index.count(server.udn) == 12
+    assert [child.id for child in index.children(server.udn, 'album1')] == ['t1', 't2', 't3', 'disc2']
+    assert scheduler.statistics.lanes['background'].admitted == len(content_directory.calls)
+    assert scheduler.statistics.lanes['interactive'].admitted == 0
+    assert len(cache) == 0
+    assert not indexer.is_crawling(server.udn)
+
+
+@pytest.mark.asyncio
+async def test_indexer_writes_off_the_event_loop(index):
+    threads = set()
+    store = index.store
+
+    def recording_store(*args):
+        threads.add(threading.current_thread())
+        return store(*args)
+
+    index.store = recording_store
+    content_directory = PagingContentDirectory(dict(tree, **{'0': ['artist', 'single']}))
+    server = MediaServer(MediaServerDeviceStub(content_directory), cache=BrowseCache())
+    await LibraryIndexer(index, page_size=2).crawl(server)
+    assert index.count(server.udn) == 12
+    assert len(threads) == 1
+    assert threads.pop() is not threading.current_thread()
+
+
+@pytest.mark.asyncio
+async def test_failed_containers_keep_previous_objects(index):
+    content_directory = PagingContentDirectory({'0': ['album1'], 'album1': ['t1']})
+    server = MediaServer(MediaServerDeviceStub(content_directory), cache=BrowseCache())
+    indexer = LibraryIndexer(index)
+    await indexer.crawl(server)
+    assert index.count(server.udn) == 2
+
+    async def fail(action, **kwargs):
+        raise RuntimeError('unavailable')
+
+    content_directory.async_call_action = fail
+    progress = await indexer.crawl(server)
+    assert progress.failed == 1
+    assert index.count(server.udn) == 2
+
+
+def _library(tree):
+    content_directory = PagingContentDirectory(tree)
+    content_directory.update_ids = {container_id: 1 for container_id in tree}
+    content_directory.system_update_id = 1
+    server = MediaServer(MediaServerDeviceStub(content_directory), cache=BrowseCache())
+    return content_directory, server
+
+
+def _browsed(content_directory):
+    return [kwargs['ObjectID'] for action, kwargs in content_directory.calls
+            if action == 'Browse' and kwargs['RequestedCount'] != 1]
+
+
+@pytest.mark.asyncio
+async def test_resync_browses_changed_containers_only(index):
+    content_directory, server = _library({'0': ['album1', 'album2'], 'album1': ['t1', 't2'], 'album2': ['t3']})
+    indexer = LibraryIndexer(index)
+    await indexer.crawl(server)
+    assert index.container_update_id(server.udn, 'album1') == 1
+
+    content_directory.calls.clear()
+    progress = await indexer.resync(server)
+    assert progress.done
+    assert content_directory.calls == [('GetSystemUpdateID', {})]
+
+    content_directory.system_update_id = 2
+    content_directory.tree['album1'] = ['t1', 'new']
+    content_directory.update_ids['album1'] = 2
+    content_directory.calls.clear()
+    progress = await indexer.resync(server)
+    assert _browsed(content_directory) == ['album1']
+    assert (progress.containers, progress.unchanged, progress.deleted, progress.failed) == (1, 2, 1, 0)
+    assert [child.id for child in index.children(server.udn, 'album1')] == ['t1', 'new']
+    assert index.get(server.udn, 't2') is None
+    assert [tombstone[0] for tombstone in index.tombstones(server.udn)] == ['t2']
+    assert index.server(server.udn).system_update_id == 2
+
+
+@pytest.mark.asyncio
+async def test_resync_drops_removed_containers_with_descendants(index):
+    content_directory, server = _library({'0': ['artist'], 'artist': ['album'], 'album': ['t1', 't2']})
+    indexer = LibraryIndexer(index)
+    await indexer.crawl(server)
+    assert index.count(server.udn) == 4
+
+    del content_directory.tree['artist']
+    content_directory.tree['0'] = ['other']
+    content_directory.tree['other'] = ['t3']
+    content_directory.update_ids.update({'0': 2, 'other': 1})
+    content_directory.system_update_id = 2
+    progress = await indexer.resync(server)
+    assert progress.failed == 0
+    assert progress.deleted == 4
+    assert sorted(tombstone[0] for tombstone in index.tombstones(server.udn)) == ['album', 'artist', 't1', 't2']
+    assert [child.id for child in index.children(server.udn, 'other')] == ['t3']
+    assert sorted(index.container_ids(server.udn)) == ['0', 'other']
+    assert index.purge_tombstones(before=float('inf')) == 4
+
+
+@pytest.mark.asyncio
+async def test_databases_without_year_are_crawled_completely(tmp_path):
+    path = str(tmp_path / 'index.sqlite')
+    index = LibraryIndex(path)
+    content_directory, server = _library({'0': ['album1', 'album2'], 'album1': ['t1'], 'album2': ['t2']})
+    await LibraryIndexer(index).crawl(server)
+    index._connection.executescript('DROP INDEX audio_by_decade; ALTER TABLE objects DROP COLUMN year')
+    index.close()
+
+    index = LibraryIndex(path)
+    assert index.server(server.udn).indexed_at is None
+    assert index.container_ids(server.udn) == []
+    indexer = LibraryIndexer(index)
+    content_directory.calls.clear()
+    progress = await indexer.start(server)
+    assert not progress.incremental
+    assert sorted(_browsed(content_directory)) == ['0', 'album1', 'album2']
+    assert index.server(server.udn).indexed_at is not None
+    await indexer.stop_all()
+    index.close()
+
+
+@pytest.mark.asyncio
+async def test_library_changes_trigger_resync_of_announced_containers(index):
+    content_directory, server = _library({'0': ['album1', 'album2'], 'album1': ['t1'], 'album2': ['t2']})
+    indexer = LibraryIndexer(index)
+    await indexer.start(server)
+
+    content_directory.tree['album2'] = ['t2', 't3']
+    content_directory.calls.clear()
+    server._on_event(None, [FakeVariable('SystemUpdateID', '2'), FakeVariable('ContainerUpdateIDs', 'album2,2')])
+    for _ in range(20):
+        await asyncio.sleep(0.01)
+        if index.get(server.udn, 't3') is not None and not indexer.is_crawling(server.udn):
+            break
+    assert index.get(server.udn, 't3') is not None
+    assert _browsed(content_directory) == ['album2']
+    assert indexer.progress(server.udn).incremental
+    await indexer.stop_all()
+
+
+def test_crawl_progress_eta():
+    progress = CrawlProgress(containers=2, unchanged=2, pending=6, started_at=10.0)
+    assert progress.eta(now=12.0) == 3.0
+    assert CrawlProgress(pending=1).eta() is None
+    assert CrawlProgress(done=True).eta() == 0.0
@@ -0,0 +1,106 @@
+from upnpavcontrol.core.library_index import LibraryIndex
+from upnpavcontrol.core.library_views import LibraryViews, VIEWS_UDN, parse_view_id
+from upnpavcontrol.web.api.library import create_library_item_id, _browse_views
+import pytest
+import types
+
+
+def _track(id, artist, album, track_number=None, genre=None, date=None, uri=None):
+    return types.SimpleNamespace(id=id,
+                                 parentID='0',
+                                 upnpclass='object.item.audioItem.musicTrack',
+                                 title=f'Track {id}',
+                                 artist=artist,
+                                 album=album,
+                                 genre=genre,
+                                 date=date,
+                                 originalTrackNumber=track_number,
+                                 res=[types.SimpleNamespace(uri=uri or f'http://server/{id}', protocolInfo='')])
+
+
+@pytest.fixture
+def views():
+    index = LibraryIndex(':memory:')
+    index.store('server1', [
+        types.SimpleNamespace(id='c1', parentID='0', upnpclass='object.container.album.musicAlbum', title='Abbey Road',
+                              artist='The Beatles', album=None, genre='Rock', res=[]),
+        _track('1', 'The Beatles', 'Abbey Road', '2', 'Rock', '1969-09-26'),
+        _track('2', 'The Beatles', 'Abbey Road', '1', 'Rock', '1969'),
+        # the same track listed in another container of the server
+        _track('2b', 'The Beatles', 'Abbey Road', '1', 'Rock', '1969', uri='http://server/2'),
+        _track('3', 'the beatles', 'Help!', '1', 'Rock', '1965-08-06'),
+        _track('4', 'AC/DC', 'Back in Black', '1', 'hard rock', '1980'),
+        _track('5', None, 'Unknown', '1'),
+    ])
+    index.store('server2', [
+        _track('1', 'The Beatles', 'abbey road', '3', 'Rock', 'unknown'),
+        _track('2', 'Miles Davis', 'Kind of Blue', None, 'Jazz', '1959-08-17'),
+    ])
+    yield LibraryViews(index)
+    index.close()
+
+
+def _titles(objects):
+    return [x.title for x in objects]
+
+
+def test_view_ids():
+    assert parse_view_id('0').parent_id == '-1'
+    assert parse_view_id('artists').parent_id == '0'
+    album = parse_view_id('album:AC/DC:Back%20in%20Black%3A%20Live')
+    assert (album.title, album.artist, album.parent_id) == ('Back in Black: Live', 'AC/DC', 'artist:AC/DC')
+    assert parse_view_id('decade:1990').title == '1990s'
+    for view_id in ['unknown', 'artist', 'album:x', 'decade:199x', 'artists:x']:
+        with pytest.raises(KeyError):
+            parse_view_id(view_id)
+
+
+def test_views_group_items_ignoring_case(views):
+    assert [x.id for x in views.children('0')] == ['artists', 'albums', 'genres', 'decades']
+    artists = views.children('artists')
+    assert _titles(artists) == ['AC/DC', 'Miles Davis', 'The Beatles']
+    assert _titles(views.children(artists[2].id)) == ['Abbey Road', 'Help!']
+    assert [(x.title, x.artist) for x in views.children('albums')
+            ] == [('Abbey Road', 'The Beatles'), ('Back in Black', 'AC/DC'), ('Help!', 'the beatles'),
+                  ('Kind of Blue', 'Miles Davis')]
+    assert _titles(views.children('genres')) == ['hard rock', 'Jazz', 'Rock']
+    assert _titles(views.children('genre:rock')) == ['Abbey Road', 'Help!']
+    assert _titles(views.children('decades')) == ['1950s', '1960s', '1980s']
+    assert _titles(views.children('decade:1960')) == ['Abbey Road', 'Help!']
+
+
+def test_album_items_are_merged_across_servers_and_deduplicated(views):
+    album = views.children('artist:The%20Beatles')[0]
+    tracks = views.children(album.id)
+    assert [(x.udn, x.id) for x in tracks] == [('server1', '2'), ('server1', '1'), ('server2', '1')]
+    assert tracks[0].year == 1969
+    assert views.children(album.id, after=tracks[0], limit=1) == [tracks[1]]
+
+
+def test_keyset_paging_matches_offset_paging(views):
+    for view_id in ['0', 'artists', 'albums', 'genres', 'decades', 'genre:Rock', 'album:The%20Beatles:Abbey%20Road']:
+        complete = views.children(view_id)
+        pages = []
+        after = None
+        while True:
+            page = views.children(view_id, after=after, limit=2)
+            if not page:
+                break
+            pages.extend(page)
+            after = page[-1]
+        assert pages == complete
+        assert views.children(view_id, offset=1, limit=2) == complete[1:3]
+
+
+def test_browse_views_continues_after_item_ids(views):
+    albums = _browse_views(views, 'albums', 0, 2, None)
+    assert [x['title'] for x in albums] == ['Abbey Road', 'Back in Black']
+    assert albums[0]['id'] == create_library_item_id(VIEWS_UDN, 'album:The%20Beatles:Abbey%20Road')
+    assert albums[0]['parentID'] == create_library_item_id(VIEWS_UDN, 'artist:The%20Beatles')
+    assert [x['title'] for x in _browse_views(views, 'albums', 0, 2, albums[-1]['id'])] == ['Help!', 'Kind of Blue']
+    assert [x['title'] for x in _browse_views(views, 'artist:AC/DC', 0, 0, None)] == ['Back in Black']
+
+    tracks = _browse_views(views, 'album:The%20Beatles:Abbey%20Road', 0, 1, None)
+    assert tracks[0]['id'] == create_library_item_id('server1', '2')
+    assert [x['id'] for x in _browse_views(views, 'album:The%20Beatles:Abbey%20Road', 0, 1, tracks[0]['id'])
+            ] == [create_library_item_id('server1', '1')]
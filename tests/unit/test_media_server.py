@@ -0,0 +1,247 @@
+from upnpavcontrol.core.mediaserver import MediaServer, LibraryChangeEvent, parse_container_update_ids
+from upnpavcontrol.core.browse_cache import BrowseCache
+from upnpavcontrol.core.server_health import ServerHealth, HealthState, ServerUnavailableError
+from .test_browse_cache import FakeClock
+from .test_didllite import didl1
+from ..testsupport import ContentDirectoryStub, MediaServerDeviceStub
+import asyncio
+import pytest
+
+
+class FakeVariable(object):
+
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+
+
+@pytest.mark.parametrize('value,expected', [
+    ('', {}),
+    (None, {}),
+    ('A,1', {'A': 1}),
+    ('A,1,B/c,25', {'A': 1, 'B/c': 25}),
+    ('A\\,B,3,C\\\\,4', {'A,B': 3, 'C\\': 4}),
+    ('A,x,B,2,C', {'B': 2}),
+])
+def test_parse_container_update_ids(value, expected):
+    assert parse_container_update_ids(value) == expected
+
+
+@pytest.mark.asyncio
+async def test_content_directory_events_invalidate_cache_and_notify():
+    content_directory = ContentDirectoryStub(didl1, update_id=1)
+    server = MediaServer(MediaServerDeviceStub(content_directory), cache=BrowseCache())
+    events = []
+
+    async def on_change(event):
+        events.append(event)
+
+    await server.subscribe_library_changes(on_change)
+    await server.browse('A')
+    await server.browse('B')
+
+    content_directory.on_event(content_directory, [FakeVariable('SystemUpdateID', '1')])
+    content_directory.on_event(content_directory,
+                               [FakeVariable('SystemUpdateID', '2'),
+                                FakeVariable('ContainerUpdateIDs', 'A,2')])
+    await asyncio.sleep(0.01)
+    assert server.browse_cache.statistics.invalidations == 1
+    assert server.browse_cache.statistics.entries == 1
+    assert events[-1] == LibraryChangeEvent(udn=server.udn, system_update_id=2, container_update_ids={'A': 2})
+
+    # unrelated variables are ignored
+    content_directory.on_event(content_directory, [FakeVariable('TransferIDs', '')])
+    await asyncio.sleep(0.01)
+    assert len(events) == 2
+
+
+@pytest.mark.asyncio
+async def test_failed_change_notifications_are_logged(caplog):
+    content_directory = ContentDirectoryStub(didl1)
+    server = MediaServer(MediaServerDeviceStub(content_directory), cache=BrowseCache())
+
+    async def notify(event):
+        raise RuntimeError('broken')
+
+    server._library_changes.notify = notify
+    content_directory.on_event(content_directory, [FakeVariable('SystemUpdateID', '1')])
+    assert len(server._change_notifications) == 1
+    await asyncio.sleep(0.01)
+    assert len(server._change_notifications) == 0
+    assert 'Notifying library changes of' in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_system_update_id_flushes_cache_without_container_updates():
+    content_directory = ContentDirectoryStub(didl1)
+    server = MediaServer(MediaServerDeviceStub(content_directory), cache=BrowseCache())
+    # the initial event of many servers, it doesn't tell whether they report changes of containers
+    content_directory.on_event(content_directory,
+                               [FakeVariable('SystemUpdateID', '1'),
+                                FakeVariable('ContainerUpdateIDs', '')])
+    await server.browse('A')
+    await server.browse('B')
+    content_directory.on_event(content_directory, [FakeVariable('SystemUpdateID', '2')])
+    assert len(server.browse_cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_lookup_cached_records():
+    content_directory = ContentDirectoryStub(didl1)
+    server = MediaServer(MediaServerDeviceStub(content_directory), cache=BrowseCache())
+    assert server.lookup_cached_records(['29$40850$40862']) == {}
+    # only records converted already are found, e.g. by having been listed
+    list((await server.browse('29$40850')).iter_records())
+    list((await server.browse('other', filter='dc:title')).iter_records())
+    found = server.lookup_cached_records(['29$40850$40862', '29$40850$0', 'unknown'])
+    assert set(found) == {'29$40850$40862', '29$40850$0'}
+    assert found['29$40850$40862'].title == 'Album1'
+    assert len(content_directory.calls) == 2
+
+    server.browse_cache.clear()
+    await server.browse('29$40850')
+    assert server.lookup_cached_records(['29$40850$40862']) == {}
+
+
+class PagingContentDirectory(ContentDirectoryStub):
+    """
+    Serves a tree of containers and items, by pages as requested.
+
+    Containers are reported with the UpdateID found in `update_ids`, if any.
+    """
+
+    def __init__(self, tree):
+        super().__init__()
+        self.tree = tree
+        self.update_ids = {}
+        self.system_update_id = None
+
+    async def async_call_action(self, action: str, **kwargs):
+        self.calls.append((action, kwargs))
+        if action == 'GetSystemUpdateID':
+            return {'Id': self.system_update_id}
+        if kwargs['ObjectID'] not in self.tree:
+            raise RuntimeError('No such object')
+        children = self.tree.get(kwargs['ObjectID'], [])
+        start, count = kwargs['StartingIndex'], kwargs['RequestedCount']
+        page = children[start:start + count] if count else children[start:]
+        elements = ''.join(
+            f'<container id="{id}" parentID="{kwargs["ObjectID"]}"><dc:title>{id}</dc:title>'
+            f'<upnp:class>object.container</upnp:class></container>' if id in self.tree else
+            f'<item id="{id}" parentID="{kwargs["ObjectID"]}"><dc:title>{id}</dc:title>'
+            f'<upnp:class>object.item.audioItem.musicTrack</upnp:class></item>' for id in page)
+        result = ('<DIDL-Lite xmlns="urn:schemas-upnp-org:metadata-1-0/DIDL-Lite/" '
+                  'xmlns:dc="http://purl.org/dc/elements/1.1/" '
+                  f'xmlns:upnp="urn:schemas-upnp-org:metadata-1-0/upnp/">{elements}</DIDL-Lite>')
+        return {
+            'Result': result,
+            'NumberReturned': len(page),
+            'TotalMatches': len(children),
+            'UpdateID': self.update_ids.get(kwargs['ObjectID'])
+        }
+
+
+tree = {
+    'artist': ['a1', 'album1', 'a2', 'album2'],
+    'album1': ['t1', 't2', 't3', 'disc2'],
+    'disc2': ['t4'],
+    'album2': ['t5', 'artist'],
+}
+
+
+async def _walk(server, *args, **kwargs):
+    return [[record.id for record in batch] async for batch in server.walk_items(*args, **kwargs)]
+
+
+@pytest.mark.asyncio
+async def test_browse_pages():
+    content_directory = PagingContentDirectory({'0': [f'i{n}' for n in range(7)]})
+    server = MediaServer(MediaServerDeviceStub(content_directory), cache=BrowseCache())
+    pages = [[record.id for record in page.records] async for page in server.browse_pages('0', page_size=3)]
+    assert pages == [['i0', 'i1', 'i2'], ['i3', 'i4', 'i5'], ['i6']]
+    assert [kwargs['StartingIndex'] for _, kwargs in content_directory.calls] == [0, 3, 6]
+
+
+@pytest.mark.asyncio
+async def test_browse_pages_stops_without_total_matches():
+    content_directory = ContentDirectoryStub(didl1)
+    server = MediaServer(MediaServerDeviceStub(content_directory), cache=BrowseCache())
+    pages = [page async for page in server.browse_pages('0', page_size=10)]
+    assert len(pages) == 1
+    assert len(content_directory.calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_walk_items():
+    server = MediaServer(MediaServerDeviceStub(PagingContentDirectory(tree)), cache=BrowseCache())
+    assert await _walk(server, 'artist', page_size=2) == [['a1'], ['a2']]
+    assert await _walk(server, 'artist', recursive=True, page_size=2) == [['a1'], ['t1', 't2'], ['t3'], ['t4'],
+                                                                          ['a2'], ['t5']]
+    assert await _walk(server, 'artist', recursive=True, max_depth=1) == [['a1'], ['t1', 't2', 't3'], ['a2'],
+                                                                          ['t5']]
+
+
+class UnreachableContentDirectory(ContentDirectoryStub):
+    """
+    Refuses all connections while `reachable` is unset.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reachable = True
+
+    async def async_call_action(self, action: str, **kwargs):
+        if not self.reachable:
+            self.calls.append(('refused', kwargs))
+            raise ConnectionRefusedError()
+        return await super().async_call_action(action, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_browse_serves_stale_results_while_server_is_unreachable():
+    clock = FakeClock()
+    content_directory = UnreachableContentDirectory(didl1)
+    server = MediaServer(MediaServerDeviceStub(content_directory),
+                         cache=BrowseCache(ttl=10, max_stale=1000, clock=clock),
+                         health=ServerHealth(failure_threshold=1, retry_interval=60, clock=clock))
+    fresh = await server.browse('A')
+    clock.now = 20
+    content_directory.reachable = False
+    with pytest.raises(ConnectionRefusedError):
+        await server.browse('A')
+    stale = await server.browse('A', allow_stale=True)
+    assert stale.stale and not fresh.stale
+    assert [x.id for x in stale.records] == [x.id for x in fresh.records]
+    assert server.health.state is HealthState.UNREACHABLE
+
+    # known to be unreachable, so neither waiting for the server nor revalidating until the retry interval elapsed
+    calls = len(content_directory.calls)
+    assert (await server.browse('A', allow_stale=True)).stale
+    with pytest.raises(ServerUnavailableError):
+        await server.browse('B', allow_stale=True)
+    await asyncio.sleep(0.01)
+    assert len(content_directory.calls) == calls
+
+    # then the stale result is still served right away, but revalidated in the background
+    clock.now = 100
+    content_directory.reachable = True
+    assert (await server.browse('A', allow_stale=True)).stale
+    await asyncio.sleep(0.01)
+    assert server.health.state is HealthState.HEALTHY
+    revalidated = await server.browse('A', allow_stale=True)
+    assert not revalidated.stale
+    assert len(content_directory.calls) == calls + 1
+
+
+def test_media_server_components_follow_settings():
+    from upnpavcontrol.core.settings import ControlPointSettings
+    settings = ControlPointSettings(browse_cache_ttl=0,
+                                    device_max_concurrency=5,
+                                    server_failure_threshold=1,
+                                    prefetch_budget=0)
+    server = MediaServer(MediaServerDeviceStub(ContentDirectoryStub(didl1)), settings=settings)
+    assert server.browse_cache.ttl == 0
+    assert server.scheduler.max_concurrency == 5
+    assert not server.prefetcher.enabled
+    server.health._record_failure(ConnectionRefusedError(), probe=False)
+    assert server.health.state is HealthState.UNREACHABLE
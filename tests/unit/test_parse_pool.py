@@ -0,0 +1,61 @@
+from upnpavcontrol.core import didllite
+from upnpavcontrol.core.mediaserver import MediaServer
+from upnpavcontrol.core.parse_pool import ParsePool
+from .test_didllite import didl1, didl_musictrack2
+from ..testsupport import ContentDirectoryStub, MediaServerDeviceStub
+import pickle
+import pytest
+
+
+def test_parse_records_result_can_be_pickled():
+    records = didllite.parse_records(didl1)
+    assert records.converted == 3
+    restored = pickle.loads(pickle.dumps(records))
+    assert restored == records
+    assert restored.index.xml == didl1
+    assert didllite.DidlLite(didl1, records=restored).fragment(1) == didllite.DidlLite(didl1).fragment(1)
+
+
+@pytest.mark.asyncio
+async def test_small_documents_are_parsed_inline():
+    pool = ParsePool(threshold=len(didl1) + 1)
+    records = await pool.parse(didllite.parse_records, didl1)
+    assert [x.title for x in records] == ['= All Songs =', 'Album1', 'Album2']
+    assert pool.inline == 1
+    assert pool.offloaded == 0
+    assert not ParsePool(threshold=None).should_offload(didl1 * 1000)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('executor_kind', ['thread', 'process'])
+async def test_large_documents_are_offloaded(executor_kind):
+    pool = ParsePool(threshold=len(didl1), executor_kind=executor_kind, max_workers=1)
+    try:
+        records = await pool.parse(didllite.parse_records, didl1)
+    finally:
+        pool.shutdown()
+    assert records == didllite.records_from_xml_string(didl1)
+    assert pool.offloaded == 1
+
+
+def test_unknown_executor_kind():
+    with pytest.raises(ValueError):
+        ParsePool(executor_kind='fibers')
+
+
+@pytest.mark.asyncio
+async def test_browse_offloads_and_caches_large_documents():
+    didllite.shared_cache.clear()
+    pool = ParsePool(threshold=len(didl_musictrack2))
+    server = MediaServer(MediaServerDeviceStub(ContentDirectoryStub(didl_musictrack2)), pool=pool)
+    didl = await server.browse('0')
+    assert didl.records.converted == len(didl.records) == 2
+    assert didl.records[0].title == 'Song Title 1'
+    assert didllite.shared_cache.cached_records(didl.xml) is didl.records
+    await server.browse('0', use_cache=False)
+    assert pool.offloaded == 1
+
+    server = MediaServer(MediaServerDeviceStub(ContentDirectoryStub(didl1)), pool=pool)
+    await server.browse('0')
+    assert pool.offloaded == 1
+    didllite.shared_cache.clear()
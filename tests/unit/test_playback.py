@@ -59,7 +59,9 @@ def test_parse_protocol_info_match(info1_str, info2_str, expected_result):
 
 
 class DmrMock(object):
-    pass
+
+    async def call_action(self, service, action, **kwargs):
+        return await service.async_call_action(action, **kwargs)
 
 
 class DmsMock(object):
@@ -78,7 +80,8 @@ async def test_play():
     dms.connection_manager = mock.Mock()
     dms.connection_manager.has_action = mock.Mock(return_value=False)
 
-    fake_didl = core.didllite.DidlLite('xmldata')
+    xmldata = '<DIDL-Lite><item id="23456"/></DIDL-Lite>'
+    fake_didl = core.didllite.DidlLite(xmldata)
     fake_didl._objects = [FakePlaybackItem()]
     dms.browse_metadata = AsyncMock(return_value=fake_didl)
 
@@ -93,6 +96,6 @@ async def test_play():
     await core.playback.play(dms, object_id, dmr)
 
     dms.browse_metadata.assert_called_once_with(object_id)
-    call1 = mock.call('SetAVTransportURI', InstanceID=0, CurrentURI='someURI', CurrentURIMetaData='xmldata')
+    call1 = mock.call('SetAVTransportURI', InstanceID=0, CurrentURI='someURI', CurrentURIMetaData=xmldata)
     call2 = mock.call('Play', InstanceID=0, Speed='1')
     dmr.av_transport.async_call_action.assert_has_calls([call1, call2])
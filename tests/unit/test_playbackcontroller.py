@@ -1,9 +1,10 @@
 import pytest
 from upnpavcontrol.core.playback.controller import PlaybackController, TransportState
-from upnpavcontrol.core.playback.queue import PlaybackQueue
+from upnpavcontrol.core.playback.queue import PlaybackQueue, PlaybackItem
 from upnpavcontrol.core.oberserver import Observable
 from upnpavcontrol.core.mediarenderer import PlaybackInfo
 from ..testsupport import AsyncMock
+import asyncio
 import typing
 
 
@@ -210,3 +211,31 @@ async def test_playing_device_stops_after_last_item(queue_with_items):
 
     assert not controller.is_playing
     assert player.state_subscription_count == 0
+
+
+async def _batches(titles, arrived: asyncio.Event = None):
+    for title in titles:
+        if arrived is not None:
+            await arrived.wait()
+        yield [PlaybackItem(dms='1234', object_id=title, title=title)]
+
+
+@pytest.mark.asyncio
+async def test_background_appends_keep_their_order_until_shutdown():
+    controller = PlaybackController(PlaybackQueue())
+    arrived = asyncio.Event()
+    controller.append_in_background(_batches(['a1', 'a2'], arrived))
+    controller.append_in_background(_batches(['b1']))
+    await asyncio.sleep(0)
+    assert controller.is_appending
+    assert controller.queue.items == []
+
+    arrived.set()
+    while controller.is_appending:
+        await asyncio.sleep(0)
+    assert [item.title for item in controller.queue.items] == ['a1', 'a2', 'b1']
+
+    controller.append_in_background(_batches(['c1'], asyncio.Event()))
+    await controller.shutdown()
+    assert not controller.is_appending
+    assert len(controller.queue.items) == 3
@@ -0,0 +1,70 @@
+from upnpavcontrol.core.mediaserver import MediaServer
+from upnpavcontrol.core.browse_cache import BrowseCache
+from upnpavcontrol.core.playback.controller import PlaybackController
+from upnpavcontrol.core.playback.queue import PlaybackQueue
+from upnpavcontrol.web import models
+from upnpavcontrol.web.api.library import create_library_item_id
+from upnpavcontrol.web.api.player import _resolve_queue_items, append_container_to_queue, set_queue_items
+from .test_didllite import didl1, didl_musictrack
+from .test_media_server import PagingContentDirectory
+from ..testsupport import ContentDirectoryStub, MediaServerDeviceStub
+import asyncio
+import pytest
+import types
+
+
+class ControlPointStub(object):
+
+    def __init__(self, server):
+        self._server = server
+
+    def get_mediaserver_by_UDN(self, udn):
+        assert udn == self._server.udn
+        return self._server
+
+
+@pytest.mark.asyncio
+async def test_resolve_queue_items_dedupes_and_uses_cached_results():
+    content_directory = ContentDirectoryStub(didl_musictrack)
+    server = MediaServer(MediaServerDeviceStub(content_directory), cache=BrowseCache())
+    content_directory.results['29$40850'] = didl1
+    # the container has been listed to the client
+    list((await server.browse('29$40850')).iter_records())
+    content_directory.calls.clear()
+
+    album = create_library_item_id(server.udn, '29$40850$40862')
+    track = create_library_item_id(server.udn, '26$40260$@40260')
+    items = [models.PlaybackQueueItem(id=id) for id in [album, track, album, track, server.udn]]
+    resolved = await _resolve_queue_items(ControlPointStub(server), items)
+
+    assert [item.title if item else None for item in resolved] == ['Album1', 'SomeTitle', 'Album1', 'SomeTitle', None]
+    assert resolved[1].album == 'SomeAlbumTitle'
+    assert [kwargs['ObjectID'] for _, kwargs in content_directory.calls] == ['26$40260$@40260']
+
+
+class SlowContentDirectory(PagingContentDirectory):
+
+    async def async_call_action(self, action: str, **kwargs):
+        await asyncio.sleep(0.01)
+        return await super().async_call_action(action, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_replacing_the_queue_cancels_all_container_walks():
+    content_directory = SlowContentDirectory({
+        'A': [f'a{n}' for n in range(250)],
+        'B': [f'b{n}' for n in range(250)],
+    })
+    server = MediaServer(MediaServerDeviceStub(content_directory), cache=BrowseCache())
+    controller = PlaybackController(PlaybackQueue())
+    control_point = ControlPointStub(server)
+    control_point.get_controller_for_renderer = lambda udn: controller
+    request = types.SimpleNamespace(app=types.SimpleNamespace(av_control_point=control_point))
+
+    for container in ['A', 'B']:
+        payload = models.PlaybackQueueContainerIn(id=create_library_item_id(server.udn, container))
+        await append_container_to_queue(request, 'renderer', payload)
+    assert len(controller.queue.items) == 100
+    await set_queue_items(request, 'renderer', models.PlaybackQueueIn(items=[]))
+    await asyncio.sleep(0.1)
+    assert controller.queue.items == []
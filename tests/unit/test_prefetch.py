@@ -0,0 +1,120 @@
+from upnpavcontrol.core.mediaserver import MediaServer
+from upnpavcontrol.core.browse_cache import BrowseCache
+from upnpavcontrol.core.device_scheduler import DeviceScheduler
+from upnpavcontrol.core.prefetch import Prefetcher
+from upnpavcontrol.core.server_health import ServerHealth
+from .test_browse_cache import FakeClock
+from .test_media_server import PagingContentDirectory
+from ..testsupport import MediaServerDeviceStub
+import asyncio
+import pytest
+
+tree = {
+    '0': ['c1', 'c2', 'c3', 'c4', 'i1', 'i2'],
+    'c1': ['t1', 't2'],
+    'c2': ['t3'],
+    'c3': ['t4'],
+    'c4': ['t5'],
+}
+
+
+def _server(content_directory, prefetcher):
+    return MediaServer(MediaServerDeviceStub(content_directory),
+                       cache=BrowseCache(),
+                       health=ServerHealth(),
+                       prefetcher=prefetcher)
+
+
+def _browsed(content_directory):
+    return [(kwargs['ObjectID'], kwargs['StartingIndex']) for _, kwargs in content_directory.calls]
+
+
+async def _browse_and_prefetch(server, object_id, starting_index=0, requested_count=0):
+    result = await server.browse(object_id, starting_index=starting_index, requested_count=requested_count)
+    server.prefetch_after(result, object_id, starting_index=starting_index, requested_count=requested_count)
+    await asyncio.sleep(0.01)
+    return result
+
+
+@pytest.mark.asyncio
+async def test_next_page_and_child_containers_are_prefetched():
+    content_directory = PagingContentDirectory(tree)
+    server = _server(content_directory, Prefetcher(max_children=2))
+    await _browse_and_prefetch(server, '0', requested_count=3)
+    assert _browsed(content_directory) == [('0', 0), ('0', 3), ('c1', 0), ('c2', 0)]
+
+    # the last page has no next page, its child container has been prefetched already
+    await _browse_and_prefetch(server, '0', starting_index=3, requested_count=3)
+    await _browse_and_prefetch(server, 'c1', requested_count=3)
+    assert _browsed(content_directory) == [('0', 0), ('0', 3), ('c1', 0), ('c2', 0), ('c4', 0)]
+    stats = server.prefetcher.statistics
+    assert (stats.scheduled, stats.completed, stats.lookups, stats.hits) == (4, 4, 3, 2)
+    assert stats.hit_rate == pytest.approx(2 / 3)
+    assert stats.accuracy == 0.5
+
+
+@pytest.mark.asyncio
+async def test_prefetching_is_limited_by_budget():
+    clock = FakeClock()
+    content_directory = PagingContentDirectory(tree)
+    server = _server(content_directory, Prefetcher(budget=2, budget_interval=10, max_children=4, clock=clock))
+    await _browse_and_prefetch(server, '0')
+    assert _browsed(content_directory) == [('0', 0), ('c1', 0), ('c2', 0)]
+    assert server.prefetcher.statistics.skipped == 2
+
+    clock.now = 5
+    await _browse_and_prefetch(server, '0', requested_count=0)
+    assert _browsed(content_directory)[3:] == [('c3', 0)]
+
+
+class GatedContentDirectory(PagingContentDirectory):
+    """
+    Answers requests only while `gate` is set.
+    """
+
+    def __init__(self, tree):
+        super().__init__(tree)
+        self.gate = asyncio.Event()
+        self.gate.set()
+
+    async def async_call_action(self, action: str, **kwargs):
+        await self.gate.wait()
+        return await super().async_call_action(action, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_interactive_request_joins_pending_prefetch():
+    content_directory = GatedContentDirectory(tree)
+    scheduler = DeviceScheduler(max_concurrency=1)
+    server = MediaServer(MediaServerDeviceStub(content_directory),
+                         cache=BrowseCache(),
+                         scheduler=scheduler,
+                         prefetcher=Prefetcher(max_children=3))
+    result = await server.browse('0')
+    content_directory.gate.clear()
+    server.prefetch_after(result, '0')
+    await asyncio.sleep(0.01)
+    assert scheduler.statistics.lanes['background'].queued == 2
+
+    # c1 has been sent already, c3 is promoted ahead of c2, still queued in the background lane
+    joined = asyncio.gather(server.browse('c1'), server.browse('c3'))
+    await asyncio.sleep(0.01)
+    content_directory.gate.set()
+    await joined
+    await asyncio.sleep(0.01)
+    assert _browsed(content_directory) == [('0', 0), ('c1', 0), ('c3', 0), ('c2', 0)]
+    assert scheduler.statistics.lanes['interactive'].admitted == 2
+    stats = server.prefetcher.statistics
+    assert (stats.lookups, stats.hits, stats.completed) == (3, 1, 3)
+
+    # neither is a promoted request counted as hit later on
+    await server.browse('c3')
+    assert server.prefetcher.statistics.hits == 1
+
+
+@pytest.mark.asyncio
+async def test_disabled_prefetcher_does_nothing():
+    content_directory = PagingContentDirectory(tree)
+    server = _server(content_directory, Prefetcher(budget=0))
+    await _browse_and_prefetch(server, '0', requested_count=3)
+    assert _browsed(content_directory) == [('0', 0)]
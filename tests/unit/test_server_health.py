@@ -0,0 +1,88 @@
+from upnpavcontrol.core.server_health import ServerHealth, HealthState, ServerUnavailableError
+from .test_browse_cache import FakeClock
+import asyncio
+import pytest
+
+
+async def _succeed():
+    return 'ok'
+
+
+async def _refuse():
+    raise ConnectionRefusedError()
+
+
+async def _time_out():
+    raise asyncio.TimeoutError()
+
+
+async def _fail_action():
+    raise RuntimeError('No such object')
+
+
+@pytest.mark.asyncio
+async def test_server_becomes_unreachable_after_consecutive_failures():
+    clock = FakeClock()
+    health = ServerHealth(failure_threshold=2, retry_interval=10, clock=clock)
+    with pytest.raises(ConnectionRefusedError):
+        await health.run(_refuse)
+    assert health.state is HealthState.DEGRADED
+    assert await health.run(_succeed) == 'ok'
+    assert health.state is HealthState.HEALTHY
+
+    for call in [_refuse, _time_out]:
+        with pytest.raises(Exception):
+            await health.run(call)
+    assert health.state is HealthState.UNREACHABLE
+    assert not health.available
+
+    clock.now = 5
+    with pytest.raises(ServerUnavailableError) as error:
+        await health.run(_succeed)
+    assert error.value.retry_in == 5
+    stats = health.statistics
+    assert (stats.consecutive_failures, stats.failures, stats.rejected, stats.retry_in) == (2, 3, 1, 5)
+    assert stats.last_error == 'TimeoutError()'
+
+
+@pytest.mark.asyncio
+async def test_errors_reported_by_the_server_count_as_success():
+    health = ServerHealth(failure_threshold=1)
+    with pytest.raises(RuntimeError):
+        await health.run(_fail_action)
+    assert health.state is HealthState.HEALTHY
+
+
+@pytest.mark.asyncio
+async def test_unreachable_server_is_probed_with_backoff():
+    clock = FakeClock()
+    health = ServerHealth(failure_threshold=1, retry_interval=10, max_retry_interval=15, clock=clock)
+    with pytest.raises(ConnectionRefusedError):
+        await health.run(_refuse)
+
+    clock.now = 10
+    assert health.available
+    answered = asyncio.Event()
+
+    async def probe_refused():
+        await answered.wait()
+        await _refuse()
+
+    probe = asyncio.ensure_future(health.run(probe_refused))
+    await asyncio.sleep(0)
+    # only a single request is let through while probing
+    assert not health.available
+    with pytest.raises(ServerUnavailableError):
+        await health.run(_succeed)
+    answered.set()
+    with pytest.raises(ConnectionRefusedError):
+        await probe
+    assert health.statistics.retry_in == 15
+
+    clock.now = 40
+    assert await health.run(_succeed) == 'ok'
+    assert health.state is HealthState.HEALTHY
+    # the retry interval starts over
+    with pytest.raises(ConnectionRefusedError):
+        await health.run(_refuse)
+    assert health.statistics.retry_in == 10
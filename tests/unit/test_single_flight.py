@@ -0,0 +1,99 @@
+from upnpavcontrol.core.single_flight import SingleFlight, call_action
+from upnpavcontrol.core.mediaserver import MediaServer, BrowseFlags
+from upnpavcontrol.core.browse_cache import BrowseCache
+from .test_didllite import didl1
+from ..testsupport import ContentDirectoryStub, MediaServerDeviceStub
+import asyncio
+import pytest
+
+
+class SlowService(object):
+    service_type = 'urn:schemas-upnp-org:service:RenderingControl:1'
+
+    def __init__(self):
+        self.calls = []
+        self.release = asyncio.Event()
+
+    async def async_call_action(self, action, **kwargs):
+        self.calls.append((action, kwargs))
+        await self.release.wait()
+        return {'CurrentVolume': len(self.calls)}
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_with_same_key_share_result():
+    flight = SingleFlight()
+    service = SlowService()
+    calls = [call_action(flight, service, 'GetVolume', InstanceID=0, Channel='Master') for _ in range(5)]
+    pending = asyncio.gather(*calls)
+    await asyncio.sleep(0)
+    service.release.set()
+    results = await pending
+    assert results == [{'CurrentVolume': 1}] * 5
+    assert len(service.calls) == 1
+    assert flight.calls == 1
+    assert flight.coalesced == 4
+    assert len(flight) == 0
+
+
+@pytest.mark.asyncio
+async def test_different_arguments_are_not_coalesced():
+    flight = SingleFlight()
+    service = SlowService()
+    pending = asyncio.gather(call_action(flight, service, 'GetVolume', InstanceID=0, Channel='Master'),
+                             call_action(flight, service, 'GetVolume', Channel='Master', InstanceID=1))
+    await asyncio.sleep(0)
+    service.release.set()
+    await pending
+    assert len(service.calls) == 2
+    assert flight.coalesced == 0
+
+
+@pytest.mark.asyncio
+async def test_actions_with_side_effects_are_not_coalesced():
+    flight = SingleFlight()
+    service = SlowService()
+    service.release.set()
+    await asyncio.gather(*[call_action(flight, service, 'SetVolume', InstanceID=0, DesiredVolume=3) for _ in range(2)])
+    assert len(service.calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_exception_is_shared_and_next_call_starts_over():
+    flight = SingleFlight()
+    attempts = []
+
+    async def failing():
+        attempts.append(1)
+        await asyncio.sleep(0)
+        raise ValueError('boom')
+
+    results = await asyncio.gather(flight.run('key', failing), flight.run('key', failing), return_exceptions=True)
+    assert [type(result) for result in results] == [ValueError, ValueError]
+    assert len(attempts) == 1
+    with pytest.raises(ValueError):
+        await flight.run('key', failing)
+    assert len(attempts) == 2
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_others():
+    flight = SingleFlight()
+    service = SlowService()
+    first = asyncio.ensure_future(call_action(flight, service, 'GetVolume', InstanceID=0))
+    second = asyncio.ensure_future(call_action(flight, service, 'GetVolume', InstanceID=0))
+    await asyncio.sleep(0)
+    first.cancel()
+    service.release.set()
+    assert await second == {'CurrentVolume': 1}
+    assert first.cancelled()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_browse_requests_share_one_action():
+    content_directory = ContentDirectoryStub(didl1)
+    server = MediaServer(MediaServerDeviceStub(content_directory), cache=BrowseCache())
+    results = await asyncio.gather(*[server.browse('0', use_cache=False) for _ in range(3)],
+                                   server.browse('0', BrowseFlags.BrowseMetadata))
+    assert len(content_directory.calls) == 2
+    assert results[0] is results[1] is results[2]
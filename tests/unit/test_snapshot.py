@@ -0,0 +1,162 @@
+from upnpavcontrol.core import AVControlPoint
+from upnpavcontrol.core.browse_cache import BrowseCache
+from upnpavcontrol.core.discovery import DiscoveryEvent, DiscoveryEventType
+from upnpavcontrol.core.notification_backend import NotificationBackend
+from upnpavcontrol.core.playback.queue import PlaybackItem
+from upnpavcontrol.core.snapshot import (ControlPointSnapshot, DeviceSnapshot, BrowseResultSnapshot, QueueSnapshot,
+                                         SnapshotStore, snapshot_browse_cache, restore_browse_cache)
+from upnpavcontrol.core.mediaserver import BrowseResult
+from async_upnp_client.client import UpnpRequester
+from .test_didllite import didl1
+from ..testsupport import NotificationTestEndpoint
+import asyncio
+import os
+import pytest
+import reactivex as rx
+
+SERVER_UDN = 'f5b1b596-c1d2-11e9-af8b-705681aa5dfd'
+SERVER_LOCATION = 'http://192.168.99.2:9000/dms.xml'
+RENDERER_UDN = '13bf6358-00b8-101b-8000-74dfbfed7306'
+RENDERER_LOCATION = 'http://192.168.99.1:5000/dmr.xml'
+
+_DOCUMENTS = {
+    SERVER_LOCATION: 'dms_99_2.xml',
+    'http://192.168.99.2:9000/plugins/UPnP/MediaServer/ContentDirectory.xml': 'dms_cds_99_2.xml',
+    'http://192.168.99.2:9000/plugins/UPnP/MediaServer/ConnectionManager.xml': 'dms_cms_99_2.xml',
+    'http://192.168.99.2:9000/plugins/UPnP/MediaServer/MediaReceiverRegistrar.xml': 'dms_mrrs_99_2.xml',
+    RENDERER_LOCATION: 'dmr_99_1.xml',
+    'http://192.168.99.1:5000/dmr_rcs.xml': 'dmr_rcs_99_1.xml',
+    'http://192.168.99.1:5000/dmr_cms.xml': 'dmr_cms_99_1.xml',
+    'http://192.168.99.1:5000/dmr_avts.xml': 'dmr_avts_99_1.xml',
+}
+
+_SOAP_RESPONSE = ('<?xml version="1.0"?><s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" '
+                  's:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/"><s:Body>'
+                  '<u:{action}Response xmlns:u="{service_type}">{arguments}</u:{action}Response></s:Body></s:Envelope>')
+
+
+class NetworkRequester(UpnpRequester):
+    """
+    Serves the device descriptions of tests/data while `online`, answers GetSystemUpdateID with `system_update_id`
+    and GetVolume.
+    """
+
+    def __init__(self, online=True):
+        self.online = online
+        self.system_update_id = 1
+        self.requests = []
+
+    async def async_http_request(self, method, url, headers=None, body=None):
+        self.requests.append((method, url))
+        if not self.online:
+            raise asyncio.TimeoutError()
+        if method == 'GET' and url in _DOCUMENTS:
+            with open(os.path.join('tests/data', _DOCUMENTS[url])) as f:
+                return 200, {}, f.read()
+        if method == 'POST':
+            service_type, action = headers['SOAPAction'].strip('"').split('#')
+            arguments = {
+                'GetSystemUpdateID': f'<Id>{self.system_update_id}</Id>',
+                'GetVolume': '<CurrentVolume>20</CurrentVolume>'
+            }
+            if action in arguments:
+                return 200, {}, _SOAP_RESPONSE.format(action=action,
+                                                      service_type=service_type,
+                                                      arguments=arguments[action])
+        return 404, {}, ''
+
+
+def _announce(discovery, udn, location, device_type):
+    discovery.on_next(
+        DiscoveryEvent(event_type=DiscoveryEventType.NEW_DEVICE,
+                       device_type=f'urn:schemas-upnp-org:device:{device_type}:1',
+                       udn=udn,
+                       location=location))
+
+
+def _control_point(requester, store):
+    discovery = rx.Subject()
+    control_point = AVControlPoint(device_discovery_events=discovery,
+                                   notifcation_backend=NotificationBackend(NotificationTestEndpoint(), requester),
+                                   requester=requester,
+                                   snapshot_store=store)
+    return control_point, discovery
+
+
+def _children_key(object_id):
+    return (object_id, 'BrowseDirectChildren', 0, 0, '*', '')
+
+
+def test_snapshot_to_json():
+    snapshot = ControlPointSnapshot(devices=[
+        DeviceSnapshot(SERVER_UDN,
+                       'urn:schemas-upnp-org:device:MediaServer:1',
+                       SERVER_LOCATION, {SERVER_LOCATION: '<root/>'},
+                       system_update_id=3,
+                       browse_results=[BrowseResultSnapshot(_children_key('0'), didl1, 2, 2, 1, ['0'])])
+    ],
+                                    queues={RENDERER_UDN: QueueSnapshot([PlaybackItem(SERVER_UDN, '1', 'Title')], 0)})
+    assert ControlPointSnapshot.from_json(snapshot.to_json()) == snapshot
+    with pytest.raises(ValueError):
+        ControlPointSnapshot.from_json('{"version": 0}')
+    with pytest.raises(ValueError):
+        ControlPointSnapshot.from_json('{"version": 1, "created": 0, "devices": [{"udn": "x"}], "queues": {}}')
+
+
+def test_snapshot_browse_cache_keeps_order_of_use():
+    cache = BrowseCache()
+    for object_id in ['A', 'B', 'C']:
+        cache.put(_children_key(object_id), BrowseResult(didl1, update_id=1), len(didl1), 1, [object_id])
+    cache.get(_children_key('A'))
+    cache.put(_children_key('ignored'), 'not a browse result', 1)
+    results = snapshot_browse_cache(cache, max_results=3)
+    assert [result.key[0] for result in results] == ['A', 'C', 'B']
+
+    restored = BrowseCache()
+    restore_browse_cache(restored, results)
+    assert [key[0] for key, _ in restored.items()] == ['A', 'C', 'B']
+    assert restored.get(_children_key('C')).update_id == 1
+    # the containers are restored as well
+    assert restored.invalidate_container('B') == 1
+    assert len(snapshot_browse_cache(cache, max_results=10, max_size=2 * len(didl1))) == 2
+
+
+@pytest.mark.asyncio
+async def test_control_point_restores_snapshot_without_requests(tmp_path):
+    store = SnapshotStore(str(tmp_path / 'snapshot.json'), confirm_timeout=0.5)
+    requester = NetworkRequester()
+    control_point, discovery = _control_point(requester, store)
+    await control_point.async_start()
+    _announce(discovery, SERVER_UDN, SERVER_LOCATION, 'MediaServer')
+    _announce(discovery, RENDERER_UDN, RENDERER_LOCATION, 'MediaRenderer')
+    await asyncio.sleep(0.1)
+    server = control_point.get_mediaserver_by_UDN(SERVER_UDN)
+    server.browse_cache.update_system_update_id(1)
+    server.browse_cache.put(_children_key('0'), BrowseResult(didl1), len(didl1), containers=['0'])
+    control_point.get_controller_for_renderer(RENDERER_UDN).queue.append(SERVER_UDN, '1', 'Title')
+    await control_point.async_stop()
+
+    offline = NetworkRequester(online=False)
+    control_point, discovery = _control_point(offline, store)
+    await control_point.async_start()
+    server = control_point.get_mediaserver_by_UDN(SERVER_UDN)
+    assert server.friendly_name == 'Footech Media Server [MyFancyCollection]'
+    assert [x.id for x in (await server.browse('0')).records] == [x.id for x in BrowseResult(didl1).records]
+    queue = control_point.get_controller_for_renderer(RENDERER_UDN).queue
+    assert [item.title for item in queue.items] == ['Title']
+    assert offline.requests == []
+
+    # the server is confirmed by discovery, its library changed meanwhile
+    offline.online = True
+    offline.system_update_id = 2
+    _announce(discovery, SERVER_UDN, SERVER_LOCATION, 'MediaServer')
+    await asyncio.sleep(0.1)
+    assert control_point.get_mediaserver_by_UDN(SERVER_UDN) is server
+    assert len(server.browse_cache) == 0
+    assert server.browse_cache.system_update_id == 2
+
+    # the renderer hasn't been announced in time
+    await asyncio.sleep(0.5)
+    assert [x.udn for x in control_point.mediarenderers] == []
+    assert [x.udn for x in control_point.mediaservers] == [SERVER_UDN]
+    await control_point.async_stop()
@@ -0,0 +1,65 @@
+import pytest
+import defusedxml
+from upnpavcontrol.core import xml_backend, didllite
+from upnpavcontrol.core.mediarenderer import PlaybackInfo, update_playback_info_from_event
+from .test_didllite import didl1, didl_musictrack, didl_musictrack2
+from .test_media_renderer import av_last_change_event, rc_last_change_event
+
+entity_expansion = """<?xml version="1.0"?>
+<!DOCTYPE root [<!ENTITY a "expanded"><!ENTITY b "&a;&a;&a;&a;">]>
+<root>&b;</root>"""
+
+external_entity = """<?xml version="1.0"?>
+<!DOCTYPE root [<!ENTITY xxe SYSTEM "file:///etc/passwd">]>
+<root>&xxe;</root>"""
+
+
+@pytest.fixture(params=xml_backend.available_backends())
+def backend(request):
+    previous = xml_backend.active_backend()
+    xml_backend.use_backend(request.param)
+    yield xml_backend.active_backend()
+    xml_backend._active_backend = previous
+
+
+def test_lxml_is_preferred_if_available():
+    pytest.importorskip('lxml')
+    assert xml_backend.create_backend().name == 'lxml'
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        xml_backend.use_backend('foo')
+
+
+@pytest.mark.parametrize("xmldata", [didl1, didl_musictrack, didl_musictrack2])
+def test_didl_parsing_is_backend_independent(backend, xmldata):
+    result = didllite.from_xml_string(xmldata)
+    xml_backend.use_backend('defusedxml')
+    assert result == didllite.from_xml_string(xmldata)
+
+
+def test_parse_string_with_encoding_declaration(backend):
+    element = xml_backend.fromstring('<?xml version="1.0" encoding="ISO-8859-1"?><root>ä</root>')
+    assert element.text == 'ä'
+    events = list(xml_backend.iterparse('<?xml version="1.0" encoding="ISO-8859-1"?><root>ä</root>'))
+    assert events[-1][1].text == 'ä'
+
+
+def test_last_change_parsing(backend):
+    info = PlaybackInfo()
+    assert update_playback_info_from_event(info, rc_last_change_event)
+    assert update_playback_info_from_event(info, av_last_change_event)
+    assert info.volume_percent == 21
+    assert info.title == 'SomeTitle'
+
+
+@pytest.mark.parametrize("xmldata", [entity_expansion, external_entity])
+def test_entities_are_not_resolved(backend, xmldata):
+    try:
+        element = xml_backend.fromstring(xmldata)
+    except defusedxml.DefusedXmlException:
+        assert backend.name == 'defusedxml'
+        return
+    assert 'expanded' not in xml_backend.tostring(element)
+    assert 'root:' not in xml_backend.tostring(element)
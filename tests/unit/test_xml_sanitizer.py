@@ -0,0 +1,65 @@
+from upnpavcontrol.core import didllite
+from upnpavcontrol.core.xml_sanitizer import sanitize_entities, EntitySanitizer, iter_sanitized
+from . import malformed_didl_data
+import pytest
+
+malformed_documents = [
+    malformed_didl_data.unescaped_ampersands, malformed_didl_data.mixed_references,
+    malformed_didl_data.html_entities, malformed_didl_data.dangling_ampersand
+]
+
+
+@pytest.mark.parametrize('text,expected', [
+    ('Simon & Garfunkel', 'Simon &amp; Garfunkel'),
+    ('&amp;&lt;&gt;&quot;&apos;', '&amp;&lt;&gt;&quot;&apos;'),
+    ('&#39;&#x2013;&#X41;', '&#39;&#x2013;&amp;#X41;'),
+    ('&nbsp;&amp', '&amp;nbsp;&amp;amp'),
+    ('&', '&amp;'),
+    ('&&amp;', '&amp;&amp;'),
+])
+def test_sanitize_entities(text, expected):
+    assert sanitize_entities(text) == expected
+
+
+def test_sanitize_entities_does_not_copy_valid_documents():
+    text = 'Tom &amp; Jerry' * 1000
+    assert sanitize_entities(text) is text
+
+
+@pytest.mark.parametrize('xmldata', malformed_documents)
+@pytest.mark.parametrize('chunk_size', [1, 2, 5, 7, 64, 4096])
+def test_sanitizer_chunked_matches_whole_document(xmldata, chunk_size):
+    chunks = [xmldata[i:i + chunk_size] for i in range(0, len(xmldata), chunk_size)]
+    assert ''.join(iter_sanitized(chunks)) == sanitize_entities(xmldata)
+
+
+def test_sanitizer_gives_up_on_long_references():
+    sanitizer = EntitySanitizer()
+    assert sanitizer.feed('a & ' + 'b' * 100) == 'a &amp; ' + 'b' * 100
+    assert sanitizer.feed('&am') == ''
+    assert sanitizer.feed('p;') == '&amp;'
+    assert sanitizer.close() == ''
+
+
+def test_malformed_documents_parse_after_sanitizing():
+    track = didllite.from_xml_string(sanitize_entities(malformed_didl_data.unescaped_ampersands))[0]
+    assert track.title == 'Bridge Over Troubled Water & Other Songs'
+    assert track.artist == 'Simon & Garfunkel'
+    assert track.albumArtURI.uri == 'http://192.168.1.10:9000/art?id=12&size=300'
+    assert track.res[0].uri == 'http://192.168.1.10:9000/stream?id=12&format=flac&seek=0'
+
+    track = didllite.from_xml_string(sanitize_entities(malformed_didl_data.mixed_references))[0]
+    assert track.title == '"Heroes" \'77 – Bowie & Eno & Friends \'Live\''
+
+    track = didllite.from_xml_string(sanitize_entities(malformed_didl_data.html_entities))[0]
+    assert track.title == 'Café del Mar'
+
+    album = didllite.from_xml_string(sanitize_entities(malformed_didl_data.dangling_ampersand))[0]
+    assert album.title == 'Rock &'
+
+
+def test_sanitizer_throughput_is_linear():
+    # guards against pathological backtracking, a few MB must be processed in one go
+    xmldata = malformed_didl_data.mixed_references * 5000
+    assert len(sanitize_entities(xmldata)) > len(xmldata)
+    assert len(''.join(iter_sanitized(xmldata[i:i + 8192] for i in range(0, len(xmldata), 8192)))) > len(xmldata)
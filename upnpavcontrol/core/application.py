@@ -1,15 +1,21 @@
 from upnpavcontrol.core.discovery import MediaDeviceDiscoveryEvent, MediaDeviceType
-from .discovery import create_discovery_event_observable, DiscoveryEvent
+from .discovery import create_discovery_event_observable, DiscoveryEvent, DiscoveryEventType
 from .discovery.events import filter_lost_device_events, filter_mediarenderer_events
 from .discovery.events import filter_mediaserver_events, filter_new_device_events
+from .discovery.utils import is_media_server, is_media_renderer
 from .mediarenderer import create_media_renderer, MediaRenderer
-from .mediaserver import MediaServer
+from .mediaserver import MediaServer, create_media_server
+from .library_indexer import LibraryIndexer
 from .playback.controller import PlaybackController
+from .playback.queue import PlaybackQueue
 from .playback.utils import PlaybackControllableWrapper
 from .notification_backend import NotificationBackend, AiohttpNotificationEndpoint
+from .settings import ControlPointSettings
+from . import snapshot
+from .snapshot import DescriptionRecorder, DeviceSnapshot, SnapshotStore
 from async_upnp_client.aiohttp import AiohttpRequester
 from async_upnp_client.client_factory import UpnpFactory
-from async_upnp_client.client import UpnpDevice
+from async_upnp_client.client import UpnpDevice, UpnpRequester
 from typing import Callable, Coroutine, Union, Dict, Optional, Any
 from .oberserver import Observable
 from .typing_compat import Protocol
@@ -18,6 +24,7 @@ import reactivex as rx
 import reactivex.operators as rxoperators
 from reactivex.scheduler.eventloop import AsyncIOScheduler
 import asyncio
+import time
 
 _logger = logging.getLogger(__name__)
 
@@ -39,19 +46,43 @@ class UpnpDeviceFactory(Protocol):
 
 
 class AVControlPoint(object):
+    """
+    Keeps track of all media servers and renderers on the network.
+
+    With a `snapshot_store`, the known devices, browse results and playback queues are saved periodically and on
+    `async_stop`, and restored by `async_start` (see `snapshot`). Restored devices are available right away,
+    but unconfirmed until discovery announces them again: only then the control point subscribes to their events
+    and starts indexing, restored browse results are dropped if the library changed meanwhile. Restored devices
+    not announced within the store's `confirm_timeout` are considered gone. Device descriptions can only be saved
+    if created by the default device factory, which uses `requester` for all requests to the devices.
+
+    The browse cache, request scheduling, health tracking and prefetching of the discovered devices are set up
+    according to `settings`.
+    """
 
     def __init__(self,
                  device_discovery_events: Optional[rx.Observable] = None,
                  notifcation_backend=None,
-                 device_factory: Optional[UpnpDeviceFactory] = None):
+                 device_factory: Optional[UpnpDeviceFactory] = None,
+                 library_indexer: Optional[LibraryIndexer] = None,
+                 snapshot_store: Optional[SnapshotStore] = None,
+                 requester: Optional[UpnpRequester] = None,
+                 settings: Optional[ControlPointSettings] = None):
+        self._settings = settings if settings is not None else ControlPointSettings()
         self._device_discover_observer = Observable[MediaDeviceDiscoveryEvent]()
         self._renderers: Dict[str, MediaRenderer] = {}
         self._servers: Dict[str, MediaServer] = {}
         self._playback_controller: Dict[str, PlaybackController] = {}
+        self._library_indexer = library_indexer
+        self._descriptions = DescriptionRecorder(requester or AiohttpRequester())
         if device_factory is None:
-            self._upnp_device_factory = UpnpFactory(AiohttpRequester())
+            self._upnp_device_factory = UpnpFactory(self._descriptions)
         else:
-            self._upnp_device_factory = device_factory or UpnpFactory(AiohttpRequester())
+            self._upnp_device_factory = device_factory
+        self._snapshot_store = snapshot_store
+        # restored devices not yet announced by discovery, by UDN
+        self._unconfirmed: Dict[str, DeviceSnapshot] = {}
+        self._snapshot_tasks: list = []
         self._setup_discovery(device_discovery_events)
 
         self._active_renderer = None
@@ -67,6 +98,14 @@ class AVControlPoint(object):
     def get_mediaserver_by_UDN(self, udn: str) -> MediaServer:
         return self._servers[udn]
 
+    @property
+    def library_indexer(self) -> Optional[LibraryIndexer]:
+        return self._library_indexer
+
+    @property
+    def settings(self) -> ControlPointSettings:
+        return self._settings
+
     @property
     def mediarenderers(self):
         return self._renderers.values()
@@ -82,6 +121,12 @@ class AVControlPoint(object):
 
     async def async_start(self):
         _logger.debug("Start Control Point core")
+        if self._snapshot_store is not None:
+            await self._restore_snapshot(self._snapshot_store)
+            self._snapshot_tasks = [
+                asyncio.create_task(self._save_snapshots(self._snapshot_store)),
+                asyncio.create_task(self._expire_unconfirmed(self._snapshot_store.confirm_timeout))
+            ]
         self._discovery_subscription = self._device_discovery_events.connect()
         await self._notify_receiver.async_start()
 
@@ -89,23 +134,128 @@ class AVControlPoint(object):
         if self._discovery_subscription is not None:
             self._discovery_subscription.dispose()
             self._discovery_subscription = None
+        for task in self._snapshot_tasks:
+            task.cancel()
+        await asyncio.gather(*self._snapshot_tasks, return_exceptions=True)
+        self._snapshot_tasks = []
+        await asyncio.gather(*[controller.shutdown() for controller in self._playback_controller.values()])
+        if self._snapshot_store is not None:
+            await self._save_snapshot(self._snapshot_store)
         await self._notify_receiver.async_stop()
+        if self._library_indexer is not None:
+            await self._library_indexer.stop_all()
 
     async def _notify_discovery(self, event: MediaDeviceDiscoveryEvent):
         await self._device_discover_observer.notify(event)
 
+    def create_snapshot(self, max_browse_results: int = snapshot.DEFAULT_MAX_BROWSE_RESULTS):
+        """
+        Snapshot of the current state, see `snapshot.ControlPointSnapshot`.
+        """
+        devices = []
+        for udn, device in list(self._servers.items()) + list(self._renderers.items()):
+            documents = self._descriptions.documents(device.upnp_device)
+            if documents is None:
+                continue
+            entry = DeviceSnapshot(udn=udn,
+                                   device_type=device.upnp_device.device_type,
+                                   location=device.upnp_device.device_url,
+                                   documents=documents)
+            if isinstance(device, MediaServer):
+                entry.system_update_id = device.browse_cache.system_update_id
+                if entry.system_update_id is not None:
+                    # results can't be validated after a restart otherwise
+                    entry.browse_results = snapshot.snapshot_browse_cache(device.browse_cache, max_browse_results)
+            devices.append(entry)
+        queues = {
+            udn: snapshot.snapshot_queue(controller.queue)
+            for udn, controller in self._playback_controller.items() if isinstance(controller.queue, PlaybackQueue)
+        }
+        return snapshot.ControlPointSnapshot(devices=devices, queues=queues)
+
+    async def _save_snapshot(self, store: SnapshotStore):
+        try:
+            await store.save(self.create_snapshot(store.max_browse_results))
+        except Exception:
+            _logger.exception('Failed to save snapshot to %s', store.path)
+
+    async def _save_snapshots(self, store: SnapshotStore):
+        while True:
+            await asyncio.sleep(store.interval)
+            await self._save_snapshot(store)
+
+    async def _restore_snapshot(self, store: SnapshotStore):
+        saved = await store.load()
+        if saved is None:
+            return
+        for device in saved.devices:
+            try:
+                with self._descriptions.preloaded(device.documents):
+                    raw_device = await self._upnp_device_factory.async_create_device(device.location)
+            except Exception as e:
+                _logger.warning('Failed to restore device %s from snapshot: %r', device.udn, e)
+                continue
+            if is_media_server(device.device_type):
+                server = MediaServer(raw_device, notification_backend=self._notify_receiver, settings=self._settings)
+                if device.system_update_id is not None:
+                    server.browse_cache.update_system_update_id(device.system_update_id)
+                    snapshot.restore_browse_cache(server.browse_cache, device.browse_results)
+                self._servers[device.udn] = server
+                device_type = MediaDeviceType.MEDIASERVER
+            elif is_media_renderer(device.device_type):
+                renderer = MediaRenderer(raw_device, self._notify_receiver, settings=self._settings)
+                self._renderers[device.udn] = renderer
+                await self._setup_playback_controller(device.udn, renderer, PlaybackQueue())
+                device_type = MediaDeviceType.MEDIARENDERER
+            else:
+                continue
+            self._unconfirmed[device.udn] = device
+            await self._notify_discovery(
+                MediaDeviceDiscoveryEvent(event_type=DiscoveryEventType.NEW_DEVICE,
+                                          device_type=device_type,
+                                          udn=device.udn,
+                                          friendly_name=raw_device.friendly_name))
+        for udn, queue in saved.queues.items():
+            controller = self._playback_controller.get(udn)
+            if controller is not None and isinstance(controller.queue, PlaybackQueue):
+                controller.queue.restore(queue.items, queue.current_item_index)
+        _logger.info('Restored %d devices from snapshot of %s', len(self._unconfirmed),
+                     time.strftime('%c', time.localtime(saved.created)))
+
+    async def _expire_unconfirmed(self, timeout: float):
+        await asyncio.sleep(timeout)
+        for udn, device in list(self._unconfirmed.items()):
+            _logger.info('Restored device %s has not been discovered, considering it gone', udn)
+            lost = DiscoveryEvent(event_type=DiscoveryEventType.DEVICE_LOST, device_type=device.device_type, udn=udn)
+            if is_media_server(device.device_type):
+                await self._remove_server(lost)
+            else:
+                await self._remove_renderer(lost)
+
+    async def _setup_playback_controller(self, udn: str, renderer: MediaRenderer, queue: Optional[PlaybackQueue]):
+        controller = PlaybackController(queue)
+        self._playback_controller[udn] = controller
+        wrapped_device = PlaybackControllableWrapper(renderer, self.get_mediaserver_by_UDN)
+        await controller.setup_player(wrapped_device)
+
     async def _add_renderer(self, event: DiscoveryEvent):
         if event.location is None:
             _logger.warning("Server description has no location, ignoring")
             return
-        _logger.debug("Loading renderer description from %s", event.location)
-        raw_device = await self._upnp_device_factory.async_create_device(event.location)
-        renderer = await create_media_renderer(raw_device, self._notify_receiver)
-        self._renderers[event.udn] = renderer
-        self._playback_controller[event.udn] = PlaybackController()
-        wrapped_device = PlaybackControllableWrapper(renderer, self.get_mediaserver_by_UDN)
-        await self._playback_controller[event.udn].setup_player(wrapped_device)
-        _logger.info("New renderer %s [%s]", renderer.friendly_name, renderer.udn)
+        restored = self._unconfirmed.pop(event.udn, None)
+        if restored is not None and restored.location == event.location and event.udn in self._renderers:
+            renderer = self._renderers[event.udn]
+            await renderer.refresh_playback_info()
+            _logger.info("Restored renderer confirmed %s [%s]", renderer.friendly_name, renderer.udn)
+        else:
+            _logger.debug("Loading renderer description from %s", event.location)
+            raw_device = await self._upnp_device_factory.async_create_device(event.location)
+            renderer = await create_media_renderer(raw_device, self._notify_receiver, self._settings)
+            self._renderers[event.udn] = renderer
+            # a restored renderer moved to another location, keep its queue
+            previous = self._playback_controller.get(event.udn) if restored is not None else None
+            await self._setup_playback_controller(event.udn, renderer, previous.queue if previous else None)
+            _logger.info("New renderer %s [%s]", renderer.friendly_name, renderer.udn)
         forward_event = MediaDeviceDiscoveryEvent(event_type=event.event_type,
                                                   device_type=MediaDeviceType.MEDIARENDERER,
                                                   udn=event.udn,
@@ -116,7 +266,8 @@ class AVControlPoint(object):
         if event.udn not in self._renderers:
             return
         renderer = self._renderers.pop(event.udn)
-        self._playback_controller.pop(event.udn)
+        await self._playback_controller.pop(event.udn).shutdown()
+        self._unconfirmed.pop(event.udn, None)
         _logger.info("Renderer gone %s [%s]", renderer.friendly_name, renderer.udn)
         forward_event = MediaDeviceDiscoveryEvent(event_type=event.event_type,
                                                   device_type=MediaDeviceType.MEDIARENDERER,
@@ -128,22 +279,51 @@ class AVControlPoint(object):
         if event.location is None:
             _logger.warning("Server description has no location, ignoring")
             return
-        _logger.debug("Loading server description from: %s", event.location)
-        raw_device = await self._upnp_device_factory.async_create_device(event.location)
-        server = MediaServer(raw_device)
-        self._servers[event.udn] = MediaServer(raw_device)
-        _logger.info("New server %s [%s]", server.friendly_name, server.udn)
+        restored = self._unconfirmed.pop(event.udn, None)
+        if restored is not None and restored.location == event.location and event.udn in self._servers:
+            server = self._servers[event.udn]
+            await self._validate_restored_cache(server)
+            await server._enable_notifications()
+            _logger.info("Restored server confirmed %s [%s]", server.friendly_name, server.udn)
+        else:
+            _logger.debug("Loading server description from: %s", event.location)
+            raw_device = await self._upnp_device_factory.async_create_device(event.location)
+            server = await create_media_server(raw_device, self._notify_receiver, self._settings)
+            self._servers[event.udn] = server
+            _logger.info("New server %s [%s]", server.friendly_name, server.udn)
+        if self._library_indexer is not None:
+            self._library_indexer.start(server)
         forward_event = MediaDeviceDiscoveryEvent(event_type=event.event_type,
                                                   device_type=MediaDeviceType.MEDIASERVER,
                                                   udn=event.udn,
                                                   friendly_name=server.friendly_name)
         await self._notify_discovery(forward_event)
 
+    async def _validate_restored_cache(self, server: MediaServer):
+        restored_id = server.browse_cache.system_update_id
+        if restored_id is None or len(server.browse_cache) == 0:
+            return
+        try:
+            # not subscribed to events yet, so this asks the server
+            system_update_id = await server.get_system_update_id()
+        except Exception as e:
+            _logger.warning('Failed to validate restored browse results of %s: %r', server.friendly_name, e)
+            return
+        if system_update_id != restored_id:
+            _logger.info('Library of %s changed since the snapshot, dropping restored browse results',
+                         server.friendly_name)
+            server.browse_cache.invalidate_all()
+        if system_update_id is not None:
+            server.browse_cache.update_system_update_id(system_update_id)
+
     async def _remove_server(self, event: DiscoveryEvent):
         if event.udn not in self._servers:
             return
         server = self._servers.pop(event.udn)
+        self._unconfirmed.pop(event.udn, None)
         _logger.info("Server gone %s [%s]", server.friendly_name, server.udn)
+        if self._library_indexer is not None:
+            self._library_indexer.stop(event.udn)
         forward_event = MediaDeviceDiscoveryEvent(event_type=event.event_type,
                                                   device_type=MediaDeviceType.MEDIASERVER,
                                                   udn=event.udn,
@@ -0,0 +1,277 @@
+"""
+Cache for the results of ContentDirectory Browse actions.
+
+Results are cached per media server for a limited time and invalidated as soon as the server
+announces changes of the affected containers by their update IDs. Expired results may be retained for
+a while longer, to be served as stale results while the server is unreachable.
+"""
+from dataclasses import dataclass
+import time
+import typing
+from .cache import LRUCache, CacheStatistics
+
+#: seconds a browse result is considered valid, if not invalidated before
+DEFAULT_TTL = 300.0
+#: seconds expired results are retained for `BrowseCache.get_stale`, if enabled
+DEFAULT_MAX_STALE = 24 * 3600.0
+DEFAULT_MAX_ENTRIES = 256
+#: accumulated size (in characters of the DIDL-Lite documents) of all entries of a cache
+DEFAULT_MAX_SIZE = 16 * 1024 * 1024
+
+#: object id, browse flag, starting index, requested count, filter, sort criteria
+BrowseKey = typing.Tuple[str, str, int, int, str, str]
+#: key, value, update ID and containers of a cached result
+ExportedEntry = typing.Tuple[BrowseKey, typing.Any, typing.Optional[int], typing.Tuple[str, ...]]
+
+
+@dataclass
+class BrowseCacheStatistics(CacheStatistics):
+    """
+    Cache statistics extended by browse specific counters.
+
+    Attributes
+    ----------
+    expirations : int
+        Number of entries dropped because their time to live elapsed
+    invalidations : int
+        Number of entries dropped due to changed update IDs
+    bypasses : int
+        Number of browse requests that explicitly bypassed the cache
+    stale_hits : int
+        Number of expired results served by `get_stale`
+    """
+    expirations: int = 0
+    invalidations: int = 0
+    bypasses: int = 0
+    stale_hits: int = 0
+
+
+@dataclass
+class _Entry:
+    expires: float
+    value: typing.Any
+    update_id: typing.Optional[int]
+    containers: typing.Tuple[str, ...]
+
+
+class BrowseCache(object):
+    """
+    TTL and size bounded LRU cache for browse results.
+
+    Each entry is associated with the containers whose modification would change the result:
+    the browsed container for BrowseDirectChildren, the object itself and its parent for BrowseMetadata.
+    `invalidate_container` drops exactly these entries, `invalidate_all` everything.
+
+    Parameters
+    ----------
+    ttl : float
+        Seconds an entry is valid, `get` never returns expired entries
+    max_stale : float
+        Seconds expired entries are retained for `get_stale` (still bounded by `max_entries` and `max_size`),
+        none by default
+    max_entries : int
+        Maximum number of cached results
+    max_size : int
+        Maximum accumulated size of all cached results
+    clock : callable
+        Source of the current time, in seconds
+    """
+
+    def __init__(self,
+                 ttl: float = DEFAULT_TTL,
+                 max_entries: int = DEFAULT_MAX_ENTRIES,
+                 max_size: int = DEFAULT_MAX_SIZE,
+                 clock: typing.Callable[[], float] = time.monotonic,
+                 max_stale: float = 0.0):
+        self._ttl = ttl
+        self._max_stale = max_stale
+        self._clock = clock
+        self._entries: LRUCache[BrowseKey, _Entry] = LRUCache(max_entries=max_entries, max_size=max_size)
+        self._keys_by_container: typing.Dict[str, typing.Set[BrowseKey]] = {}
+        self._system_update_id: typing.Optional[int] = None
+        self._hits = 0
+        self._misses = 0
+        self._expirations = 0
+        self._invalidations = 0
+        self._bypasses = 0
+        self._stale_hits = 0
+
+    @property
+    def ttl(self) -> float:
+        return self._ttl
+
+    @property
+    def statistics(self) -> BrowseCacheStatistics:
+        stats = self._entries.statistics
+        return BrowseCacheStatistics(hits=self._hits,
+                                     misses=self._misses,
+                                     evictions=stats.evictions,
+                                     entries=stats.entries,
+                                     size=stats.size,
+                                     expirations=self._expirations,
+                                     invalidations=self._invalidations,
+                                     bypasses=self._bypasses,
+                                     stale_hits=self._stale_hits)
+
+    @property
+    def system_update_id(self) -> typing.Optional[int]:
+        return self._system_update_id
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key: BrowseKey) -> bool:
+        # like `items`, neither marks the entry as used nor accounts a hit or miss
+        entry = self._entries.peek(key)
+        return entry is not None and entry.expires > self._clock()
+
+    def get(self, key: BrowseKey) -> typing.Any:
+        """
+        The cached result for `key`, or `None` if there is no valid one.
+        """
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires <= self._clock():
+            if entry.expires + self._max_stale <= self._clock():
+                self._entries.pop(key)
+                self._expirations += 1
+            entry = None
+        if entry is None:
+            self._misses += 1
+            return None
+        self._hits += 1
+        return entry.value
+
+    def get_stale(self, key: BrowseKey) -> typing.Any:
+        """
+        The cached result for `key` even if it expired up to `max_stale` seconds ago, or `None`.
+
+        Meant as fallback if the server can't be asked for a valid result. Results outdated according
+        to the update IDs announced by the server have been dropped already and are never returned.
+        """
+        entry = self._entries.peek(key)
+        if entry is None or entry.expires + self._max_stale <= self._clock():
+            return None
+        self._stale_hits += 1
+        return entry.value
+
+    def put(self,
+            key: BrowseKey,
+            value: typing.Any,
+            size: int,
+            update_id: typing.Optional[int] = None,
+            containers: typing.Iterable[str] = ()):
+        """
+        Cache `value` for `key`.
+
+        Parameters
+        ----------
+        size : int
+            Size of the result, e.g. the length of its DIDL-Lite document
+        update_id : int, optional
+            The UpdateID returned along with the result. Cached results of the same object
+            with a different update ID are outdated and will be dropped.
+        containers : iterable of str
+            IDs of the containers whose modification invalidates this result
+        """
+        if self._ttl <= 0:
+            return
+        object_id = key[0]
+        if update_id is not None:
+            outdated = [
+                other for other in self._keys_by_container.get(object_id, ())
+                if other[0] == object_id and self._has_other_update_id(other, update_id)
+            ]
+            self._drop(outdated)
+        containers = tuple(containers)
+        self._entries.put(key, _Entry(self._clock() + self._ttl, value, update_id, containers), size)
+        for container in containers:
+            self._keys_by_container.setdefault(container, set()).add(key)
+        self._prune_index()
+
+    def items(self) -> typing.Iterator[typing.Tuple[BrowseKey, typing.Any]]:
+        """
+        Iterate all valid entries, most recently used first.
+
+        Other than `get`, this neither marks the entries as used nor accounts hits or misses.
+        """
+        now = self._clock()
+        for key, entry in self._entries.items():
+            if entry.expires > now:
+                yield key, entry.value
+
+    def export(self) -> typing.Iterator[ExportedEntry]:
+        """
+        Iterate all valid entries like `items`, along with the update ID and containers they have been put with.
+        """
+        now = self._clock()
+        for key, entry in self._entries.items():
+            if entry.expires > now:
+                yield key, entry.value, entry.update_id, entry.containers
+
+    def bypass(self):
+        """
+        Account a browse request that didn't use the cache.
+        """
+        self._bypasses += 1
+
+    def invalidate_container(self, container_id: str, update_id: typing.Optional[int] = None) -> int:
+        """
+        Drop all results affected by a modification of the given container.
+
+        If `update_id` is given, results of the container itself which have been returned with the very same
+        update ID are kept. Returns the number of dropped entries.
+        """
+        keys = self._keys_by_container.pop(container_id, set())
+        kept = {key for key in keys if key[0] == container_id and not self._has_other_update_id(key, update_id)}
+        if kept:
+            self._keys_by_container[container_id] = kept
+        return self._drop(keys - kept)
+
+    def update_system_update_id(self, system_update_id: int, precise: bool = False) -> int:
+        """
+        Track the server's SystemUpdateID, all results are dropped when it changes.
+
+        Set `precise` if the server reports changes by container (ContainerUpdateIDs) as well,
+        so only the affected results have already been dropped. Returns the number of dropped entries.
+        """
+        previous, self._system_update_id = self._system_update_id, system_update_id
+        if previous is None or previous == system_update_id or precise:
+            return 0
+        return self.invalidate_all()
+
+    def invalidate_all(self) -> int:
+        count = len(self._entries)
+        self._invalidations += count
+        self._entries.clear()
+        self._keys_by_container.clear()
+        return count
+
+    def clear(self):
+        self._entries.clear()
+        self._keys_by_container.clear()
+
+    def _has_other_update_id(self, key: BrowseKey, update_id: typing.Optional[int]) -> bool:
+        if update_id is None:
+            return True
+        entry = self._entries.peek(key)
+        return entry is None or entry.update_id != update_id
+
+    def _drop(self, keys: typing.Iterable[BrowseKey]) -> int:
+        count = 0
+        for key in keys:
+            if self._entries.pop(key) is not None:
+                count += 1
+        self._invalidations += count
+        return count
+
+    def _prune_index(self):
+        # evicted entries leave their keys behind, rebuild the index once it grew too much
+        indexed = sum(len(keys) for keys in self._keys_by_container.values())
+        if indexed <= 4 * self._entries.max_entries:
+            return
+        for container, keys in list(self._keys_by_container.items()):
+            cached = {key for key in keys if key in self._entries}
+            if cached:
+                self._keys_by_container[container] = cached
+            else:
+                del self._keys_by_container[container]
@@ -0,0 +1,136 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+import typing
+
+K = typing.TypeVar('K')
+V = typing.TypeVar('V')
+
+
+@dataclass
+class CacheStatistics:
+    """
+    Counters describing the effectiveness of a cache.
+
+    Attributes
+    ----------
+    hits : int
+        Number of lookups that have been answered from the cache
+    misses : int
+        Number of lookups for keys not present in the cache
+    evictions : int
+        Number of entries dropped to stay within the configured bounds
+    entries : int
+        Number of entries currently stored
+    size : int
+        Accumulated size of all entries currently stored
+    """
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    entries: int = 0
+    size: int = 0
+
+
+class LRUCache(typing.Generic[K, V]):
+    """
+    A size aware least recently used cache.
+
+    The cache is bounded both by the number of entries and by the accumulated size of all entries.
+    The size of an entry is provided by the caller upon insertion, its meaning (e.g. bytes) is up to the caller.
+    If any bound is exceeded, the least recently used entries are evicted.
+    """
+
+    def __init__(self, max_entries: int = 128, max_size: typing.Optional[int] = None):
+        self._entries: 'OrderedDict[K, typing.Tuple[V, int]]' = OrderedDict()
+        self._max_entries = max_entries
+        self._max_size = max_size
+        self._size = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @property
+    def max_entries(self):
+        return self._max_entries
+
+    @property
+    def max_size(self):
+        return self._max_size
+
+    @property
+    def statistics(self) -> CacheStatistics:
+        return CacheStatistics(hits=self._hits,
+                               misses=self._misses,
+                               evictions=self._evictions,
+                               entries=len(self._entries),
+                               size=self._size)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key: K):
+        return key in self._entries
+
+    def accepts(self, size: int) -> bool:
+        """
+        Check if an entry of the given size could be stored at all.
+        """
+        return self._max_size is None or size <= self._max_size
+
+    def get(self, key: K, default: typing.Optional[V] = None) -> typing.Optional[V]:
+        """
+        Lookup the value for `key`, marking it as most recently used.
+
+        Returns `default` if there's no entry for `key`.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self._misses += 1
+            return default
+        self._hits += 1
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def peek(self, key: K, default: typing.Optional[V] = None) -> typing.Optional[V]:
+        """
+        Lookup the value for `key` without marking it as used or accounting a hit or miss.
+        """
+        entry = self._entries.get(key)
+        return default if entry is None else entry[0]
+
+    def put(self, key: K, value: V, size: int = 1):
+        """
+        Store `value` for `key`, evicting least recently used entries as required.
+
+        Values larger than `max_size` will not be stored at all.
+        """
+        self.pop(key)
+        if not self.accepts(size):
+            return
+        self._entries[key] = (value, size)
+        self._size += size
+        while len(self._entries) > self._max_entries or (self._max_size is not None and self._size > self._max_size):
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._size -= evicted_size
+            self._evictions += 1
+
+    def items(self) -> typing.Iterator[typing.Tuple[K, V]]:
+        """
+        Iterate all entries, most recently used first, without marking them as used.
+        """
+        for key, (value, _) in reversed(list(self._entries.items())):
+            yield key, value
+
+    def pop(self, key: K, default: typing.Optional[V] = None) -> typing.Optional[V]:
+        """
+        Remove the entry for `key`, if any, and return its value.
+        """
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return default
+        self._size -= entry[1]
+        return entry[0]
+
+    def clear(self):
+        self._entries.clear()
+        self._size = 0
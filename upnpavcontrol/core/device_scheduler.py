@@ -0,0 +1,266 @@
+"""
+Scheduling of the actions sent to a single UPnP device.
+
+Many devices, especially cheap media servers, fail as soon as they have to handle more than two or three
+concurrent SOAP requests. Each device therefore gets a `DeviceScheduler`, which limits the number of concurrent
+actions and queues all others by priority:
+
+* `Priority.INTERACTIVE`: requests of a user waiting for the response, e.g. browsing the library
+* `Priority.PLAYBACK`: playback control, e.g. starting the next item of the queue
+* `Priority.BACKGROUND`: work nobody is waiting for, e.g. prefetching or indexing
+
+Requests of the same priority are served in order of arrival. To prevent starvation, a queued request is
+served before all others once it waited longer than the scheduler's `max_wait`, regardless of its priority.
+A queued request can be promoted to a higher priority (see `DeviceScheduler.promote`), e.g. when a user
+starts waiting for the result of a prefetch request.
+
+The priority is taken from the current context (see `with_priority`), so it doesn't need to be passed down
+through all layers between the origin of some work and the actions it causes.
+"""
+import asyncio
+import collections
+import contextlib
+import contextvars
+import enum
+import logging
+import time
+import typing
+import weakref
+from dataclasses import dataclass, field
+
+_logger = logging.getLogger(__name__)
+
+T = typing.TypeVar('T')
+
+DEFAULT_MAX_CONCURRENCY = 2
+#: seconds after which a queued request is served regardless of its priority
+DEFAULT_MAX_WAIT = 5.0
+
+
+class Priority(enum.IntEnum):
+    INTERACTIVE = 0
+    PLAYBACK = 1
+    BACKGROUND = 2
+
+
+_current_priority: contextvars.ContextVar[Priority] = contextvars.ContextVar('priority', default=Priority.INTERACTIVE)
+
+
+def current_priority() -> Priority:
+    return _current_priority.get()
+
+
+@contextlib.contextmanager
+def with_priority(priority: Priority):
+    """
+    Run all device actions within the context (including tasks created meanwhile) with the given priority.
+    """
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+@dataclass
+class LaneStatistics(object):
+    """
+    Statistics of all requests of a single priority.
+
+    Attributes
+    ----------
+    queued : int
+        Number of requests currently waiting
+    max_queued : int
+        Maximum number of requests waiting at the same time
+    admitted : int
+        Number of requests that have been admitted
+    total_wait : float
+        Accumulated seconds the admitted requests waited
+    max_wait : float
+        Maximum seconds a single request waited
+    """
+    queued: int = 0
+    max_queued: int = 0
+    admitted: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+
+    @property
+    def mean_wait(self) -> float:
+        return self.total_wait / self.admitted if self.admitted else 0.0
+
+
+@dataclass
+class SchedulerStatistics(object):
+    max_concurrency: int
+    active: int
+    lanes: typing.Dict[str, LaneStatistics] = field(default_factory=dict)
+
+
+@dataclass(eq=False)
+class _Waiter(object):
+    since: float
+    future: asyncio.Future
+    priority: Priority
+    task: typing.Optional[asyncio.Future]
+
+
+class DeviceScheduler(object):
+    """
+    Limits the number of concurrent actions sent to a device, see module description.
+
+    Parameters
+    ----------
+    max_concurrency : int
+        Maximum number of actions in flight at the same time
+    max_wait : float
+        Seconds after which a queued request is served regardless of its priority
+    clock : callable
+        Source of the current time, in seconds
+    """
+
+    def __init__(self,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 max_wait: float = DEFAULT_MAX_WAIT,
+                 clock: typing.Callable[[], float] = time.monotonic):
+        if max_concurrency < 1:
+            raise ValueError('max_concurrency must be at least 1')
+        self._max_concurrency = max_concurrency
+        self._max_wait = max_wait
+        self._clock = clock
+        self._active = 0
+        self._lanes: typing.Dict[Priority, typing.Deque[_Waiter]] = {
+            priority: collections.deque()
+            for priority in Priority
+        }
+        self._statistics = {priority: LaneStatistics() for priority in Priority}
+        # tasks that have been admitted, and tasks promoted before they asked for admission
+        self._admitted: 'weakref.WeakSet[asyncio.Future]' = weakref.WeakSet()
+        self._promotions: 'weakref.WeakKeyDictionary[asyncio.Future, Priority]' = weakref.WeakKeyDictionary()
+
+    @property
+    def max_concurrency(self) -> int:
+        return self._max_concurrency
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def statistics(self) -> SchedulerStatistics:
+        lanes = {}
+        for priority, stats in self._statistics.items():
+            lanes[priority.name.lower()] = LaneStatistics(queued=len(self._lanes[priority]),
+                                                          max_queued=stats.max_queued,
+                                                          admitted=stats.admitted,
+                                                          total_wait=stats.total_wait,
+                                                          max_wait=stats.max_wait)
+        return SchedulerStatistics(max_concurrency=self._max_concurrency, active=self._active, lanes=lanes)
+
+    async def run(self,
+                  call: typing.Callable[[], typing.Awaitable[T]],
+                  priority: typing.Optional[Priority] = None) -> T:
+        """
+        Await `call()` as soon as the scheduler admits it.
+
+        `priority` defaults to the priority of the current context.
+        """
+        async with self.slot(priority):
+            return await call()
+
+    def promote(self, task: asyncio.Future, priority: Priority):
+        """
+        Raise the priority of the request of `task` to `priority`, unless it has been admitted already.
+
+        Meant for tasks sending a single action, like the shared ones of `single_flight.SingleFlight`.
+        A task that didn't ask for admission yet gets (at least) `priority` once it does.
+        """
+        if task.done() or task in self._admitted:
+            return
+        for lane in self._lanes.values():
+            for waiter in lane:
+                if waiter.task is task:
+                    if priority < waiter.priority:
+                        lane.remove(waiter)
+                        waiter.priority = priority
+                        self._enqueue(waiter)
+                    return
+        self._promotions[task] = min(priority, self._promotions.get(task, priority))
+
+    def admitted(self, task: asyncio.Future) -> bool:
+        """
+        Whether `task` has been admitted, i.e. its request has been sent to the device.
+        """
+        return task in self._admitted
+
+    @contextlib.asynccontextmanager
+    async def slot(self, priority: typing.Optional[Priority] = None):
+        await self._acquire(current_priority() if priority is None else priority)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, priority: Priority):
+        task = asyncio.current_task()
+        if task is not None:
+            priority = min(priority, self._promotions.pop(task, priority))
+        now = self._clock()
+        if self._active < self._max_concurrency and not any(self._lanes.values()):
+            self._active += 1
+            self._admit(task, priority, now)
+            return
+        waiter = _Waiter(now, asyncio.get_running_loop().create_future(), priority, task)
+        self._enqueue(waiter)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # admitted right before being cancelled, pass the slot on
+                self._release()
+            else:
+                self._lanes[waiter.priority].remove(waiter)
+            raise
+        self._admit(task, waiter.priority, waiter.since)
+
+    def _enqueue(self, waiter: _Waiter):
+        lane = self._lanes[waiter.priority]
+        # lanes are ordered by arrival, promoted requests keep their place
+        position = len(lane)
+        while position > 0 and lane[position - 1].since > waiter.since:
+            position -= 1
+        lane.insert(position, waiter)
+        stats = self._statistics[waiter.priority]
+        stats.max_queued = max(stats.max_queued, len(lane))
+
+    def _admit(self, task: typing.Optional[asyncio.Future], priority: Priority, since: float):
+        if task is not None:
+            self._admitted.add(task)
+        self._account(priority, since)
+
+    def _release(self):
+        waiter = self._next_waiter()
+        if waiter is None:
+            self._active -= 1
+        else:
+            # the slot is handed over, so the number of active requests doesn't change
+            waiter.future.set_result(None)
+
+    def _next_waiter(self) -> typing.Optional[_Waiter]:
+        lanes = [lane for lane in self._lanes.values() if lane]
+        if not lanes:
+            return None
+        oldest = min(lanes, key=lambda lane: lane[0].since)
+        if self._clock() - oldest[0].since >= self._max_wait:
+            return oldest.popleft()
+        return lanes[0].popleft()
+
+    def _account(self, priority: Priority, since: float):
+        wait = self._clock() - since
+        stats = self._statistics[priority]
+        stats.admitted += 1
+        stats.total_wait += wait
+        stats.max_wait = max(stats.max_wait, wait)
+        if wait >= self._max_wait:
+            _logger.debug('Request of priority %s waited %.1f seconds', priority.name, wait)
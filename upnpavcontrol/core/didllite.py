@@ -1,9 +1,13 @@
 # -*- coding: utf-8 -*-
-import defusedxml.ElementTree as etree
 from pydantic import BaseModel, Field
 import typing
 from datetime import time
 import html
+import hashlib
+import defusedxml
+from xml.parsers import expat
+from .cache import LRUCache, CacheStatistics
+from . import xml_backend
 
 _nsmap = {
     'upnp': 'urn:schemas-upnp-org:metadata-1-0/upnp/',
@@ -31,7 +35,7 @@ class DictAdapter():
         if key[0] == '@':
             return self._xml.attrib.get(key[1:], default)
         elif key == '__raw_xml':
-            return etree.tostring(self._xml).decode()
+            return xml_backend.tostring(self._xml)
         elif key == '#text':
             return self._xml.text
         elif key[0] == '#':
@@ -49,6 +53,86 @@ class DictAdapter():
         return self._get_from_xml(key, default)
 
 
+def _qualified_tag(key: str, namespaces: typing.Mapping[str, str] = _nsmap):
+    if ':' not in key:
+        return key
+    prefix, tag = key.split(':', 1)
+    return '{%s}%s' % (namespaces[prefix], tag)
+
+
+class ExtractionPlan(object):
+    """
+    Precompiled field extraction for a model class using `DictAdapter` style field aliases.
+
+    Instead of running a separate (namespaced) lookup for each field alias like `DictAdapter` does,
+    the plan maps every qualified child tag to the fields it provides. All fields can then be extracted
+    with a single pass over the children of an element.
+
+    The extracted values are returned as a dictionary keyed by field alias, suitable for `parse_obj`.
+    Values of nested models are extracted recursively using the plan of the nested model class.
+    """
+    _TEXT = 'text'
+    _ELEMENT = 'element'
+    _LIST = 'list'
+
+    def __init__(self,
+                 model: typing.Type[BaseModel],
+                 nested_plans: typing.Optional[typing.Mapping[typing.Any, 'ExtractionPlan']] = None):
+        nested_plans = nested_plans or {}
+        self._attributes: typing.List[typing.Tuple[str, str]] = []
+        self._text_alias: typing.Optional[str] = None
+        self._raw_xml_alias: typing.Optional[str] = None
+        self._list_aliases: typing.List[str] = []
+        self._children: typing.Dict[str, typing.List[typing.Tuple[str, str, typing.Optional[ExtractionPlan]]]] = {}
+        for field in model.__fields__.values():
+            alias = field.alias
+            nested_plan = nested_plans.get(field.type_)
+            if alias[0] == '@':
+                self._attributes.append((alias, alias[1:]))
+            elif alias == '__raw_xml':
+                self._raw_xml_alias = alias
+            elif alias == '#text':
+                self._text_alias = alias
+            elif alias[0] == '#':
+                self._add_child(alias[1:], (alias, self._TEXT, None))
+            elif alias[0] == '*':
+                self._list_aliases.append(alias)
+                self._add_child(alias[1:], (alias, self._LIST, nested_plan))
+            else:
+                self._add_child(alias, (alias, self._ELEMENT, nested_plan))
+
+    def _add_child(self, key: str, target):
+        self._children.setdefault(_qualified_tag(key), []).append(target)
+
+    def extract(self, element: typing.Any) -> typing.Dict[str, typing.Any]:
+        data: typing.Dict[str, typing.Any] = {alias: [] for alias in self._list_aliases}
+        attrib = element.attrib
+        for alias, name in self._attributes:
+            value = attrib.get(name)
+            if value is not None:
+                data[alias] = value
+        if self._text_alias is not None:
+            data[self._text_alias] = element.text
+        if self._raw_xml_alias is not None:
+            data[self._raw_xml_alias] = xml_backend.tostring(element)
+        children = self._children
+        for child in element:
+            targets = children.get(child.tag)
+            if targets is None:
+                continue
+            for alias, kind, plan in targets:
+                if kind is self._LIST:
+                    data[alias].append(plan.extract(child) if plan is not None else child)
+                elif alias in data:
+                    # like find/findtext, only the first matching child is taken into account
+                    continue
+                elif kind is self._TEXT:
+                    data[alias] = html.unescape(child.text or '')
+                else:
+                    data[alias] = plan.extract(child) if plan is not None else child
+        return data
+
+
 class Resource(BaseModel):
     protocolInfo: str = Field(alias='@protocolInfo')
     uri: str = Field(alias='#text')
@@ -108,6 +192,7 @@ class MusikArtist(DidlContainer):
 class MusicTrack(DidlItem):
     artist: typing.Optional[str] = Field(alias='#upnp:artist')
     album: typing.Optional[str] = Field(alias='#upnp:album')
+    genre: typing.Optional[str] = Field(alias='#upnp:genre')
     artistDiscographyURI: typing.Optional[str] = Field(alias='#upnp:artistDiscographyURI')
     originalTrackNumber: typing.Optional[int] = Field(alias='#upnp:originalTrackNumber')
     playlist: typing.Optional[str] = Field(alias='#upnp:playlist')
@@ -117,23 +202,473 @@ class MusicTrack(DidlItem):
     albumArtURI: typing.Optional[AlbumArtURI] = Field(alias='upnp:albumArtURI')
 
 
-def from_xml_string(xmldata):
-    root = etree.fromstring(xmldata)
-    return [_to_didl_element(child) for child in root]
+class DidlRecord(object):
+    """
+    Compact, validation free representation of a DIDL-Lite object or one of its nested elements.
+
+    For each DIDL model class, there's a matching record class providing the same attributes using `__slots__`.
+    Values are taken as-is from the XML document without any validation or type coercion, i.e. all values
+    are plain strings. This makes records much cheaper to create than pydantic models, at the cost of
+    trusting the data provided by the media server.
+
+    Use `to_model()` to obtain the full, validated pydantic model. Records can also be used as source for
+    any pydantic model using `orm_mode`, e.g. `SomeModel.from_orm(record)`.
+    """
+    __slots__ = ()
+    model_class: typing.ClassVar[typing.Type[BaseModel]]
+    _fields: typing.ClassVar[typing.Tuple[typing.Tuple[str, str, typing.Any, bool], ...]] = ()
+
+    @classmethod
+    def from_extracted(cls, data: typing.Mapping[str, typing.Any]):
+        """
+        Create a record from values extracted by an `ExtractionPlan` of the matching model class.
+        """
+        record = cls.__new__(cls)
+        for name, alias, nested, is_list in cls._fields:
+            value = data.get(alias)
+            if nested is not None and value is not None:
+                if is_list:
+                    value = [nested.from_extracted(v) for v in value]
+                else:
+                    value = nested.from_extracted(value)
+            elif is_list and value is None:
+                value = []
+            setattr(record, name, value)
+        return record
+
+    def to_model(self):
+        """
+        Convert this record into its validated pydantic model.
+        """
+        return self.model_class.parse_obj(self._to_alias_dict())
+
+    def _to_alias_dict(self):
+        data = {}
+        for name, alias, nested, is_list in self._fields:
+            value = getattr(self, name)
+            if nested is not None and value is not None:
+                value = [v._to_alias_dict() for v in value] if is_list else value._to_alias_dict()
+            if value is not None:
+                data[alias] = value
+        return data
+
+    def copy(self):
+        """
+        Create a shallow copy of this record.
+        """
+        return _restore_record(self.model_class, tuple(getattr(self, name) for name in self.__slots__))
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        values = ', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__)
+        return f'{type(self).__name__}({values})'
+
+    def __reduce__(self):
+        return (_restore_record, (self.model_class, tuple(getattr(self, name) for name in self.__slots__)))
+
+
+def _restore_record(model_class, values):
+    cls = _record_classes[model_class]
+    record = cls.__new__(cls)
+    for name, value in zip(cls.__slots__, values):
+        setattr(record, name, value)
+    return record
+
+
+class DidlCache(object):
+    """
+    Bounded, size aware LRU cache for parsed DIDL-Lite documents.
+
+    Entries are keyed by a hash of the raw XML data, so identical documents (e.g. metadata resent by renderers
+    or repeated browse requests) will be parsed only once. The size of an entry is accounted by the length of
+    its raw XML data, documents larger than `max_bytes` are never cached.
+
+    Objects are converted lazily on first access (see `DidlSequence`) and shared between all users of the cache,
+    they must be treated as read-only.
+    """
+
+    def __init__(self, max_entries: int = 128, max_bytes: int = 8 * 1024 * 1024):
+        self._cache: LRUCache[typing.Tuple[str, bytes], DidlSequence] = LRUCache(
+            max_entries=max_entries, max_size=max_bytes)
+
+    @property
+    def statistics(self) -> CacheStatistics:
+        return self._cache.statistics
+
+    def accepts(self, xmldata) -> bool:
+        """
+        Check if the given document is small enough to be cached.
+        """
+        return self._cache.accepts(len(xmldata))
+
+    def objects(self, xmldata) -> 'DidlSequence[DidlObject]':
+        """
+        All DIDL objects of the given document as pydantic models, indexed only if not yet cached.
+        """
+        return self._lookup('objects', xmldata, _to_didl_element)
+
+    def records(self, xmldata) -> 'DidlSequence[DidlRecord]':
+        """
+        All DIDL objects of the given document as `DidlRecord` instances, indexed only if not yet cached.
+        """
+        return self._lookup('records', xmldata, _to_didl_record)
+
+    def cached_records(self, xmldata) -> typing.Optional['DidlSequence[DidlRecord]']:
+        """
+        The records of the given document if it has been cached, without parsing it otherwise.
+        """
+        return self._cache.get(('records', _content_hash(xmldata)))
+
+    def store_records(self, xmldata, records: 'DidlSequence[DidlRecord]'):
+        """
+        Cache records parsed elsewhere, e.g. by `parse_records` in a worker.
+        """
+        self._cache.put(('records', _content_hash(xmldata)), records, len(xmldata))
+
+    def clear(self):
+        self._cache.clear()
+
+    def _lookup(self, kind: str, xmldata, convert):
+        key = (kind, _content_hash(xmldata))
+        sequence = self._cache.get(key)
+        if sequence is None:
+            sequence = DidlSequence(DidlElementIndex(xmldata), convert)
+            self._cache.put(key, sequence, len(xmldata))
+        return sequence
+
+
+def _content_hash(xmldata) -> bytes:
+    data = xmldata.encode('utf-8') if isinstance(xmldata, str) else xmldata
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+#: cache shared by all media servers and renderers
+shared_cache = DidlCache()
+
+
+def from_xml_string(xmldata, cache: typing.Optional[DidlCache] = None):
+    if cache is not None:
+        return list(cache.objects(xmldata))
+    return list(iter_xml_string(xmldata))
+
+
+def iter_xml_string(xmldata) -> typing.Iterator[DidlObject]:
+    """
+    Incrementally parse a DIDL-Lite document, yielding one DIDL object at a time.
+
+    Each top level element is converted as soon as its closing tag has been parsed and
+    is released afterwards, so neither the complete element tree nor the list of all
+    objects will be held in memory.
+    """
+    for element in _iter_child_elements(xmldata):
+        yield _to_didl_element(element)
+
+
+def records_from_xml_string(xmldata):
+    return list(iter_records(xmldata))
+
+
+def parse_records(xmldata) -> 'DidlSequence[DidlRecord]':
+    """
+    Index and convert all DIDL objects of a document into `DidlRecord` instances at once.
+
+    The result can be pickled, so this may run in a worker thread or process.
+    """
+    records: DidlSequence[DidlRecord] = DidlSequence(DidlElementIndex(xmldata), _to_didl_record)
+    records._convert_all()
+    return records
+
+
+def iter_records(xmldata) -> typing.Iterator[DidlRecord]:
+    """
+    Like `iter_xml_string`, but yields validation free `DidlRecord` instances instead of pydantic models.
+    """
+    for element in _iter_child_elements(xmldata):
+        yield _to_didl_record(element)
+
+
+def _iter_child_elements(xmldata):
+    root = None
+    depth = 0
+    for event, element in xml_backend.iterparse(xmldata, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = element
+            depth += 1
+            continue
+        depth -= 1
+        if depth == 1:
+            yield element
+            # drop the already processed subtree, nothing keeps a reference to it anymore
+            root.clear()
+
+
+class DidlElementIndex(object):
+    """
+    Byte offsets of all top level elements of a DIDL-Lite document.
+
+    The document is scanned once without building any elements. Afterwards each element can be parsed
+    on its own by wrapping its raw XML in the document's root element, which preserves all
+    namespace declarations of the original document.
+    """
+
+    def __init__(self, xmldata: typing.Union[str, bytes]):
+        self._source = xmldata
+        self._is_str = isinstance(xmldata, str)
+        self._data = xmldata.encode('utf-8') if isinstance(xmldata, str) else xmldata
+        self._offsets: typing.List[typing.Tuple[int, int]] = []
+        self._prefix = b''
+        self._suffix = b''
+        self._scan()
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __getstate__(self):
+        # the encoded data is just a copy of the source, no need to transfer it
+        state = self.__dict__.copy()
+        del state['_data']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._data = self._source.encode('utf-8') if self._is_str else self._source
+
+    @property
+    def xml(self) -> typing.Union[str, bytes]:
+        return self._source
+
+    def element(self, index: int):
+        """
+        Parse the top level element at `index`.
+        """
+        for element in _iter_child_elements(self.fragment(index)):
+            return element
+        raise IndexError(index)
+
+    def fragment(self, index: int) -> typing.Union[str, bytes]:
+        """
+        A DIDL-Lite document containing only the top level element at `index`, as found in the original document.
+
+        The element's XML is taken as is, nothing will be re-serialized. The result is of the same type
+        as the original document.
+        """
+        if len(self._offsets) == 1:
+            # e.g. BrowseMetadata results, nothing to cut out
+            return self._source
+        start, end = self._offsets[index]
+        data = self._prefix + self._data[start:end] + self._suffix
+        return data.decode('utf-8') if self._is_str else data
+
+    def _scan(self):
+        # strings have been encoded as UTF-8, regardless of what their XML declaration claims
+        parser = expat.ParserCreate('utf-8' if self._is_str else None)
+        depth = 0
+        start = None
+        root_end = None
+
+        def start_element(name, attributes):
+            nonlocal depth, start
+            depth += 1
+            if depth == 2:
+                # elements end where the next one starts (or the root element is closed),
+                # this keeps empty elements and any '>' in attribute values out of the picture
+                if start is not None:
+                    self._offsets.append((start, parser.CurrentByteIndex))
+                start = parser.CurrentByteIndex
+
+        def end_element(name):
+            nonlocal depth, root_end
+            if depth == 1:
+                root_end = parser.CurrentByteIndex
+            depth -= 1
+
+        def forbid_entities(name, is_parameter_entity, value, base, sysid, pubid, notation_name):
+            raise defusedxml.EntitiesForbidden(name, value, base, sysid, pubid, notation_name)
+
+        def forbid_external_reference(context, base, sysid, pubid):
+            raise defusedxml.ExternalReferenceForbidden(context, base, sysid, pubid)
+
+        parser.StartElementHandler = start_element
+        parser.EndElementHandler = end_element
+        parser.EntityDeclHandler = forbid_entities
+        parser.ExternalEntityRefHandler = forbid_external_reference
+        parser.Parse(self._data, True)
+
+        if root_end is None:
+            return
+        if start is not None:
+            self._offsets.append((start, root_end))
+            self._prefix = self._data[:self._offsets[0][0]]
+        self._suffix = self._data[root_end:]
+
+
+T = typing.TypeVar('T')
+
+
+class DidlSequence(typing.Sequence[T]):
+    """
+    Read-only sequence of the DIDL objects of a document, converted on first access.
+
+    Only the element offsets are determined upfront, so `len()` and accessing single items don't
+    require the whole document to be converted. Converted items are retained.
+    """
+
+    def __init__(self, index: DidlElementIndex, convert: typing.Callable[[typing.Any], T]):
+        self._index = index
+        self._convert = convert
+        self._items: typing.List[typing.Optional[T]] = [None] * len(index)
+        self._missing = len(index)
+
+    def __len__(self):
+        return len(self._items)
+
+    @typing.overload
+    def __getitem__(self, index: int) -> T:
+        ...
+
+    @typing.overload
+    def __getitem__(self, index: slice) -> typing.List[T]:
+        ...
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(len(self))[index]]
+        item = self._items[index]
+        if item is None:
+            index = range(len(self))[index]
+            item = self._convert(self._index.element(index))
+            self._items[index] = item
+            self._missing -= 1
+        return item
+
+    def __iter__(self) -> typing.Iterator[T]:
+        if self._missing > 0:
+            self._convert_all()
+        return iter(typing.cast(typing.List[T], self._items))
+
+    def __eq__(self, other):
+        if isinstance(other, typing.Sequence) and not isinstance(other, str):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return f'{type(self).__name__}({len(self)} items, {len(self) - self._missing} converted)'
+
+    @property
+    def index(self) -> DidlElementIndex:
+        return self._index
+
+    @property
+    def converted(self) -> int:
+        """
+        Number of items that have been converted so far.
+        """
+        return len(self) - self._missing
+
+    def iter_converted(self) -> typing.Iterator[T]:
+        """
+        Iterate over the items converted so far, without converting any other.
+        """
+        return (item for item in self._items if item is not None)
+
+    def _convert_all(self):
+        # a single pass over the whole document is much cheaper than parsing each element on its own
+        for i, element in enumerate(_iter_child_elements(self._index._source)):
+            if self._items[i] is None:
+                self._items[i] = self._convert(element)
+        self._missing = 0
 
 
 class DidlLite(object):
 
-    def __init__(self, xml: str):
+    def __init__(self,
+                 xml: str,
+                 cache: typing.Optional[DidlCache] = None,
+                 records: typing.Optional['DidlSequence[DidlRecord]'] = None):
         self._raw = xml
-        self._objects: typing.Optional[typing.List[DidlObject]] = None
+        self._cache = cache
+        self._index: typing.Optional[DidlElementIndex] = None
+        self._objects: typing.Optional[DidlSequence[DidlObject]] = None
+        # already parsed records, e.g. by `parse_records` in a worker
+        self._records: typing.Optional[DidlSequence[DidlRecord]] = records
 
     @property
-    def objects(self):
+    def objects(self) -> 'DidlSequence[DidlObject]':
+        """
+        All DIDL objects of this document, each one converted into its pydantic model on first access.
+        """
         if self._objects is None:
-            self._objects = from_xml_string(self._raw)
+            self._objects = self._cache.objects(self._raw) if self._cache is not None else DidlSequence(
+                self._element_index(), _to_didl_element)
         return self._objects
 
+    def iter_objects(self) -> typing.Iterator[DidlObject]:
+        """
+        Iterate over all DIDL objects of this document.
+
+        Unless `objects` has already been accessed or the document will be cached, it will be parsed
+        incrementally and the objects are not retained.
+        """
+        if self._objects is not None or self._is_cacheable():
+            return iter(self.objects)
+        return iter_xml_string(self._raw)
+
+    @property
+    def records(self) -> 'DidlSequence[DidlRecord]':
+        """
+        All DIDL objects of this document as validation free `DidlRecord` instances, converted on first access.
+        """
+        if self._records is None:
+            self._records = self._cache.records(self._raw) if self._cache is not None else DidlSequence(
+                self._element_index(), _to_didl_record)
+        return self._records
+
+    def iter_records(self) -> typing.Iterator[DidlRecord]:
+        """
+        Iterate over all DIDL objects of this document as `DidlRecord` instances.
+
+        Unless `records` has already been accessed or the document will be cached, it will be parsed
+        incrementally and the records are not retained.
+        """
+        if self._records is not None or self._is_cacheable():
+            return iter(self.records)
+        return iter_records(self._raw)
+
+    def iter_converted_records(self) -> typing.Iterator[DidlRecord]:
+        """
+        Iterate over the `records` converted so far, without parsing the document or converting any other.
+        """
+        if self._records is None:
+            return iter(())
+        return self._records.iter_converted()
+
+    def fragment(self, index: int) -> str:
+        """
+        The original XML of the DIDL object at `index`, wrapped in its own DIDL-Lite document.
+
+        Suitable e.g. as metadata for SetAVTransportURI, without re-serializing the parsed object.
+        """
+        return self._element_index().fragment(index)
+
+    def _element_index(self) -> DidlElementIndex:
+        if self._index is None:
+            # reuse the index of already created (possibly cached) sequences
+            for sequence in (self._objects, self._records):
+                if isinstance(sequence, DidlSequence):
+                    self._index = sequence.index
+                    break
+            else:
+                self._index = DidlElementIndex(self._raw)
+        return self._index
+
+    def _is_cacheable(self):
+        return self._cache is not None and self._cache.accepts(self._raw)
+
     @property
     def xml(self):
         return self._raw
@@ -146,15 +681,63 @@ _class_to_element_mapping = {
 }
 
 
-def _to_didl_element(xmlElement: typing.Any):
-    upnpclass = xmlElement.findtext('upnp:class', namespaces=_nsmap)
+def _compile_extraction_plans(models: typing.Iterable[typing.Type[BaseModel]]):
+    # nested models need to come first, so their plans are available to the models using them
+    plans: typing.Dict[typing.Any, ExtractionPlan] = {}
+    for model in models:
+        plans[model] = ExtractionPlan(model, plans)
+    return plans
+
+
+def _create_record_classes(models: typing.Iterable[typing.Type[BaseModel]]):
+    # same as for the extraction plans, nested models need to come first
+    record_classes: typing.Dict[typing.Any, typing.Type[DidlRecord]] = {}
+    for model in models:
+        fields = tuple((name, field.alias, record_classes.get(field.type_), field.alias[0] == '*')
+                       for name, field in model.__fields__.items())
+        record_classes[model] = typing.cast(
+            typing.Type[DidlRecord],
+            type(f'{model.__name__}Record', (DidlRecord, ), {
+                '__slots__': tuple(name for name, *_ in fields),
+                '__module__': __name__,
+                'model_class': model,
+                '_fields': fields
+            }))
+    return record_classes
+
+
+_didl_models = [Resource, AlbumArtURI, DidlObject, DidlItem, DidlContainer, MusikAlbum, MusikArtist, MusicTrack]
+_extraction_plans = _compile_extraction_plans(_didl_models)
+_record_classes = _create_record_classes(_didl_models)
+
+_upnp_class_tag = _qualified_tag('upnp:class')
+
+
+def _didl_class_for(upnpclass: str):
     # mapping logic should be improved/refactored when more types are supported
     if upnpclass in _class_to_element_mapping:
-        cls = _class_to_element_mapping[upnpclass]
+        return _class_to_element_mapping[upnpclass]
     elif upnpclass.startswith('object.item'):
-        cls = DidlItem
+        return DidlItem
     elif upnpclass.startswith('object.container'):
-        cls = DidlContainer
+        return DidlContainer
     else:
-        cls = DidlObject
-    return cls.from_orm(xmlElement)
+        return DidlObject
+
+
+def _find_upnp_class(xmlElement: typing.Any):
+    # usually one of the first children, much cheaper than a namespaced findtext
+    for child in xmlElement:
+        if child.tag == _upnp_class_tag:
+            return child.text or ''
+    return None
+
+
+def _to_didl_element(xmlElement: typing.Any):
+    cls = _didl_class_for(_find_upnp_class(xmlElement))
+    return cls.parse_obj(_extraction_plans[cls].extract(xmlElement))
+
+
+def _to_didl_record(xmlElement: typing.Any) -> DidlRecord:
+    cls = _didl_class_for(_find_upnp_class(xmlElement))
+    return _record_classes[cls].from_extracted(_extraction_plans[cls].extract(xmlElement))
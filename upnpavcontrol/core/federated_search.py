@@ -0,0 +1,104 @@
+"""
+Search across all media servers at once.
+
+All servers are searched concurrently with the Search action of their ContentDirectory. The result of each
+server is provided as soon as it answered, so fast servers don't wait for slow ones, and each server has
+to answer within a timeout, so a single slow NAS can't hold up the whole search. Servers known to be unreachable
+(see `server_health`) are not asked at all.
+"""
+import asyncio
+from dataclasses import dataclass, field
+import enum
+import logging
+import typing
+from . import didllite
+from .mediaserver import MediaServer, text_search_criteria
+from .server_health import ServerUnavailableError
+from .settings import DEFAULT_SEARCH_TIMEOUT
+
+_logger = logging.getLogger(__name__)
+
+#: seconds each server has to answer a search
+DEFAULT_TIMEOUT = DEFAULT_SEARCH_TIMEOUT
+#: maximum number of results requested from each server
+DEFAULT_REQUESTED_COUNT = 50
+
+
+class SearchStatus(enum.Enum):
+    OK = 'ok'
+    #: the server doesn't support searching any of the text properties
+    UNSUPPORTED = 'unsupported'
+    TIMEOUT = 'timeout'
+    FAILED = 'failed'
+    #: the server is known to be unreachable and has not been asked
+    UNAVAILABLE = 'unavailable'
+
+
+@dataclass
+class ServerSearchResult(object):
+    """
+    Result of searching a single server.
+
+    Attributes
+    ----------
+    server : MediaServer
+        The server searched
+    status : SearchStatus
+        Whether the search succeeded
+    records : list
+        The objects found, empty unless the search succeeded
+    total_matches : int, optional
+        Number of objects found by the server, including those not returned
+    """
+    server: MediaServer
+    status: SearchStatus = SearchStatus.OK
+    records: typing.List[didllite.DidlRecord] = field(default_factory=list)
+    total_matches: typing.Optional[int] = None
+
+
+async def search_server(server: MediaServer,
+                        text: str,
+                        requested_count: int = DEFAULT_REQUESTED_COUNT,
+                        container_id: str = '0') -> ServerSearchResult:
+    """
+    Search a single server for objects containing the terms of `text`, see `text_search_criteria`.
+    """
+    criteria = text_search_criteria(text, await server.get_search_capabilities())
+    if criteria is None:
+        return ServerSearchResult(server, SearchStatus.UNSUPPORTED)
+    result = await server.search(container_id, criteria, requested_count=requested_count)
+    return ServerSearchResult(server, records=list(result.records), total_matches=result.total_matches)
+
+
+async def _search_with_timeout(server: MediaServer, text: str, requested_count: int,
+                               timeout: float) -> ServerSearchResult:
+    try:
+        return await asyncio.wait_for(search_server(server, text, requested_count), timeout)
+    except asyncio.TimeoutError:
+        _logger.warning('Search of %s timed out after %.1f seconds', server.friendly_name, timeout)
+        return ServerSearchResult(server, SearchStatus.TIMEOUT)
+    except ServerUnavailableError:
+        return ServerSearchResult(server, SearchStatus.UNAVAILABLE)
+    except Exception as e:
+        _logger.warning('Search of %s failed: %s', server.friendly_name, e)
+        return ServerSearchResult(server, SearchStatus.FAILED)
+
+
+async def federated_search(servers: typing.Iterable[MediaServer],
+                           text: str,
+                           timeout: float = DEFAULT_TIMEOUT,
+                           requested_count: int = DEFAULT_REQUESTED_COUNT) -> typing.AsyncIterator[ServerSearchResult]:
+    """
+    Search all given servers concurrently, yielding the result of each server as soon as it is available.
+
+    Exactly one result is yielded per server, servers not answering within `timeout` seconds or failing
+    are reported by the status of their result. Closing the iterator early stops waiting for pending searches.
+    """
+    tasks = [asyncio.ensure_future(_search_with_timeout(server, text, requested_count, timeout)) for server in servers]
+    try:
+        for next_result in asyncio.as_completed(tasks):
+            yield await next_result
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
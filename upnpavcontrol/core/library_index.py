@@ -0,0 +1,622 @@
+"""
+Local index of the content of media servers, stored in an SQLite database.
+
+Browsing a media server is slow and requires plenty of requests, the index allows to answer
+library queries locally instead. It is filled by the `LibraryIndexer`.
+
+Objects removed from a server are not deleted from the index right away, but kept as tombstones
+(with the time of their removal) for a while. This allows consumers of the index to catch up on removals
+incrementally, see `tombstones`.
+
+Titles, artists and albums are indexed for substring search with an FTS5 trigram index, if the SQLite library
+supports it (version 3.34 or later), see `LibraryIndex.search`.
+"""
+from dataclasses import dataclass
+import logging
+import sqlite3
+import time
+import typing
+from . import didllite
+
+_logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS servers (
+    udn TEXT PRIMARY KEY,
+    friendly_name TEXT,
+    system_update_id INTEGER,
+    generation INTEGER NOT NULL DEFAULT 0,
+    indexed_at REAL
+);
+CREATE TABLE IF NOT EXISTS objects (
+    udn TEXT NOT NULL,
+    id TEXT NOT NULL,
+    parent_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    upnp_class TEXT NOT NULL,
+    title TEXT,
+    artist TEXT,
+    album TEXT,
+    genre TEXT,
+    track_number INTEGER,
+    uri TEXT,
+    protocol_info TEXT,
+    artwork_uri TEXT,
+    year INTEGER,
+    generation INTEGER NOT NULL,
+    deleted_at REAL,
+    PRIMARY KEY (udn, id)
+);
+CREATE TABLE IF NOT EXISTS containers (
+    udn TEXT NOT NULL,
+    id TEXT NOT NULL,
+    update_id INTEGER,
+    PRIMARY KEY (udn, id)
+);
+CREATE INDEX IF NOT EXISTS objects_by_parent ON objects (udn, parent_id, position);
+CREATE INDEX IF NOT EXISTS objects_by_class ON objects (udn, upnp_class);
+CREATE INDEX IF NOT EXISTS objects_by_artist ON objects (udn, artist);
+CREATE INDEX IF NOT EXISTS objects_by_album ON objects (udn, album);
+CREATE INDEX IF NOT EXISTS objects_by_genre ON objects (udn, genre);
+CREATE INDEX IF NOT EXISTS objects_by_title ON objects (title COLLATE NOCASE);
+"""
+
+# External content table, kept in sync with `objects` by triggers. The REPLACE of `store` only fires the
+# delete trigger with recursive triggers enabled. The index relies on the (implicit) rowids of `objects`
+# to be stable, i.e. the database must not be vacuumed.
+_SEARCH_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS objects_search USING fts5 (
+    title, artist, album, content='objects', content_rowid='rowid', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS objects_search_insert AFTER INSERT ON objects BEGIN
+    INSERT INTO objects_search (rowid, title, artist, album) VALUES (new.rowid, new.title, new.artist, new.album);
+END;
+CREATE TRIGGER IF NOT EXISTS objects_search_delete AFTER DELETE ON objects BEGIN
+    INSERT INTO objects_search (objects_search, rowid, title, artist, album)
+    VALUES ('delete', old.rowid, old.title, old.artist, old.album);
+END;
+CREATE TRIGGER IF NOT EXISTS objects_search_update AFTER UPDATE OF title, artist, album ON objects BEGIN
+    INSERT INTO objects_search (objects_search, rowid, title, artist, album)
+    VALUES ('delete', old.rowid, old.title, old.artist, old.album);
+    INSERT INTO objects_search (rowid, title, artist, album) VALUES (new.rowid, new.title, new.artist, new.album);
+END;
+"""
+
+#: terms shorter than this can't be looked up in the trigram index
+_MIN_TRIGRAM_TERM = 3
+
+# Indexes of the views by artist, album, genre and decade (see `library_views`), covering all audio items.
+# Queries must repeat the condition of the partial indexes literally, see `_AUDIO_ITEM`.
+_VIEW_SCHEMA = """
+CREATE INDEX IF NOT EXISTS audio_by_artist
+ON objects (artist COLLATE NOCASE, album COLLATE NOCASE, ifnull(track_number, 0), udn, id)
+WHERE upnp_class LIKE 'object.item.audioItem%' AND deleted_at IS NULL;
+CREATE INDEX IF NOT EXISTS audio_by_album ON objects (album COLLATE NOCASE, artist COLLATE NOCASE)
+WHERE upnp_class LIKE 'object.item.audioItem%' AND deleted_at IS NULL;
+CREATE INDEX IF NOT EXISTS audio_by_genre ON objects (genre COLLATE NOCASE, album COLLATE NOCASE, artist COLLATE NOCASE)
+WHERE upnp_class LIKE 'object.item.audioItem%' AND deleted_at IS NULL;
+CREATE INDEX IF NOT EXISTS audio_by_decade ON objects (year / 10, album COLLATE NOCASE, artist COLLATE NOCASE)
+WHERE upnp_class LIKE 'object.item.audioItem%' AND deleted_at IS NULL;
+"""
+
+_AUDIO_ITEM = "upnp_class LIKE 'object.item.audioItem%' AND deleted_at IS NULL"
+
+_OBJECT_COLUMNS = ('udn, id, parent_id, position, upnp_class, title, artist, album, genre, track_number, uri, '
+                   'protocol_info, artwork_uri, year')
+
+
+@dataclass(frozen=True)
+class IndexedObject(object):
+    """
+    A DIDL-Lite object as stored in the index.
+    """
+    udn: str
+    id: str
+    parent_id: str
+    position: int
+    upnp_class: str
+    title: typing.Optional[str] = None
+    artist: typing.Optional[str] = None
+    album: typing.Optional[str] = None
+    genre: typing.Optional[str] = None
+    track_number: typing.Optional[int] = None
+    uri: typing.Optional[str] = None
+    protocol_info: typing.Optional[str] = None
+    artwork_uri: typing.Optional[str] = None
+    year: typing.Optional[int] = None
+
+    @property
+    def is_container(self) -> bool:
+        return self.upnp_class.startswith('object.container')
+
+
+@dataclass(frozen=True)
+class IndexedServer(object):
+    udn: str
+    friendly_name: typing.Optional[str]
+    system_update_id: typing.Optional[int]
+    generation: int
+    indexed_at: typing.Optional[float]
+
+
+def _optional_int(value) -> typing.Optional[int]:
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _year(date: typing.Optional[str]) -> typing.Optional[int]:
+    # dc:date is an ISO 8601 date, e.g. 1999-05-01, but some servers just provide the year
+    if date is None or len(date) < 4 or not date[:4].isdigit():
+        return None
+    return int(date[:4])
+
+
+def _keyset_conditions(keys: typing.Sequence[str]) -> typing.List[str]:
+    # Conditions for the rows following the values :after0, :after1 etc. of `keys`, most specific first: the first
+    # row matching any of them in index order is the next one. Unlike a single condition (or row values) each of
+    # them translates to a plain index seek.
+    return [
+        ' AND '.join([f'{key} = :after{j}' for j, key in enumerate(keys[:i])] + [f'{keys[i]} > :after{i}'])
+        for i in reversed(range(len(keys)))
+    ]
+
+
+def _like_pattern(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _fts_string(text: str) -> str:
+    return '"' + text.replace('"', '""') + '"'
+
+
+def _object_row(udn: str, position: int, record: didllite.DidlRecord, generation: int) -> tuple:
+    res = record.res[0] if record.res else None
+    artwork = getattr(record, 'albumArtURI', None)
+    return (udn, record.id, record.parentID, position, record.upnpclass, record.title,
+            getattr(record, 'artist', None), getattr(record, 'album', None), getattr(record, 'genre', None),
+            _optional_int(getattr(record, 'originalTrackNumber', None)), res.uri if res is not None else None,
+            res.protocolInfo if res is not None else None, artwork.uri if artwork is not None else None,
+            _year(getattr(record, 'date', None)), generation)
+
+
+class LibraryIndex(object):
+    """
+    SQLite store of the objects of all indexed media servers.
+
+    Objects are stored with a generation, the number of the crawl that stored them. A complete crawl
+    of a server drops all objects left from previous crawls, see `begin_crawl` and `finish_crawl`.
+    An incremental crawl only updates the children of changed containers, see `drop_stale_children`.
+    Besides the objects, the UpdateID of each browsed container is stored to detect changed containers.
+
+    The index may be used from several threads, e.g. read on the event loop while written by the thread of
+    the `LibraryIndexer`. Writes must not be run by several threads concurrently though.
+
+    Parameters
+    ----------
+    path : str
+        File name of the database, ':memory:' for a database in memory only
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('PRAGMA recursive_triggers = ON')
+        self._connection.executescript(_SCHEMA)
+        self._migrate()
+        self._connection.executescript(_VIEW_SCHEMA)
+        self._search_enabled = self._create_search_index()
+        self._connection.commit()
+
+    def _migrate(self):
+        columns = {row[1] for row in self._connection.execute('PRAGMA table_info(objects)')}
+        if 'deleted_at' not in columns:
+            self._connection.execute('ALTER TABLE objects ADD COLUMN deleted_at REAL')
+        if 'year' not in columns:
+            self._connection.execute('ALTER TABLE objects ADD COLUMN year INTEGER')
+            # Year and genre (not parsed for tracks before) are unknown for all objects stored so far, an
+            # incremental sync would only fill them for changed containers: force a full crawl of all servers.
+            self._connection.execute('UPDATE servers SET system_update_id = NULL, indexed_at = NULL')
+            self._connection.execute('DELETE FROM containers')
+
+    def _create_search_index(self) -> bool:
+        exists = self._connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'objects_search'").fetchone() is not None
+        try:
+            self._connection.executescript(_SEARCH_SCHEMA)
+        except sqlite3.OperationalError as e:
+            _logger.warning('SQLite without FTS5 trigram support (%s), library search falls back to table scans', e)
+            return False
+        if not exists:
+            # database of a previous version, index the objects stored so far
+            self._connection.execute("INSERT INTO objects_search (objects_search) VALUES ('rebuild')")
+        return True
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def search_enabled(self) -> bool:
+        """
+        Whether searches are answered from the full-text index, otherwise by scanning all objects.
+        """
+        return self._search_enabled
+
+    def close(self):
+        self._connection.close()
+
+    def begin_crawl(self, udn: str, friendly_name: typing.Optional[str] = None) -> int:
+        """
+        Register a new crawl of a server, returns the generation to store its objects with.
+        """
+        with self._connection:
+            self._connection.execute(
+                'INSERT INTO servers (udn, friendly_name) VALUES (?, ?) '
+                'ON CONFLICT (udn) DO UPDATE SET friendly_name = excluded.friendly_name', (udn, friendly_name))
+            self._connection.execute('UPDATE servers SET generation = generation + 1 WHERE udn = ?', (udn, ))
+        return self.server(udn).generation  # type: ignore
+
+    def finish_crawl(self,
+                     udn: str,
+                     generation: int,
+                     system_update_id: typing.Optional[int] = None,
+                     drop_stale: bool = True) -> int:
+        """
+        Mark the crawl of the given generation as complete.
+
+        If the crawl visited all containers, `drop_stale` turns all objects not seen by it into tombstones.
+        Returns the number of dropped objects.
+        """
+        now = time.time()
+        dropped = 0
+        with self._connection:
+            if drop_stale:
+                dropped = self._connection.execute(
+                    'UPDATE objects SET deleted_at = ? WHERE udn = ? AND generation < ? AND deleted_at IS NULL',
+                    (now, udn, generation)).rowcount
+                self._drop_deleted_containers(udn)
+            self._connection.execute('UPDATE servers SET system_update_id = ?, indexed_at = ? WHERE udn = ?',
+                                     (system_update_id, now, udn))
+        return dropped
+
+    def drop_stale_children(self, udn: str, parent_id: str, generation: int) -> int:
+        """
+        Turn all children of a container not stored with `generation` or later into tombstones, including
+        their descendants.
+
+        Used after storing all current children of a container. Returns the number of dropped objects.
+        """
+        with self._connection:
+            dropped = self._connection.execute(
+                """
+                UPDATE objects SET deleted_at = :now WHERE udn = :udn AND id IN (
+                    WITH RECURSIVE gone(id) AS (
+                        SELECT id FROM objects
+                        WHERE udn = :udn AND parent_id = :parent AND generation < :generation AND deleted_at IS NULL
+                        UNION
+                        SELECT objects.id FROM objects JOIN gone ON objects.parent_id = gone.id
+                        WHERE objects.udn = :udn AND objects.generation < :generation AND objects.deleted_at IS NULL
+                    )
+                    SELECT id FROM gone
+                )
+                """, dict(udn=udn, parent=parent_id, generation=generation, now=time.time())).rowcount
+            self._drop_deleted_containers(udn)
+        return dropped
+
+    def _drop_deleted_containers(self, udn: str):
+        self._connection.execute(
+            'DELETE FROM containers WHERE udn = ? AND id IN '
+            '(SELECT id FROM objects WHERE udn = ? AND deleted_at IS NOT NULL)', (udn, udn))
+
+    def set_container_update_id(self, udn: str, container_id: str, update_id: typing.Optional[int]):
+        with self._connection:
+            self._connection.execute('INSERT OR REPLACE INTO containers (udn, id, update_id) VALUES (?, ?, ?)',
+                                     (udn, container_id, update_id))
+
+    def container_update_id(self, udn: str, container_id: str) -> typing.Optional[int]:
+        row = self._connection.execute('SELECT update_id FROM containers WHERE udn = ? AND id = ?',
+                                       (udn, container_id)).fetchone()
+        return row[0] if row is not None else None
+
+    def has_container(self, udn: str, container_id: str) -> bool:
+        return self._connection.execute('SELECT 1 FROM containers WHERE udn = ? AND id = ?',
+                                        (udn, container_id)).fetchone() is not None
+
+    def container_ids(self, udn: str) -> typing.List[str]:
+        """
+        IDs of all containers of a server browsed so far.
+        """
+        return [row[0] for row in self._connection.execute('SELECT id FROM containers WHERE udn = ?', (udn, ))]
+
+    def tombstones(self, udn: str, since: float = 0.0) -> typing.List[typing.Tuple[str, str, float]]:
+        """
+        Objects removed from the server since the given time, as tuples of ID, parent ID and time of removal.
+        """
+        return self._connection.execute(
+            'SELECT id, parent_id, deleted_at FROM objects WHERE udn = ? AND deleted_at >= ? ORDER BY deleted_at',
+            (udn, since)).fetchall()
+
+    def purge_tombstones(self, before: float) -> int:
+        """
+        Finally delete all tombstones of objects removed before the given time.
+        """
+        with self._connection:
+            return self._connection.execute('DELETE FROM objects WHERE deleted_at < ?', (before, )).rowcount
+
+    def store(self, udn: str, records: typing.Iterable[didllite.DidlRecord], starting_index: int = 0,
+              generation: int = 0) -> int:
+        """
+        Store the records of a single browse result, replacing previously stored objects with the same ID.
+
+        `starting_index` is the position of the first record among the children of its parent.
+        """
+        rows = [_object_row(udn, starting_index + i, record, generation) for i, record in enumerate(records)]
+        with self._connection:
+            self._connection.executemany(
+                f'INSERT OR REPLACE INTO objects ({_OBJECT_COLUMNS}, generation) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        return len(rows)
+
+    def remove_server(self, udn: str):
+        with self._connection:
+            self._connection.execute('DELETE FROM objects WHERE udn = ?', (udn, ))
+            self._connection.execute('DELETE FROM containers WHERE udn = ?', (udn, ))
+            self._connection.execute('DELETE FROM servers WHERE udn = ?', (udn, ))
+
+    def server(self, udn: str) -> typing.Optional[IndexedServer]:
+        row = self._connection.execute(
+            'SELECT udn, friendly_name, system_update_id, generation, indexed_at FROM servers WHERE udn = ?',
+            (udn, )).fetchone()
+        return IndexedServer(*row) if row is not None else None
+
+    def get(self, udn: str, object_id: str) -> typing.Optional[IndexedObject]:
+        row = self._connection.execute(
+            f'SELECT {_OBJECT_COLUMNS} FROM objects WHERE udn = ? AND id = ? AND deleted_at IS NULL',
+            (udn, object_id)).fetchone()
+        return IndexedObject(*row) if row is not None else None
+
+    def children(self,
+                 udn: str,
+                 parent_id: str,
+                 offset: int = 0,
+                 limit: typing.Optional[int] = None,
+                 after: typing.Optional[IndexedObject] = None) -> typing.List[IndexedObject]:
+        """
+        The indexed children of a container, in the order the server returned them.
+
+        With `after`, a child returned by a previous call, the children following it are returned (skipping
+        `offset` of them) without counting all children before it.
+        """
+        condition = ''
+        params: typing.Dict[str, typing.Any] = dict(udn=udn,
+                                                    parent=parent_id,
+                                                    limit=-1 if limit is None else limit,
+                                                    offset=offset)
+        if after is not None:
+            # the first condition is the one seeking the index, the second one skips children sharing the position
+            condition = 'AND position >= :position AND (position, id) > (:position, :id) '
+            params.update(position=after.position, id=after.id)
+        rows = self._connection.execute(
+            f'SELECT {_OBJECT_COLUMNS} FROM objects WHERE udn = :udn AND parent_id = :parent AND deleted_at IS NULL '
+            f'{condition}ORDER BY position, id LIMIT :limit OFFSET :offset', params)
+        return [IndexedObject(*row) for row in rows]
+
+    def count(self, udn: typing.Optional[str] = None) -> int:
+        if udn is None:
+            return self._connection.execute('SELECT COUNT(*) FROM objects WHERE deleted_at IS NULL').fetchone()[0]
+        return self._connection.execute('SELECT COUNT(*) FROM objects WHERE udn = ? AND deleted_at IS NULL',
+                                        (udn, )).fetchone()[0]
+
+    def _audio_groups(self,
+                      columns: typing.Sequence[str],
+                      conditions: typing.Sequence[str] = (),
+                      params: typing.Optional[typing.Dict[str, typing.Any]] = None,
+                      after: typing.Optional[typing.Sequence[typing.Any]] = None,
+                      offset: int = 0,
+                      limit: typing.Optional[int] = None) -> typing.List[tuple]:
+        # Distinct values of `columns` among all audio items, in the order of the index starting with them.
+        # Each value is found by a seek of its own (a loose index scan), so the cost depends on the number
+        # of values returned, not on the number of items sharing them.
+        conditions = [_AUDIO_ITEM] + [f'{column} IS NOT NULL' for column in columns] + list(conditions)
+        keys = [column if column == 'year / 10' else f'{column} COLLATE NOCASE' for column in columns]
+        query = f'SELECT {", ".join(columns)} FROM objects WHERE {" AND ".join(conditions)} {{}} ' \
+            f'ORDER BY {", ".join(keys)} LIMIT 1'
+        following = [query.format(f'AND {condition}') for condition in _keyset_conditions(keys)]
+        rows: typing.List[tuple] = []
+        while limit is None or len(rows) < offset + limit:
+            row = None
+            if after is None:
+                row = self._connection.execute(query.format(''), params or {}).fetchone()
+            else:
+                values = dict(params or {}, **{f'after{i}': value for i, value in enumerate(after)})
+                for sql in following:
+                    row = self._connection.execute(sql, values).fetchone()
+                    if row is not None:
+                        break
+            if row is None:
+                break
+            rows.append(row)
+            after = row
+        return rows[offset:]
+
+    def artists(self,
+                after: typing.Optional[str] = None,
+                offset: int = 0,
+                limit: typing.Optional[int] = None) -> typing.List[str]:
+        """
+        Artists of all audio items, ignoring case, in alphabetical order.
+
+        `after` continues the list after the given artist (keyset paging), which unlike `offset` doesn't require
+        to skip all previous artists.
+        """
+        return [row[0] for row in self._audio_groups(['artist'], after=None if after is None else [after],
+                                                     offset=offset, limit=limit)]
+
+    def albums(self,
+               artist: typing.Optional[str] = None,
+               genre: typing.Optional[str] = None,
+               decade: typing.Optional[int] = None,
+               after: typing.Optional[typing.Tuple[str, str]] = None,
+               offset: int = 0,
+               limit: typing.Optional[int] = None) -> typing.List[typing.Tuple[str, str]]:
+        """
+        Albums of all audio items as tuples of album and artist, ignoring case, ordered by album and artist.
+
+        The albums may be restricted to a single artist, a genre or a decade (e.g. 1990 for the years 1990 to 1999),
+        `after` continues the list after the given album and artist, see `artists`.
+        """
+        conditions = []
+        params: typing.Dict[str, typing.Any] = {}
+        if artist is not None:
+            conditions.append('artist = :artist COLLATE NOCASE')
+            params['artist'] = artist
+        if genre is not None:
+            conditions.append('genre = :genre COLLATE NOCASE')
+            params['genre'] = genre
+        if decade is not None:
+            conditions.append('year / 10 = :decade')
+            params['decade'] = decade // 10
+        return self._audio_groups(['album', 'artist'], conditions, params, after, offset, limit)
+
+    def genres(self,
+               after: typing.Optional[str] = None,
+               offset: int = 0,
+               limit: typing.Optional[int] = None) -> typing.List[str]:
+        """
+        Genres of all audio items, ignoring case, in alphabetical order. See `artists` for `after`.
+        """
+        return [row[0] for row in self._audio_groups(['genre'], after=None if after is None else [after],
+                                                     offset=offset, limit=limit)]
+
+    def decades(self,
+                after: typing.Optional[int] = None,
+                offset: int = 0,
+                limit: typing.Optional[int] = None) -> typing.List[int]:
+        """
+        Decades of all audio items with a known year, as first year of the decade. See `artists` for `after`.
+        """
+        rows = self._audio_groups(['year / 10'], after=None if after is None else [after // 10],
+                                  offset=offset, limit=limit)
+        return [row[0] * 10 for row in rows]
+
+    def album_tracks(self,
+                     artist: str,
+                     album: str,
+                     after: typing.Optional[IndexedObject] = None,
+                     offset: int = 0,
+                     limit: typing.Optional[int] = None) -> typing.List[IndexedObject]:
+        """
+        Audio items of an album (of all servers), ordered by track number.
+
+        Servers listing the same item in several containers (e.g. by artist and by genre) use different
+        object IDs for it, such duplicates with the same resource URI are returned once only.
+        `after` continues the list after the given item, see `artists`.
+        """
+        params: typing.Dict[str, typing.Any] = dict(artist=artist,
+                                                    album=album,
+                                                    limit=-1 if limit is None else limit,
+                                                    offset=offset)
+        keyset = ''
+        if after is not None:
+            keyset = 'WHERE (ifnull(track_number, 0), udn, id) > (:track_number, :udn, :id)'
+            params.update(track_number=after.track_number or 0, udn=after.udn, id=after.id)
+        rows = self._connection.execute(
+            f'SELECT {_OBJECT_COLUMNS} FROM ('
+            # min() picks the duplicate with the lowest object ID
+            f'SELECT {_OBJECT_COLUMNS}, min(id) FROM objects '
+            f'WHERE {_AUDIO_ITEM} AND artist = :artist COLLATE NOCASE AND album = :album COLLATE NOCASE '
+            f'GROUP BY udn, ifnull(uri, id)) {keyset} '
+            'ORDER BY ifnull(track_number, 0), udn, id LIMIT :limit OFFSET :offset', params)
+        return [IndexedObject(*row) for row in rows]
+
+    def search(self,
+               query: str,
+               udns: typing.Optional[typing.Iterable[str]] = None,
+               offset: int = 0,
+               limit: typing.Optional[int] = None) -> typing.List[IndexedObject]:
+        """
+        Objects whose title, artist or album contain all whitespace separated terms of `query`, ignoring case.
+
+        Results are ranked by where the terms were found: titles starting with the query first (in alphabetical
+        order, so an exact match comes first), then titles, artists and albums containing all terms and finally
+        objects with the terms spread across these fields (each in index order). Queries consisting of terms
+        shorter than three characters only, which are too unspecific for a substring search, just match the
+        beginning of titles.
+
+        Each rank is queried separately and only as far as needed for the requested page, so the first pages
+        are cheap even for terms matching a large part of the library.
+
+        Parameters
+        ----------
+        query : str
+            Terms to search for
+        udns : iterable of str
+            Restrict the search to these servers, all servers by default
+        offset : int
+            Number of results to skip
+        limit : int
+            Maximum number of results, all by default
+        """
+        query = ' '.join(query.split())
+        if not query:
+            return []
+        # NOCASE only folds ASCII, just like LIKE does
+        params: typing.Dict[str, typing.Any] = dict(low=query, high=query + '\U0010ffff')
+        filters = ['o.deleted_at IS NULL']
+        if udns is not None:
+            udns = list(udns)
+            if not udns:
+                return []
+            filters.append('o.udn IN ({})'.format(', '.join(f':udn{i}' for i in range(len(udns)))))
+            params.update((f'udn{i}', udn) for i, udn in enumerate(udns))
+        terms = list(dict.fromkeys(query.split()))
+        params.update((f'term{i}', '%' + _like_pattern(term) + '%') for i, term in enumerate(terms))
+
+        def contains(column: str, term: str) -> str:
+            return f"coalesce(o.{column}, '') LIKE :term{terms.index(term)} ESCAPE '\\'"
+
+        def contains_all(column: str, terms: typing.Iterable[str]) -> typing.List[str]:
+            return [contains(column, term) for term in terms]
+
+        prefix = 'o.title >= :low COLLATE NOCASE AND o.title < :high COLLATE NOCASE'
+        ranks = [('objects AS o', [prefix], 'o.title COLLATE NOCASE, o.rowid')]
+        if any(len(term) >= _MIN_TRIGRAM_TERM for term in terms):
+            indexed = [term for term in terms if len(term) >= _MIN_TRIGRAM_TERM] if self._search_enabled else []
+            others = [term for term in terms if term not in indexed]
+            if indexed:
+                # the full-text index provides its matches in rowid order without sorting
+                source = 'objects_search JOIN objects AS o ON o.rowid = objects_search.rowid'
+                order = 'objects_search.rowid'
+                params['match'] = ' '.join(_fts_string(term) for term in indexed)
+                params.update((f'match_{column}', ' AND '.join(f'{column}:{_fts_string(term)}' for term in indexed))
+                              for column in ('title', 'artist', 'album'))
+            else:
+                source, order = 'objects AS o', 'o.rowid'
+            found: typing.List[str] = [prefix]
+            for column in ('title', 'artist', 'album'):
+                conditions = [f'objects_search MATCH :match_{column}'] if indexed else []
+                conditions += contains_all(column, others)
+                conditions += [f'NOT ({condition})' for condition in found]
+                ranks.append((source, conditions, order))
+                found.append(' AND '.join(contains_all(column, terms)))
+            conditions = ['objects_search MATCH :match'] if indexed else []
+            conditions += ['({})'.format(' OR '.join(contains(column, term) for column in ('title', 'artist', 'album')))
+                           for term in others]
+            conditions += [f'NOT ({condition})' for condition in found]
+            ranks.append((source, conditions, order))
+
+        columns = ', '.join(f'o.{column}' for column in _OBJECT_COLUMNS.split(', '))
+        results: typing.List[IndexedObject] = []
+        skip = offset
+        for source, conditions, order in ranks:
+            remaining = -1 if limit is None else limit - len(results)
+            if remaining == 0:
+                break
+            rows = self._connection.execute(
+                f'SELECT {columns} FROM {source} WHERE {" AND ".join(filters + conditions)} ORDER BY {order} '
+                'LIMIT :limit', dict(params, limit=-1 if remaining < 0 else skip + remaining)).fetchall()
+            results.extend(IndexedObject(*row) for row in rows[skip:])
+            skip = max(0, skip - len(rows))
+        return results
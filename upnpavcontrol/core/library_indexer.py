@@ -0,0 +1,374 @@
+"""
+Background crawler filling the `LibraryIndex` with the content of media servers.
+
+Crawling uses background priority (see `device_scheduler`), so it never delays interactive requests,
+and a limited number of workers per server. Browse results of the crawl bypass the browse cache,
+which would otherwise be flushed by the crawl completely.
+
+A server is crawled completely only once. Afterwards, i.e. after a restart or when the server announces
+changes, the index is synced incrementally: only containers whose UpdateID differs from the stored one
+are browsed again, children no longer present are turned into tombstones.
+
+Writing a page of objects to the index (including the updates of its search index) takes a while.
+All writes are therefore run by a thread of the indexer, which also serializes them.
+"""
+import asyncio
+import concurrent.futures
+from dataclasses import dataclass, field
+import functools
+import logging
+import time
+import typing
+from .device_scheduler import Priority, with_priority
+from .library_index import LibraryIndex
+from .mediaserver import MediaServer, LibraryChangeEvent, DEFAULT_PAGE_SIZE
+from .oberserver import Subscription
+
+_logger = logging.getLogger(__name__)
+
+T = typing.TypeVar('T')
+
+DEFAULT_WORKERS = 2
+
+ROOT_CONTAINER = '0'
+
+
+@dataclass
+class CrawlProgress(object):
+    """
+    Progress of the crawl of a single media server.
+
+    Attributes
+    ----------
+    incremental : bool
+        Whether only changed containers are browsed
+    containers : int
+        Number of containers browsed completely
+    unchanged : int
+        Number of containers skipped as unchanged, by incremental crawls
+    objects : int
+        Number of objects stored in the index
+    deleted : int
+        Number of objects turned into tombstones
+    pending : int
+        Number of containers still to be browsed or checked
+    failed : int
+        Number of containers that couldn't be browsed
+    done : bool
+        Whether the crawl is complete
+    started_at : float
+        Time the crawl started, as returned by `time.monotonic`
+    """
+    incremental: bool = False
+    containers: int = 0
+    unchanged: int = 0
+    objects: int = 0
+    deleted: int = 0
+    pending: int = 0
+    failed: int = 0
+    done: bool = False
+    started_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def processed(self) -> int:
+        return self.containers + self.unchanged + self.failed
+
+    def eta(self, now: typing.Optional[float] = None) -> typing.Optional[float]:
+        """
+        Estimated seconds until the crawl is complete, based on the containers processed so far.
+
+        The estimate is rough for complete crawls, as nested containers are only discovered while crawling.
+        """
+        if self.done:
+            return 0.0
+        if self.processed == 0:
+            return None
+        elapsed = (time.monotonic() if now is None else now) - self.started_at
+        return elapsed / self.processed * self.pending
+
+
+class _Crawl(object):
+    """
+    State of a single crawl, shared by its workers.
+    """
+
+    def __init__(self, server: MediaServer, generation: int, progress: CrawlProgress):
+        self.server = server
+        self.generation = generation
+        self.progress = progress
+        self.containers: asyncio.Queue = asyncio.Queue()
+        self.visited: typing.Set[str] = set()
+        # known update IDs of changed containers, as announced by the server
+        self.announced: typing.Dict[str, int] = {}
+        self.failed: typing.List[str] = []
+
+    def add(self, container_id: str, check: bool = False):
+        """
+        Queue a container to be browsed, or to be checked for changes first if `check` is set.
+        """
+        if container_id in self.visited:
+            return
+        self.visited.add(container_id)
+        self.progress.pending += 1
+        self.containers.put_nowait((container_id, check))
+
+
+class LibraryIndexer(object):
+    """
+    Crawls media servers and stores their objects in `index`.
+
+    Parameters
+    ----------
+    index : LibraryIndex
+        Store of the crawled objects
+    workers : int
+        Number of containers browsed concurrently per server
+    page_size : int
+        Number of objects requested per Browse action
+    """
+
+    def __init__(self, index: LibraryIndex, workers: int = DEFAULT_WORKERS, page_size: int = DEFAULT_PAGE_SIZE):
+        self._index = index
+        self._workers = workers
+        self._page_size = page_size
+        self._crawls: typing.Dict[str, asyncio.Task] = {}
+        self._progress: typing.Dict[str, CrawlProgress] = {}
+        self._servers: typing.Dict[str, MediaServer] = {}
+        self._subscriptions: typing.Dict[str, Subscription] = {}
+        # changes announced while a crawl was running, by container ID, None if all containers need to be checked
+        self._changes: typing.Dict[str, typing.Optional[typing.Dict[str, int]]] = {}
+        self._writer = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='library-index')
+
+    @property
+    def index(self) -> LibraryIndex:
+        return self._index
+
+    def progress(self, udn: str) -> typing.Optional[CrawlProgress]:
+        return self._progress.get(udn)
+
+    def is_crawling(self, udn: str) -> bool:
+        return udn in self._crawls
+
+    def start(self, server: MediaServer) -> asyncio.Task:
+        """
+        Start indexing `server` in the background and keep the index up to date with the server's changes.
+
+        Servers never indexed completely before are crawled completely, all others incrementally.
+        """
+        self._servers[server.udn] = server
+        task = self._crawls.get(server.udn)
+        if task is None:
+            task = self._start_crawl(server, self._index_server(server))
+        return task
+
+    def stop(self, udn: str):
+        self._servers.pop(udn, None)
+        task = self._crawls.pop(udn, None)
+        if task is not None:
+            task.cancel()
+        self._changes.pop(udn, None)
+        subscription = self._subscriptions.pop(udn, None)
+        if subscription is not None:
+            asyncio.ensure_future(subscription.unsubscribe())
+
+    async def stop_all(self):
+        tasks = list(self._crawls.values())
+        for task in tasks:
+            task.cancel()
+        self._servers.clear()
+        self._crawls.clear()
+        self._changes.clear()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # writes of the cancelled crawls might still be running, the index must not be closed before they're done
+        await self._write(lambda: None)
+        subscriptions = list(self._subscriptions.values())
+        self._subscriptions.clear()
+        for subscription in subscriptions:
+            await subscription.unsubscribe()
+
+    async def crawl(self, server: MediaServer, root: str = ROOT_CONTAINER) -> CrawlProgress:
+        """
+        Crawl all containers of `server` reachable from `root` and update the index.
+        """
+        with with_priority(Priority.BACKGROUND):
+            system_update_id = await self._system_update_id(server)
+            crawl = await self._begin(server, incremental=False)
+            _logger.info('Indexing %s', server.friendly_name)
+            crawl.add(root)
+            await self._run(crawl)
+            progress = crawl.progress
+            if progress.failed:
+                # objects of the failed containers are unknown, so keep everything from previous crawls
+                _logger.warning('Indexed %d objects of %s, %d containers failed', progress.objects,
+                                server.friendly_name, progress.failed)
+                return progress
+            progress.deleted += await self._write(self._index.finish_crawl, server.udn, crawl.generation,
+                                                  system_update_id)
+            _logger.info('Indexed %d objects of %s in %d containers, dropped %d', progress.objects,
+                         server.friendly_name, progress.containers, progress.deleted)
+            return progress
+
+    async def resync(self,
+                     server: MediaServer,
+                     container_update_ids: typing.Optional[typing.Mapping[str, int]] = None) -> CrawlProgress:
+        """
+        Update the index incrementally, browsing only containers that changed since they were indexed.
+
+        If `container_update_ids` (e.g. announced by a ContainerUpdateIDs event) is given, only these containers
+        are checked. Otherwise all indexed containers are, unless the server's SystemUpdateID didn't change at all.
+        """
+        with with_priority(Priority.BACKGROUND):
+            system_update_id = await self._system_update_id(server)
+            stored = self._index.server(server.udn)
+            crawl = await self._begin(server, incremental=True)
+            if container_update_ids is not None:
+                crawl.announced.update(container_update_ids)
+                candidates: typing.Iterable[str] = container_update_ids.keys()
+            elif (stored is not None and system_update_id is not None
+                  and stored.system_update_id == system_update_id):
+                candidates = []
+            else:
+                candidates = self._index.container_ids(server.udn) or [ROOT_CONTAINER]
+            for container_id in candidates:
+                crawl.add(container_id, check=True)
+            _logger.debug('Checking %d containers of %s for changes', crawl.progress.pending, server.friendly_name)
+            await self._run(crawl)
+            progress = crawl.progress
+            # containers removed from the server can't be browsed anymore, that's fine as long as their parent
+            # has been synced meanwhile
+            progress.failed = len([c for c in crawl.failed if self._index.has_container(server.udn, c)])
+            if progress.failed:
+                # retry the failed containers with the next sync
+                _logger.warning('Synced %s, %d containers failed', server.friendly_name, progress.failed)
+                return progress
+            if container_update_ids is None:
+                await self._write(self._index.finish_crawl,
+                                  server.udn,
+                                  crawl.generation,
+                                  system_update_id,
+                                  drop_stale=False)
+            if progress.containers:
+                _logger.info('Synced %s: %d changed containers, %d objects updated, %d dropped',
+                             server.friendly_name, progress.containers, progress.objects, progress.deleted)
+            return progress
+
+    async def _index_server(self, server: MediaServer) -> CrawlProgress:
+        if server.udn not in self._subscriptions:
+            self._subscriptions[server.udn] = await server.subscribe_library_changes(self._on_library_change)
+        stored = self._index.server(server.udn)
+        if stored is None or stored.indexed_at is None:
+            return await self.crawl(server)
+        return await self.resync(server)
+
+    async def _on_library_change(self, event: LibraryChangeEvent):
+        server = self._servers.get(event.udn)
+        if server is None:
+            return
+        changes = self._changes.get(event.udn, {})
+        if changes is not None and event.container_update_ids:
+            changes.update(event.container_update_ids)
+        else:
+            changes = None
+        self._changes[event.udn] = changes
+        # if a crawl is running, the changes are synced once it's done
+        if event.udn not in self._crawls:
+            self._start_pending_resync(server)
+
+    def _start_pending_resync(self, server: MediaServer):
+        if server.udn in self._changes:
+            self._start_crawl(server, self.resync(server, self._changes.pop(server.udn)))
+
+    def _start_crawl(self, server: MediaServer, crawl: typing.Awaitable) -> asyncio.Task:
+        task = asyncio.ensure_future(crawl)
+        self._crawls[server.udn] = task
+        task.add_done_callback(lambda t: self._crawl_done(server, t))
+        return task
+
+    async def _write(self, write: typing.Callable[..., T], *args, **kwargs) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer, functools.partial(write, *args, **kwargs))
+
+    async def _begin(self, server: MediaServer, incremental: bool) -> _Crawl:
+        progress = CrawlProgress(incremental=incremental)
+        self._progress[server.udn] = progress
+        generation = await self._write(self._index.begin_crawl, server.udn, server.friendly_name)
+        return _Crawl(server, generation, progress)
+
+    async def _system_update_id(self, server: MediaServer) -> typing.Optional[int]:
+        try:
+            return await server.get_system_update_id()
+        except Exception:
+            _logger.debug('Failed to get SystemUpdateID of %s', server.friendly_name)
+            return None
+
+    async def _run(self, crawl: _Crawl):
+        workers = [asyncio.ensure_future(self._work(crawl)) for _ in range(self._workers)]
+        try:
+            await crawl.containers.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            crawl.progress.done = True
+
+    async def _work(self, crawl: _Crawl):
+        server = crawl.server
+        progress = crawl.progress
+        while True:
+            container_id, check = await crawl.containers.get()
+            try:
+                if check and await self._is_unchanged(crawl, container_id):
+                    progress.unchanged += 1
+                else:
+                    await self._browse_container(crawl, container_id)
+                    progress.containers += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                progress.failed += 1
+                crawl.failed.append(container_id)
+                _logger.exception('Failed to index container %s of %s', container_id, server.friendly_name)
+            finally:
+                progress.pending -= 1
+                crawl.containers.task_done()
+
+    async def _is_unchanged(self, crawl: _Crawl, container_id: str) -> bool:
+        udn = crawl.server.udn
+        stored = self._index.container_update_id(udn, container_id)
+        if stored is None:
+            return False
+        update_id = crawl.announced.get(container_id)
+        if update_id is None:
+            probe = await crawl.server.browse(container_id, requested_count=1, use_cache=False)
+            update_id = probe.update_id
+        return update_id is not None and update_id == stored
+
+    async def _browse_container(self, crawl: _Crawl, container_id: str):
+        udn = crawl.server.udn
+        starting_index = 0
+        update_id = None
+        async for page in crawl.server.browse_pages(container_id, self._page_size, use_cache=False):
+            if starting_index == 0:
+                update_id = page.update_id
+            records = page.records
+            crawl.progress.objects += await self._write(self._index.store, udn, records, starting_index,
+                                                        crawl.generation)
+            starting_index += len(records)
+            for record in records:
+                if not record.upnpclass.startswith('object.container'):
+                    continue
+                # incremental crawls browse new containers only, changed known ones have been queued already
+                if not crawl.progress.incremental or not self._index.has_container(udn, record.id):
+                    crawl.add(record.id)
+        if crawl.progress.incremental:
+            crawl.progress.deleted += await self._write(self._index.drop_stale_children, udn, container_id,
+                                                        crawl.generation)
+        await self._write(self._index.set_container_update_id, udn, container_id, update_id)
+
+    def _crawl_done(self, server: MediaServer, task: asyncio.Task):
+        if self._crawls.get(server.udn) is task:
+            del self._crawls[server.udn]
+        if not task.cancelled() and task.exception() is not None:
+            _logger.error('Indexing %s failed: %s', server.friendly_name, task.exception())
+        if not task.cancelled() and self._servers.get(server.udn) is server:
+            self._start_pending_resync(server)
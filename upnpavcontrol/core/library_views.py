@@ -0,0 +1,177 @@
+"""
+Virtual containers presenting the audio items of the `LibraryIndex` by artist, album, genre and decade.
+
+Media servers structure their content in very different ways, and navigating e.g. "Music, All Artists, X"
+takes several Browse requests each time. The views provide the same structure for all servers, answered by
+indexed queries instead. Albums and artists are merged across servers.
+
+The views form a tree of their own, with these object IDs (values are URL quoted, except for slashes):
+
+* `0`: the root, with the containers below
+* `artists`: all artists, each an `artist:<artist>` container with the albums of the artist
+* `albums`: all albums, each an `album:<artist>:<album>` container with the items of the album
+* `genres`: all genres, each a `genre:<genre>` container with the albums of the genre
+* `decades`: all decades, each a `decade:<year>` container with the albums of the decade
+
+Items are the indexed objects of the servers, so they keep their UDN and object ID. Albums, artists, genres
+and years are taken from the items (not from containers of the servers), ignoring case.
+"""
+from dataclasses import dataclass
+import typing
+import urllib.parse
+from .library_index import LibraryIndex, IndexedObject
+
+#: reserved UDN of the views, used instead of the UDN of a server
+VIEWS_UDN = 'library'
+
+ROOT = '0'
+
+_TOP_LEVEL = {'artists': 'Artists', 'albums': 'Albums', 'genres': 'Genres', 'decades': 'Decades'}
+
+ViewObject = typing.Union['ViewContainer', IndexedObject]
+
+
+@dataclass(frozen=True)
+class ViewContainer(object):
+    """
+    A virtual container of the views, see module description.
+
+    Attributes
+    ----------
+    id : str
+        Object ID of the container within the views
+    parent_id : str
+        Object ID of the parent container, '-1' for the root
+    title : str
+        Title of the container, i.e. the name of the artist, album etc.
+    upnp_class : str
+        UPnP class of the container
+    artist : str, optional
+        Artist of an album
+    """
+    id: str
+    parent_id: str
+    title: str
+    upnp_class: str = 'object.container'
+    artist: typing.Optional[str] = None
+
+    @property
+    def is_container(self) -> bool:
+        return True
+
+
+def _view_id(kind: str, *values) -> str:
+    # slashes are left as they are, the library API takes care of them in object IDs already
+    return ':'.join([kind] + [urllib.parse.quote(str(value), safe='/') for value in values])
+
+
+def _artist(artist: str) -> ViewContainer:
+    return ViewContainer(_view_id('artist', artist), 'artists', artist, 'object.container.person.musicArtist')
+
+
+def _album(album: str, artist: str) -> ViewContainer:
+    return ViewContainer(_view_id('album', artist, album), _view_id('artist', artist), album,
+                         'object.container.album.musicAlbum', artist)
+
+
+def _genre(genre: str) -> ViewContainer:
+    return ViewContainer(_view_id('genre', genre), 'genres', genre, 'object.container.genre.musicGenre')
+
+
+def _decade(decade: int) -> ViewContainer:
+    return ViewContainer(_view_id('decade', decade), 'decades', f'{decade}s')
+
+
+def parse_view_id(view_id: str) -> ViewContainer:
+    """
+    The container with the given object ID, raises KeyError for IDs not denoting any container of the views.
+
+    The container is created from its ID alone, whether it contains any items is not checked.
+    """
+    kind, *parts = view_id.split(':')
+    values = [urllib.parse.unquote(part) for part in parts]
+    if view_id == ROOT:
+        return ViewContainer(ROOT, '-1', 'Library')
+    if kind in _TOP_LEVEL and not values:
+        return ViewContainer(kind, ROOT, _TOP_LEVEL[kind])
+    if kind == 'artist' and len(values) == 1:
+        return _artist(values[0])
+    if kind == 'album' and len(values) == 2:
+        return _album(values[1], values[0])
+    if kind == 'genre' and len(values) == 1:
+        return _genre(values[0])
+    if kind == 'decade' and len(values) == 1 and values[0].isdigit():
+        return _decade(int(values[0]))
+    raise KeyError(view_id)
+
+
+class LibraryViews(object):
+    """
+    Lists the content of the containers of the views, see module description.
+
+    All lists have a stable order and support keyset paging: passing the last object of a page as `after`
+    continues the list right after it, without the cost of skipping all previous objects like `offset` does.
+    """
+
+    def __init__(self, index: LibraryIndex):
+        self._index = index
+
+    @property
+    def index(self) -> LibraryIndex:
+        return self._index
+
+    def children(self,
+                 view_id: str,
+                 after: typing.Optional[ViewObject] = None,
+                 offset: int = 0,
+                 limit: typing.Optional[int] = None) -> typing.List[ViewObject]:
+        """
+        The children of a container of the views, raises KeyError for unknown containers.
+
+        Parameters
+        ----------
+        view_id : str
+            Object ID of the container
+        after : ViewContainer or IndexedObject
+            Continue after this child, as returned by a previous call for the same container
+        offset : int
+            Number of children to skip (after `after`, if given)
+        limit : int
+            Maximum number of children, all by default
+        """
+        container = parse_view_id(view_id)
+        kind, *_ = view_id.split(':')
+        paging = dict(offset=offset, limit=limit)
+        if view_id == ROOT:
+            top_level = [parse_view_id(kind) for kind in _TOP_LEVEL]
+            start = top_level.index(after) + 1 if after in top_level else 0
+            stop = None if limit is None else start + offset + limit
+            return typing.cast(typing.List[ViewObject], top_level[start + offset:stop])
+        if kind == 'artists':
+            after_artist = after.title if isinstance(after, ViewContainer) else None
+            return [_artist(artist) for artist in self._index.artists(after_artist, **paging)]
+        if kind == 'albums':
+            return self._albums(after, **paging)
+        if kind == 'artist':
+            return self._albums(after, artist=container.title, **paging)
+        if kind == 'genres':
+            after_genre = after.title if isinstance(after, ViewContainer) else None
+            return [_genre(genre) for genre in self._index.genres(after_genre, **paging)]
+        if kind == 'genre':
+            return self._albums(after, genre=container.title, **paging)
+        if kind == 'decades':
+            after_decade = int(after.id.split(':')[1]) if isinstance(after, ViewContainer) else None
+            return [_decade(decade) for decade in self._index.decades(after_decade, **paging)]
+        if kind == 'decade':
+            return self._albums(after, decade=int(view_id.split(':')[1]), **paging)
+        # an album
+        return typing.cast(
+            typing.List[ViewObject],
+            self._index.album_tracks(typing.cast(str, container.artist),
+                                     container.title,
+                                     after=after if isinstance(after, IndexedObject) else None,
+                                     **paging))
+
+    def _albums(self, after: typing.Optional[ViewObject], **kwargs) -> typing.List[ViewObject]:
+        after_album = (after.title, after.artist) if isinstance(after, ViewContainer) else None
+        return [_album(album, artist) for album, artist in self._index.albums(after=after_album, **kwargs)]
@@ -2,9 +2,12 @@ import logging
 from .notification_backend import NotificationBackend
 from .oberserver import Observable, Subscription
 from . import didllite
+from . import xml_backend
+from .device_scheduler import DeviceScheduler
+from .settings import ControlPointSettings
+from .single_flight import SingleFlight, call_action
 from .playback.protocol_info import parse_protocol_infos
 from async_upnp_client.client import UpnpStateVariable, UpnpDevice, UpnpService
-import defusedxml.ElementTree as etree
 from typing import Iterable, Optional, cast
 import asyncio
 from pydantic import BaseModel
@@ -44,7 +47,7 @@ def prettify_xml(xml_frame):
 
 
 def _set_current_track_metadata(xml: str, info: PlaybackInfo):
-    didl = didllite.from_xml_string(xml)
+    didl = didllite.from_xml_string(xml, cache=didllite.shared_cache)
     changed = False
     if len(didl) > 0:
         current = didl[0]
@@ -64,7 +67,7 @@ def _set_current_track_metadata(xml: str, info: PlaybackInfo):
 
 def update_playback_info_from_event(info: PlaybackInfo, event: str) -> bool:
     _logger.debug(event)
-    tree = etree.fromstring(event)
+    tree = xml_backend.fromstring(event)
     any_value_changed = False
     vol = tree.find("./rcs:InstanceID[@val='0']/rcs:Volume", namespaces=_nsmap)
     if vol is not None:
@@ -85,7 +88,9 @@ def update_playback_info_from_event(info: PlaybackInfo, event: str) -> bool:
     return any_value_changed
 
 
-async def create_media_renderer(device: UpnpDevice, notification_backend: Optional[NotificationBackend] = None):
+async def create_media_renderer(device: UpnpDevice,
+                                notification_backend: Optional[NotificationBackend] = None,
+                                settings: Optional[ControlPointSettings] = None):
     """
     Factory function to create a MediaRenderer.
 
@@ -94,18 +99,25 @@ async def create_media_renderer(device: UpnpDevice, notification_backend: Option
     The rationale behind this is that this factory function will use some async functions to update the renderers
     internal state, and `__init__` methods cannot be async.
     """
-    renderer = MediaRenderer(device, notification_backend)
-    await renderer.update_playback_info()
-    await renderer._playback_observable.notify(renderer.playback_info)
+    renderer = MediaRenderer(device, notification_backend, settings=settings)
+    await renderer.refresh_playback_info()
     return renderer
 
 
 class MediaRenderer(object):
 
-    def __init__(self, device: UpnpDevice, notification_backend: Optional[NotificationBackend] = None):
+    def __init__(self,
+                 device: UpnpDevice,
+                 notification_backend: Optional[NotificationBackend] = None,
+                 scheduler: Optional[DeviceScheduler] = None,
+                 settings: Optional[ControlPointSettings] = None):
         self._device = device
+        if scheduler is None:
+            scheduler = (settings if settings is not None else ControlPointSettings()).create_scheduler()
+        self._scheduler = scheduler
         self._notify_backend = notification_backend
         self._notifications_enabled = False
+        self._in_flight = SingleFlight()
         self.rendering_control.on_event = self._on_event
         if self.av_transport is not None:
             self.av_transport.on_event = self._on_event
@@ -124,17 +136,29 @@ class MediaRenderer(object):
     def __repr__(self):
         return '<MediaRenderer {}>'.format(self.friendly_name)
 
+    @property
+    def scheduler(self) -> DeviceScheduler:
+        return self._scheduler
+
+    async def call_action(self, service: UpnpService, action: str, **kwargs):
+        """
+        Call an action of one of the renderer's services, scheduled by the renderer's scheduler.
+        """
+        return await call_action(self._in_flight, service, action, scheduler=self._scheduler, **kwargs)
+
     async def get_volume(self):
-        response = await self.rendering_control.action('GetVolume').async_call(InstanceID=0, Channel='Master')
+        response = await self.call_action(self.rendering_control, 'GetVolume', InstanceID=0, Channel='Master')
         return response['CurrentVolume']
 
     async def set_volume(self, value):
-        return await self.rendering_control.action('SetVolume').async_call(InstanceID=0,
-                                                                           Channel='Master',
-                                                                           DesiredVolume=value)
+        return await self.call_action(self.rendering_control,
+                                      'SetVolume',
+                                      InstanceID=0,
+                                      Channel='Master',
+                                      DesiredVolume=value)
 
     async def get_protocol_info(self):
-        response = await self.connection_manager.async_call_action('GetProtocolInfo')  # type: ignore
+        response = await self.call_action(self.connection_manager, 'GetProtocolInfo')
         data = response['Sink']
         return parse_protocol_infos(data)
 
@@ -154,6 +178,13 @@ class MediaRenderer(object):
     async def update_playback_info(self):
         self._playback_info.volume_percent = await self.get_volume()
 
+    async def refresh_playback_info(self):
+        """
+        Update the playback info from the device and notify all subscribers.
+        """
+        await self.update_playback_info()
+        await self._playback_observable.notify(self.playback_info)
+
     async def _enable_notifications(self):
         if self._notifications_enabled:
             return
@@ -1,20 +1,185 @@
 import enum
-import re
+from dataclasses import dataclass, field
 from . import didllite
+from . import parse_pool
+from . import device_scheduler
+from . import server_health
+from .browse_cache import BrowseCache, BrowseKey
+from .device_scheduler import DeviceScheduler, Priority
+from .server_health import ServerHealth
+from .prefetch import Prefetcher
+from .settings import ControlPointSettings
+from .notification_backend import NotificationBackend
+from .single_flight import SingleFlight, call_action
+from .oberserver import Observable, Subscription
+from .xml_sanitizer import sanitize_entities
+from async_upnp_client.client import UpnpService, UpnpStateVariable
+import asyncio
+import copy
 import logging
+import typing
 
 _logger = logging.getLogger(__name__)
 
+#: number of objects requested per Browse action when walking through containers
+DEFAULT_PAGE_SIZE = 100
+
+#: properties searched for text by `text_search_criteria`, as far as supported by the server
+TEXT_SEARCH_PROPERTIES = ('dc:title', 'upnp:artist', 'upnp:album')
+
 
 class BrowseFlags(enum.Enum):
     BrowseDirectChildren = 'BrowseDirectChildren'
     BrowseMetadata = 'BrowseMetadata'
 
 
+class BrowseResult(didllite.DidlLite):
+    """
+    DIDL-Lite document returned by a Browse or Search action, along with the other output arguments of the action.
+
+    `stale` is set for expired results served from the cache since the server couldn't be asked,
+    see `MediaServer.browse`.
+    """
+
+    def __init__(self,
+                 xml: str,
+                 number_returned: typing.Optional[int] = None,
+                 total_matches: typing.Optional[int] = None,
+                 update_id: typing.Optional[int] = None,
+                 cache: typing.Optional[didllite.DidlCache] = None,
+                 records: typing.Optional['didllite.DidlSequence[didllite.DidlRecord]'] = None):
+        super().__init__(xml, cache=cache, records=records)
+        self.number_returned = number_returned
+        self.total_matches = total_matches
+        self.update_id = update_id
+        self.stale = False
+
+
+def _optional_int(value) -> typing.Optional[int]:
+    return None if value is None else int(value)
+
+
+@dataclass(frozen=True)
+class LibraryChangeEvent:
+    """
+    Modification of a media server's library, as announced by its ContentDirectory service.
+
+    Attributes
+    ----------
+    udn : str
+        UDN of the media server
+    system_update_id : int, optional
+        The new SystemUpdateID, if it has been announced
+    container_update_ids : dict
+        Update IDs of all modified containers, by container ID
+    """
+    udn: str
+    system_update_id: typing.Optional[int] = None
+    container_update_ids: typing.Dict[str, int] = field(default_factory=dict)
+
+
+def _split_csv(value: str) -> typing.List[str]:
+    # UPnP CSV values escape commas and backslashes within items with a backslash
+    items = []
+    current: typing.List[str] = []
+    chars = iter(value)
+    for char in chars:
+        if char == '\\':
+            current.append(next(chars, ''))
+        elif char == ',':
+            items.append(''.join(current))
+            current = []
+        else:
+            current.append(char)
+    items.append(''.join(current))
+    return items
+
+
+def parse_container_update_ids(value: typing.Optional[str]) -> typing.Dict[str, int]:
+    """
+    Parse the value of a ContainerUpdateIDs state variable, a CSV list of alternating container IDs and update IDs.
+
+    Malformed pairs are skipped.
+    """
+    if not value:
+        return {}
+    items = _split_csv(value)
+    update_ids = {}
+    for container_id, update_id in zip(items[0::2], items[1::2]):
+        try:
+            update_ids[container_id] = int(update_id)
+        except ValueError:
+            _logger.warning('Ignoring malformed ContainerUpdateIDs entry %s,%s', container_id, update_id)
+    return update_ids
+
+
+def _quote_search_value(value: str) -> str:
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def text_search_criteria(text: str,
+                         capabilities: typing.Collection[str],
+                         properties: typing.Sequence[str] = TEXT_SEARCH_PROPERTIES) -> typing.Optional[str]:
+    """
+    SearchCriteria for objects containing all whitespace separated terms of `text`, each in any of `properties`.
+
+    Only properties contained in the server's search `capabilities` (see `MediaServer.get_search_capabilities`)
+    are used. Returns None if the server can't search any of them or `text` is empty.
+    """
+    searchable = [name for name in properties if '*' in capabilities or name in capabilities]
+    terms = text.split()
+    if not searchable or not terms:
+        return None
+    clauses = [' or '.join(f'{name} contains {_quote_search_value(term)}' for name in searchable) for term in terms]
+    if len(clauses) == 1:
+        return clauses[0]
+    return ' and '.join(f'({clause})' for clause in clauses)
+
+
+async def create_media_server(device,
+                              notification_backend: typing.Optional[NotificationBackend] = None,
+                              settings: typing.Optional[ControlPointSettings] = None):
+    """
+    Factory function to create a MediaServer.
+
+    Other than `MediaServer.__init__()`, this subscribes to the ContentDirectory events of the server,
+    which keep the browse cache up to date and provide the library change notifications.
+    """
+    server = MediaServer(device, notification_backend=notification_backend, settings=settings)
+    await server._enable_notifications()
+    return server
+
+
 class MediaServer(object):
 
-    def __init__(self, device):
+    def __init__(self,
+                 device,
+                 pool: typing.Optional[parse_pool.ParsePool] = None,
+                 cache: typing.Optional[BrowseCache] = None,
+                 notification_backend: typing.Optional[NotificationBackend] = None,
+                 scheduler: typing.Optional[DeviceScheduler] = None,
+                 health: typing.Optional[ServerHealth] = None,
+                 prefetcher: typing.Optional[Prefetcher] = None,
+                 settings: typing.Optional[ControlPointSettings] = None):
         self._device = device
+        self._parse_pool = pool
+        # components not passed explicitly are created according to the settings
+        settings = settings if settings is not None else ControlPointSettings()
+        self._browse_cache = cache if cache is not None else settings.create_browse_cache()
+        self._scheduler = scheduler if scheduler is not None else settings.create_scheduler()
+        self._health = health if health is not None else settings.create_health(device.friendly_name)
+        self._prefetcher = prefetcher if prefetcher is not None else settings.create_prefetcher()
+        self._revalidations: typing.Set[asyncio.Task] = set()
+        self._notify_backend = notification_backend
+        self._notifications_enabled = False
+        self._in_flight = SingleFlight()
+        self._search_capabilities: typing.Optional[typing.FrozenSet[str]] = None
+        # only servers reporting ContainerUpdateIDs allow to invalidate cached results selectively
+        self._reports_container_updates = False
+        self._library_changes = Observable[LibraryChangeEvent]()
+        self._change_notifications: typing.Set[asyncio.Task] = set()
+        if self.content_directory is not None:
+            self.content_directory.on_event = self._on_event
 
     @property
     def friendly_name(self):
@@ -40,21 +205,342 @@ class MediaServer(object):
     def content_directory(self):
         return self._device.service('urn:schemas-upnp-org:service:ContentDirectory:1')
 
+    @property
+    def browse_cache(self) -> BrowseCache:
+        return self._browse_cache
+
+    @property
+    def scheduler(self) -> DeviceScheduler:
+        return self._scheduler
+
+    @property
+    def health(self) -> ServerHealth:
+        return self._health
+
+    @property
+    def prefetcher(self) -> Prefetcher:
+        return self._prefetcher
+
+    async def subscribe_library_changes(self, subscriber) -> Subscription:
+        """
+        Subscribe to `LibraryChangeEvent` notifications.
+        """
+        return await self._library_changes.subscribe(subscriber)
+
+    def _on_event(self, service: UpnpService, variables: typing.Iterable[UpnpStateVariable]):
+        system_update_id = None
+        container_update_ids: typing.Dict[str, int] = {}
+        for variable in variables:
+            if variable.name == 'SystemUpdateID':
+                system_update_id = _optional_int(variable.value)
+            elif variable.name == 'ContainerUpdateIDs':
+                parsed = parse_container_update_ids(typing.cast(str, variable.value))
+                # many servers send an empty value with the initial event, whether they report changes or not
+                if parsed:
+                    self._reports_container_updates = True
+                container_update_ids.update(parsed)
+        if system_update_id is None and not container_update_ids:
+            return
+        _logger.debug('Library of %s changed, SystemUpdateID %s, ContainerUpdateIDs %s', self.friendly_name,
+                      system_update_id, container_update_ids)
+        for container_id, update_id in container_update_ids.items():
+            self._browse_cache.invalidate_container(container_id, update_id)
+        if system_update_id is not None:
+            self._browse_cache.update_system_update_id(system_update_id, precise=self._reports_container_updates)
+        event = LibraryChangeEvent(udn=self.udn,
+                                   system_update_id=system_update_id,
+                                   container_update_ids=container_update_ids)
+        task = asyncio.create_task(self._library_changes.notify(event))
+        self._change_notifications.add(task)
+        task.add_done_callback(self._change_notified)
+
+    def _change_notified(self, task: asyncio.Task):
+        self._change_notifications.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            _logger.error('Notifying library changes of %s failed: %r', self.friendly_name, task.exception())
+
+    async def _enable_notifications(self):
+        if self._notifications_enabled or self._notify_backend is None:
+            return
+        content_directory = self.content_directory
+        if content_directory is None or not content_directory.event_sub_url:
+            _logger.info('%s does not provide ContentDirectory events', self.friendly_name)
+            return
+        try:
+            await self._notify_backend.subscribe(content_directory)
+            self._notifications_enabled = True
+        except Exception:
+            # browsing works without events as well, cached results will just expire by their TTL
+            _logger.warning('Failed to subscribe to ContentDirectory events of %s', self.friendly_name)
+
     async def browse(self,
                      objectID: str,
                      browse_flag: BrowseFlags = BrowseFlags.BrowseDirectChildren,
                      starting_index=0,
-                     requested_count=0):
-        payload = await self.content_directory.async_call_action('Browse',
-                                                                 ObjectID=objectID,
-                                                                 BrowseFlag=browse_flag.value,
-                                                                 StartingIndex=starting_index,
-                                                                 RequestedCount=requested_count,
-                                                                 SortCriteria='',
-                                                                 Filter='*')
-        regex = re.compile(r"&(?!amp;|lt;|gt;)")
-        didl = regex.sub("&amp;", payload['Result'])
-        return didllite.DidlLite(didl)
+                     requested_count=0,
+                     filter='*',
+                     sort_criteria='',
+                     use_cache=True,
+                     allow_stale=False) -> BrowseResult:
+        """
+        Browse the content directory.
+
+        Results are cached, unless `use_cache` is disabled. This will neither lookup nor store the result.
+        Concurrent requests with equal arguments share a single Browse action and its result.
+
+        With `allow_stale`, an expired cached result (flagged as `stale`) is returned if the server can't
+        be reached. While the server is considered unreachable (see `health`), it is returned right away
+        and revalidated in the background as soon as the server may be asked again.
+        """
+        key = (objectID, browse_flag.value, starting_index, requested_count, filter, sort_criteria)
+        allow_stale = allow_stale and use_cache
+        if use_cache:
+            cached = self._browse_cache.get(key)
+            if device_scheduler.current_priority() is Priority.INTERACTIVE:
+                pending = self._in_flight.pending(('Browse', ) + key)
+                self._prefetcher.record_lookup(key,
+                                               cached is not None,
+                                               sent=pending is not None and self._scheduler.admitted(pending))
+            if cached is not None:
+                return cached
+        else:
+            self._browse_cache.bypass()
+        if allow_stale and self._health.state is server_health.HealthState.UNREACHABLE:
+            stale = self._stale_result(key)
+            if stale is not None:
+                self._revalidate(key, browse_flag)
+                return stale
+        try:
+            return await self._in_flight.run(('Browse', ) + key,
+                                             lambda: self._browse(key, browse_flag, use_cache),
+                                             scheduler=self._scheduler)
+        except Exception as e:
+            stale = self._stale_result(key) if allow_stale and server_health.is_connection_error(e) else None
+            if stale is None:
+                raise
+            _logger.info('Browsing %s failed (%r), serving stale result', self.friendly_name, e)
+            return stale
+
+    def prefetch_after(self,
+                       result: BrowseResult,
+                       objectID: str,
+                       starting_index=0,
+                       requested_count=0,
+                       filter='*',
+                       sort_criteria=''):
+        """
+        Prefetch what is likely browsed next after the children of `objectID` have been browsed with the given
+        arguments, in the background. See `prefetch` for details.
+        """
+        key = (objectID, BrowseFlags.BrowseDirectChildren.value, starting_index, requested_count, filter,
+               sort_criteria)
+        self._prefetcher.after_browse(self, key, result)
+
+    def _stale_result(self, key: BrowseKey) -> typing.Optional[BrowseResult]:
+        cached = self._browse_cache.get_stale(key)
+        if cached is None:
+            return None
+        # the cached result may have been returned as valid one before, don't flag it in place
+        stale = copy.copy(cached)
+        stale.stale = True
+        return stale
+
+    def _revalidate(self, key: BrowseKey, browse_flag: BrowseFlags):
+        if not self._health.available:
+            return
+
+        async def revalidate():
+            try:
+                with device_scheduler.with_priority(Priority.BACKGROUND):
+                    await self._in_flight.run(('Browse', ) + key,
+                                              lambda: self._browse(key, browse_flag, True),
+                                              scheduler=self._scheduler)
+            except Exception as e:
+                _logger.debug('Revalidation of %s failed: %r', key, e)
+
+        task = asyncio.ensure_future(revalidate())
+        self._revalidations.add(task)
+        task.add_done_callback(self._revalidations.discard)
+
+    async def _browse(self, key: BrowseKey, browse_flag: BrowseFlags, use_cache: bool) -> BrowseResult:
+        objectID, _, starting_index, requested_count, filter, sort_criteria = key
+        payload = await self._health.run(lambda: self._scheduler.run(lambda: self.content_directory.async_call_action(
+            'Browse',
+            ObjectID=objectID,
+            BrowseFlag=browse_flag.value,
+            StartingIndex=starting_index,
+            RequestedCount=requested_count,
+            SortCriteria=sort_criteria,
+            Filter=filter)))
+        result = await self._create_browse_result(payload)
+        if use_cache:
+            if browse_flag is BrowseFlags.BrowseMetadata and len(result.records) > 0:
+                containers: typing.Tuple[str, ...] = (objectID, result.records[0].parentID)
+            else:
+                containers = (objectID, )
+            self._browse_cache.put(key, result, len(result.xml), result.update_id, containers)
+        return result
+
+    async def _create_browse_result(self, payload) -> BrowseResult:
+        didl = sanitize_entities(payload['Result'])
+        cache = didllite.shared_cache
+        pool = self._parse_pool or parse_pool.shared_pool
+        records = None
+        if pool.should_offload(didl):
+            # parse large documents completely off the event loop, unless already cached
+            records = cache.cached_records(didl)
+            if records is None:
+                records = await pool.parse(didllite.parse_records, didl)
+                cache.store_records(didl, records)
+        return BrowseResult(didl,
+                            number_returned=_optional_int(payload.get('NumberReturned')),
+                            total_matches=_optional_int(payload.get('TotalMatches')),
+                            update_id=_optional_int(payload.get('UpdateID')),
+                            cache=cache,
+                            records=records)
+
+    def lookup_cached_records(self, object_ids: typing.Iterable[str]) -> typing.Dict[str, didllite.DidlRecord]:
+        """
+        Find the metadata of the given objects in cached browse results, without any request to the server.
+
+        Only results browsed without filter provide complete metadata and are considered. Records not converted
+        yet (e.g. of prefetched or restored results) are skipped rather than parsing the results on the event loop.
+        Returns the records found by their object ID, objects not found are omitted.
+        """
+        wanted = set(object_ids)
+        found: typing.Dict[str, didllite.DidlRecord] = {}
+        for key, result in self._browse_cache.items():
+            if len(found) == len(wanted):
+                break
+            if key[4] != '*':
+                continue
+            for record in result.iter_converted_records():
+                if record.id in wanted and record.id not in found:
+                    found[record.id] = record
+        return found
+
+    async def get_system_update_id(self) -> typing.Optional[int]:
+        """
+        The current SystemUpdateID of the server, as last announced by an event or requested from the server.
+        """
+        if self._notifications_enabled and self._browse_cache.system_update_id is not None:
+            return self._browse_cache.system_update_id
+        response = await self._health.run(lambda: call_action(
+            self._in_flight, self.content_directory, 'GetSystemUpdateID', scheduler=self._scheduler))
+        return _optional_int(response.get('Id'))
+
+    async def get_search_capabilities(self) -> typing.FrozenSet[str]:
+        """
+        The properties the server allows to use in SearchCriteria, '*' if all of them.
+
+        Empty if the server doesn't support the Search action. The capabilities are requested only once.
+        """
+        if self._search_capabilities is None:
+            content_directory = self.content_directory
+            try:
+                response = await self._health.run(lambda: call_action(
+                    self._in_flight, content_directory, 'GetSearchCapabilities', scheduler=self._scheduler))
+            except KeyError:
+                # not even offered by the service description
+                _logger.info('%s does not support GetSearchCapabilities', self.friendly_name)
+                response = {}
+            caps = response.get('SearchCaps') or ''
+            self._search_capabilities = frozenset(item.strip() for item in _split_csv(caps) if item.strip())
+        return self._search_capabilities
+
+    async def search(self,
+                     container_id: str = '0',
+                     search_criteria: str = '*',
+                     starting_index=0,
+                     requested_count=0,
+                     filter='*',
+                     sort_criteria='') -> BrowseResult:
+        """
+        Search the objects below a container matching the given SearchCriteria.
+
+        Other than browse results, search results are not cached, since any container below `container_id`
+        may affect them. Concurrent requests with equal arguments share a single Search action though.
+        """
+        key = (container_id, search_criteria, starting_index, requested_count, filter, sort_criteria)
+        return await self._in_flight.run(('Search', ) + key, lambda: self._search(*key), scheduler=self._scheduler)
+
+    async def _search(self, container_id: str, search_criteria: str, starting_index: int, requested_count: int,
+                      filter: str, sort_criteria: str) -> BrowseResult:
+        payload = await self._health.run(lambda: self._scheduler.run(lambda: self.content_directory.async_call_action(
+            'Search',
+            ContainerID=container_id,
+            SearchCriteria=search_criteria,
+            Filter=filter,
+            StartingIndex=starting_index,
+            RequestedCount=requested_count,
+            SortCriteria=sort_criteria)))
+        return await self._create_browse_result(payload)
+
+    async def browse_pages(self,
+                           objectID: str,
+                           page_size: int = DEFAULT_PAGE_SIZE,
+                           filter='*',
+                           sort_criteria='',
+                           use_cache=True) -> typing.AsyncIterator[BrowseResult]:
+        """
+        Browse all children of a container, `page_size` objects per Browse action.
+
+        Each page is yielded as soon as it is received, see `browse` for `use_cache`.
+        """
+        starting_index = 0
+        while True:
+            page = await self.browse(objectID,
+                                     starting_index=starting_index,
+                                     requested_count=page_size,
+                                     filter=filter,
+                                     sort_criteria=sort_criteria,
+                                     use_cache=use_cache)
+            count = len(page.records)
+            if count > 0:
+                yield page
+            starting_index += count
+            # servers may return less than requested, so rely on TotalMatches if available
+            if page.total_matches is not None:
+                if count == 0 or starting_index >= page.total_matches:
+                    return
+            elif count < page_size:
+                return
+
+    async def walk_items(self,
+                         objectID: str,
+                         recursive: bool = False,
+                         max_depth: typing.Optional[int] = None,
+                         page_size: int = DEFAULT_PAGE_SIZE) -> typing.AsyncIterator[typing.List[didllite.DidlRecord]]:
+        """
+        Collect all items (i.e. no containers) of a container in batches, in the order the server returns them.
+
+        If `recursive` is set, the items of nested containers are collected as well, up to `max_depth` levels
+        below the container (unlimited if `None`). Each batch is yielded as soon as the page it stems from has
+        been received, before browsing nested containers.
+        """
+        async for items in self._walk_items(objectID, recursive, max_depth, page_size, {objectID}):
+            yield items
+
+    async def _walk_items(self, objectID: str, recursive: bool, max_depth: typing.Optional[int], page_size: int,
+                          visited: typing.Set[str]) -> typing.AsyncIterator[typing.List[didllite.DidlRecord]]:
+        async for page in self.browse_pages(objectID, page_size):
+            items: typing.List[didllite.DidlRecord] = []
+            for record in page.records:
+                if not record.upnpclass.startswith('object.container'):
+                    items.append(record)
+                    continue
+                if not recursive or (max_depth is not None and max_depth < 1) or record.id in visited:
+                    # broken servers might even list a container as its own descendant
+                    continue
+                visited.add(record.id)
+                if items:
+                    yield items
+                    items = []
+                child_depth = None if max_depth is None else max_depth - 1
+                async for nested in self._walk_items(record.id, True, child_depth, page_size, visited):
+                    yield nested
+            if items:
+                yield items
 
     async def browse_metadata(self, object_id: str):
         didl = await self.browse(object_id, browse_flag=BrowseFlags.BrowseMetadata)
@@ -0,0 +1,108 @@
+"""
+Parsing of large documents outside of the asyncio event loop.
+
+Parsing a Browse result of several thousand items takes a considerable amount of time.
+Done on the event loop, websocket notifications, GENA callbacks and all other requests
+stall meanwhile. Documents above a configurable size are therefore parsed by an executor instead,
+smaller ones are still parsed inline as the overhead of an executor isn't worth it.
+
+Two kinds of executors are supported:
+
+* `thread`: the default executor of the event loop. Cheap, but parsing still competes with the loop for the GIL,
+  which reduces stalls to the interpreter's switch interval instead of eliminating them.
+* `process`: a process pool. No stalls at all, but parsed results need to be pickled,
+  see `didllite.parse_records`.
+"""
+import asyncio
+import concurrent.futures
+import functools
+import logging
+import typing
+
+_logger = logging.getLogger(__name__)
+
+T = typing.TypeVar('T')
+
+EXECUTOR_KINDS = ('thread', 'process')
+
+#: documents larger than this (in characters) are parsed by the executor by default
+DEFAULT_THRESHOLD = 256 * 1024
+
+
+class ParsePool(object):
+    """
+    Decides which documents are parsed off the event loop and runs the parsing.
+
+    Parameters
+    ----------
+    threshold : int, optional
+        Minimum size of documents to be parsed by the executor, `None` disables offloading
+    executor_kind : str
+        One of `EXECUTOR_KINDS`
+    max_workers : int, optional
+        Number of worker processes, only used for the `process` executor
+    """
+
+    def __init__(self,
+                 threshold: typing.Optional[int] = DEFAULT_THRESHOLD,
+                 executor_kind: str = 'thread',
+                 max_workers: typing.Optional[int] = None):
+        if executor_kind not in EXECUTOR_KINDS:
+            raise ValueError(f'Unknown executor kind {executor_kind}')
+        self._threshold = threshold
+        self._executor_kind = executor_kind
+        self._max_workers = max_workers
+        self._executor: typing.Optional[concurrent.futures.Executor] = None
+        self.offloaded = 0
+        self.inline = 0
+
+    @property
+    def threshold(self) -> typing.Optional[int]:
+        return self._threshold
+
+    @property
+    def executor_kind(self) -> str:
+        return self._executor_kind
+
+    def should_offload(self, data: typing.Sized) -> bool:
+        return self._threshold is not None and len(data) >= self._threshold
+
+    async def parse(self, parse: typing.Callable[[typing.Any], T], data: typing.Any) -> T:
+        """
+        Run `parse(data)` by the executor if `data` is large enough, inline otherwise.
+
+        For the process executor, `parse` and its result must be picklable.
+        """
+        if not self.should_offload(data):
+            self.inline += 1
+            return parse(data)
+        self.offloaded += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), functools.partial(parse, data))
+
+    def shutdown(self, wait: bool = True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    def _get_executor(self) -> typing.Optional[concurrent.futures.Executor]:
+        # None selects the default (thread) executor of the running loop
+        if self._executor_kind == 'process' and self._executor is None:
+            _logger.debug('Starting parser process pool')
+            self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self._max_workers)
+        return self._executor
+
+
+#: pool used by all media servers
+shared_pool = ParsePool()
+
+
+def configure(threshold: typing.Optional[int] = DEFAULT_THRESHOLD,
+              executor_kind: str = 'thread',
+              max_workers: typing.Optional[int] = None):
+    """
+    Replace the shared pool by one with the given configuration, see `ParsePool`.
+    """
+    global shared_pool
+    shared_pool.shutdown()
+    shared_pool = ParsePool(threshold, executor_kind, max_workers)
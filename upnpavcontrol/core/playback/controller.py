@@ -1,8 +1,10 @@
 from upnpavcontrol.core.typing_compat import Protocol
 from upnpavcontrol.core.mediarenderer import TransportState, PlaybackInfo
 from upnpavcontrol.core.oberserver import Subscription, wait_for_value_if
+from upnpavcontrol.core.device_scheduler import Priority, with_priority
 from .queue import PlaybackQueue, PlaybackItem
-from typing import Optional, Callable, Awaitable
+from typing import Optional, Callable, Awaitable, AsyncIterator, Iterable, List
+import asyncio
 import logging
 
 _logger = logging.getLogger(__name__)
@@ -28,6 +30,9 @@ class QueueInterface(Protocol):
     def clear(self) -> None:
         ...
 
+    def appendItem(self, item: PlaybackItem) -> None:
+        ...
+
     @property
     def current_item(self) -> Optional[PlaybackItem]:
         ...
@@ -43,6 +48,8 @@ class PlaybackController():
             self._queue = PlaybackQueue()
         self._is_playing = False
         self._player_subscription: Optional[Subscription] = None
+        # items still being appended to the queue in the background, in order
+        self._appending: List[asyncio.Task] = []
 
     @property
     def is_playing(self):
@@ -52,6 +59,48 @@ class PlaybackController():
     def queue(self):
         return self._queue
 
+    @property
+    def is_appending(self) -> bool:
+        return len(self._appending) > 0
+
+    def append_in_background(self, batches: AsyncIterator[Iterable[PlaybackItem]]):
+        """
+        Append the items of all batches to the queue as they arrive, after those of earlier calls.
+
+        Clearing the queue or shutting down the controller cancels all appends still in progress.
+        """
+        previous = self._appending[-1] if self._appending else None
+        task = asyncio.ensure_future(self._append_batches(batches, previous))
+        self._appending.append(task)
+        task.add_done_callback(self._appended)
+
+    async def _append_batches(self, batches: AsyncIterator[Iterable[PlaybackItem]], previous: Optional[asyncio.Task]):
+        if previous is not None:
+            await asyncio.wait([previous])
+        with with_priority(Priority.PLAYBACK):
+            async for items in batches:
+                for item in items:
+                    self._queue.appendItem(item)
+
+    def _appended(self, task: asyncio.Task):
+        if task in self._appending:
+            self._appending.remove(task)
+        if not task.cancelled() and task.exception() is not None:
+            _logger.error('Failed to append items to the queue: %s', task.exception())
+
+    def _cancel_appending(self) -> List[asyncio.Task]:
+        # each append waits for the previous one, all of them append to the queue
+        tasks, self._appending = self._appending, []
+        for task in tasks:
+            task.cancel()
+        return tasks
+
+    async def shutdown(self):
+        """
+        Cancel all appends to the queue still in progress.
+        """
+        await asyncio.gather(*self._cancel_appending(), return_exceptions=True)
+
     async def setup_player(self, player: PlaybackControllable):
         self._player = player
 
@@ -87,6 +136,7 @@ class PlaybackController():
                 self._is_playing = False
 
     def clear(self):
+        self._cancel_appending()
         self._queue.clear()
 
     async def stop(self):
@@ -43,6 +43,14 @@ class PlaybackQueue():
         self._items.clear()
         self._current_item_index = None
 
+    def restore(self, items: typing.Iterable[PlaybackItem], current_item_index: typing.Optional[int] = None):
+        """
+        Replace all items, e.g. by the items of a queue saved before.
+        """
+        self._items = list(items)
+        valid = current_item_index is not None and 0 <= current_item_index < len(self._items)
+        self._current_item_index = current_item_index if valid else None
+
     def next_item(self):
         if len(self._items) == 0:
             return None
@@ -3,6 +3,7 @@ import typing
 from .queue import PlaybackItem
 from .protocol_info import match_resources
 from ..oberserver import Subscription
+from ..device_scheduler import Priority, with_priority
 
 from async_upnp_client.exceptions import UpnpActionResponseError
 import logging
@@ -36,22 +37,19 @@ async def play(dms: 'MediaServer', object_id: str, dmr: 'MediaRenderer'):  # noq
     didl = await dms.browse_metadata(object_id)
     playbackitem = didl.objects[0]
     assert len(didl.objects) == 1
-    playback_meta = didl.xml
+    playback_meta = didl.fragment(0)
     dmr_protocol_info = await dmr.get_protocol_info()
     resources = match_resources(playbackitem.res, dmr_protocol_info)
     assert len(resources) > 0
     play_resource = resources[0]
     connection = prepare_for_connection(dmr, dms)
     try:
-        await dmr.av_transport.async_call_action(
-            'SetAVTransportURI',  # type: ignore
-            InstanceID=connection.av_transport_id,
-            CurrentURI=play_resource.uri,
-            CurrentURIMetaData=playback_meta)
-        await dmr.av_transport.async_call_action(
-            'Play',  # type: ignore
-            InstanceID=connection.av_transport_id,
-            Speed="1")
+        await dmr.call_action(dmr.av_transport,
+                              'SetAVTransportURI',
+                              InstanceID=connection.av_transport_id,
+                              CurrentURI=play_resource.uri,
+                              CurrentURIMetaData=playback_meta)
+        await dmr.call_action(dmr.av_transport, 'Play', InstanceID=connection.av_transport_id, Speed="1")
     except UpnpActionResponseError as e:
         _logger.exception(e)
         _logger.debug("%s (%s)", e.error_desc, e.error_code)
@@ -70,13 +68,15 @@ class PlaybackControllableWrapper(object):
 
     async def play(self, item: PlaybackItem):
         dms = self._lookupDms(item.dms)
-        self._connection = await play(dms, item.object_id, self._renderer)
+        with with_priority(Priority.PLAYBACK):
+            self._connection = await play(dms, item.object_id, self._renderer)
 
     async def stop(self):
         if self._connection is not None and self._renderer.av_transport is not None:
-            await self._renderer.av_transport.async_call_action(
-                'Stop',  # type: ignore
-                InstanceID=self._connection.av_transport_id)
+            with with_priority(Priority.PLAYBACK):
+                await self._renderer.call_action(self._renderer.av_transport,
+                                                 'Stop',
+                                                 InstanceID=self._connection.av_transport_id)
             self._connection = None
 
     async def subscribe(self, callback: typing.Callable[['PlaybackInfo'], typing.Awaitable[None]]) -> Subscription:
@@ -0,0 +1,219 @@
+"""
+Predictive prefetching of browse results.
+
+Browsing the library is a sequence of clicks, each waiting for a Browse action unless the result is cached.
+Most clicks are predictable though: the next page of a container, or one of the first child containers listed.
+After a container has been browsed, the `Prefetcher` of its media server therefore browses
+
+* the next page, if there is one,
+* the first page of the first few child containers,
+
+in the background (see `device_scheduler.Priority.BACKGROUND`), so the results are in the browse cache already
+when they are requested. Prefetching costs requests to the server, which are limited per server by a budget
+refilled over time. Its effectiveness is tracked by the hit rate, the share of browse requests answered
+by prefetched results.
+"""
+from collections import OrderedDict
+from dataclasses import dataclass
+import asyncio
+import logging
+import time
+import typing
+from . import device_scheduler
+from .browse_cache import BrowseKey
+from .device_scheduler import Priority
+from .server_health import HealthState
+
+if typing.TYPE_CHECKING:  # pragma: no cover
+    from .mediaserver import BrowseResult, MediaServer
+
+_logger = logging.getLogger(__name__)
+
+#: number of prefetch requests per budget interval, 0 disables prefetching
+DEFAULT_BUDGET = 30
+#: seconds in which the budget is refilled completely
+DEFAULT_BUDGET_INTERVAL = 60.0
+#: number of child containers prefetched after browsing a container
+DEFAULT_MAX_CHILDREN = 3
+#: maximum number of prefetch requests of a server pending at the same time
+DEFAULT_MAX_PENDING = 4
+#: number of prefetched results tracked for the hit rate
+_MAX_TRACKED = 256
+
+
+@dataclass
+class PrefetchStatistics(object):
+    """
+    Statistics of the prefetching of a single server.
+
+    Attributes
+    ----------
+    scheduled : int
+        Number of prefetch requests started
+    completed : int
+        Number of prefetch requests that succeeded
+    failed : int
+        Number of prefetch requests that failed
+    skipped : int
+        Number of prefetch requests not started since the budget was exhausted,
+        too many were pending or the server wasn't healthy
+    lookups : int
+        Number of interactive browse requests
+    hits : int
+        Number of interactive browse requests answered by a prefetched result
+    """
+    scheduled: int = 0
+    completed: int = 0
+    failed: int = 0
+    skipped: int = 0
+    lookups: int = 0
+    hits: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """
+        Share of the interactive browse requests answered by a prefetched result.
+        """
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    @property
+    def accuracy(self) -> float:
+        """
+        Share of the prefetched results that have been used.
+        """
+        return self.hits / self.completed if self.completed else 0.0
+
+
+class Prefetcher(object):
+    """
+    Prefetches the browse results of a single server likely requested next, see module description.
+
+    Parameters
+    ----------
+    budget : int
+        Maximum number of prefetch requests per `budget_interval`, 0 disables prefetching
+    budget_interval : float
+        Seconds in which the budget is refilled completely
+    max_children : int
+        Number of child containers prefetched after browsing a container
+    max_pending : int
+        Maximum number of prefetch requests pending at the same time
+    clock : callable
+        Source of the current time, in seconds
+    """
+
+    def __init__(self,
+                 budget: int = DEFAULT_BUDGET,
+                 budget_interval: float = DEFAULT_BUDGET_INTERVAL,
+                 max_children: int = DEFAULT_MAX_CHILDREN,
+                 max_pending: int = DEFAULT_MAX_PENDING,
+                 clock: typing.Callable[[], float] = time.monotonic):
+        self._budget = budget
+        self._budget_interval = budget_interval
+        self._max_children = max_children
+        self._max_pending = max_pending
+        self._clock = clock
+        self._tokens = float(budget)
+        self._refilled_at = clock()
+        self._pending: typing.Dict[BrowseKey, asyncio.Future] = {}
+        # prefetched results not requested yet
+        self._prefetched: 'OrderedDict[BrowseKey, None]' = OrderedDict()
+        # pending prefetch requests joined by an interactive request
+        self._claimed: typing.Set[BrowseKey] = set()
+        self._statistics = PrefetchStatistics()
+
+    @property
+    def enabled(self) -> bool:
+        return self._budget > 0
+
+    @property
+    def statistics(self) -> PrefetchStatistics:
+        return PrefetchStatistics(**vars(self._statistics))
+
+    def record_lookup(self, key: BrowseKey, cached: bool, sent: bool = False):
+        """
+        Account an interactive browse request, `cached` if it has been answered by the browse cache.
+
+        Requests joining a pending prefetch request count as hits as well if it has been `sent` to the server
+        already. Otherwise the prefetch request is just promoted to the priority of the joining one (see
+        `single_flight.SingleFlight.run`), which saves nothing.
+        """
+        self._statistics.lookups += 1
+        if key in self._prefetched:
+            del self._prefetched[key]
+            if cached:
+                self._statistics.hits += 1
+        elif not cached and key in self._pending and key not in self._claimed:
+            self._claimed.add(key)
+            if sent:
+                self._statistics.hits += 1
+
+    def after_browse(self, server: 'MediaServer', key: BrowseKey, result: 'BrowseResult'):
+        """
+        Prefetch the next page and the first pages of the child containers of the container browsed by `key`.
+        """
+        if not self.enabled or result.stale:
+            return
+        object_id, browse_flag, starting_index, requested_count, filter, sort_criteria = key
+        if browse_flag != 'BrowseDirectChildren':
+            return
+        candidates = []
+        if requested_count > 0:
+            next_index = starting_index + requested_count
+            if result.total_matches is not None:
+                has_more = next_index < result.total_matches
+            else:
+                has_more = len(result.records) >= requested_count
+            if has_more:
+                candidates.append((object_id, browse_flag, next_index, requested_count, filter, sort_criteria))
+        children = [record.id for record in result.records if record.upnpclass.startswith('object.container')]
+        for child_id in children[:self._max_children]:
+            candidates.append((child_id, browse_flag, 0, requested_count, filter, sort_criteria))
+        for candidate in candidates:
+            self._schedule(server, candidate)
+
+    def _schedule(self, server: 'MediaServer', key: BrowseKey):
+        if key in self._pending or key in server.browse_cache:
+            return
+        if server.health.state is not HealthState.HEALTHY or len(self._pending) >= self._max_pending \
+                or not self._take_token():
+            self._statistics.skipped += 1
+            return
+        self._statistics.scheduled += 1
+        task = asyncio.ensure_future(self._prefetch(server, key))
+        self._pending[key] = task
+        task.add_done_callback(lambda _: self._pending.pop(key, None))
+
+    async def _prefetch(self, server: 'MediaServer', key: BrowseKey):
+        from .mediaserver import BrowseFlags
+        object_id, browse_flag, starting_index, requested_count, filter, sort_criteria = key
+        try:
+            with device_scheduler.with_priority(Priority.BACKGROUND):
+                await server.browse(object_id,
+                                    browse_flag=BrowseFlags(browse_flag),
+                                    starting_index=starting_index,
+                                    requested_count=requested_count,
+                                    filter=filter,
+                                    sort_criteria=sort_criteria)
+        except Exception as e:
+            self._statistics.failed += 1
+            self._claimed.discard(key)
+            _logger.debug('Prefetching %s from %s failed: %r', key, server.friendly_name, e)
+            return
+        self._statistics.completed += 1
+        if key in self._claimed:
+            self._claimed.discard(key)
+            return
+        self._prefetched[key] = None
+        while len(self._prefetched) > _MAX_TRACKED:
+            self._prefetched.popitem(last=False)
+
+    def _take_token(self) -> bool:
+        now = self._clock()
+        refill = (now - self._refilled_at) * self._budget / self._budget_interval
+        self._tokens = min(float(self._budget), self._tokens + refill)
+        self._refilled_at = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
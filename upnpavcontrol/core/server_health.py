@@ -0,0 +1,200 @@
+"""
+Health tracking of media servers.
+
+A NAS that is asleep or rebooting doesn't refuse requests, it just doesn't answer, so each request waits for
+its timeout. Each media server therefore gets a `ServerHealth`, which marks the server unreachable after
+consecutive connection failures or timeouts. Requests to an unreachable server fail immediately with
+`ServerUnavailableError`, until a retry interval elapsed. Then a single request is let through as a probe:
+if it succeeds, the server is healthy again, otherwise the retry interval is doubled (up to a maximum).
+"""
+import aiohttp
+import asyncio
+import enum
+import logging
+import time
+import typing
+from dataclasses import dataclass
+
+_logger = logging.getLogger(__name__)
+
+T = typing.TypeVar('T')
+
+#: number of consecutive failures after which a server is considered unreachable
+DEFAULT_FAILURE_THRESHOLD = 2
+#: seconds until the first request to an unreachable server is let through again
+DEFAULT_RETRY_INTERVAL = 10.0
+#: maximum seconds between requests to an unreachable server
+DEFAULT_MAX_RETRY_INTERVAL = 300.0
+
+
+class HealthState(enum.Enum):
+    HEALTHY = 'healthy'
+    #: the last requests failed, but less than the failure threshold
+    DEGRADED = 'degraded'
+    UNREACHABLE = 'unreachable'
+
+
+class ServerUnavailableError(Exception):
+    """
+    Raised for requests to a server known to be unreachable, without sending them.
+
+    Attributes
+    ----------
+    retry_in : float
+        Seconds until requests to the server are sent again
+    """
+
+    def __init__(self, retry_in: float):
+        super().__init__(f'Server unreachable, retrying in {retry_in:.0f} seconds')
+        self.retry_in = retry_in
+
+
+def is_connection_error(error: BaseException) -> bool:
+    """
+    Whether `error` indicates that the server couldn't be reached, as opposed to an error reported by the server.
+    """
+    return isinstance(error, (ServerUnavailableError, asyncio.TimeoutError, aiohttp.ClientConnectionError, OSError))
+
+
+@dataclass
+class HealthStatistics(object):
+    """
+    Statistics of the requests to a single server.
+
+    Attributes
+    ----------
+    state : HealthState
+        Current state of the server
+    consecutive_failures : int
+        Number of failed requests since the last successful one
+    failures : int
+        Number of requests failed due to connection errors or timeouts
+    rejected : int
+        Number of requests failed immediately since the server was unreachable
+    retry_in : float, optional
+        Seconds until the next request to an unreachable server is let through
+    last_error : str, optional
+        The error of the last failed request
+    """
+    state: HealthState = HealthState.HEALTHY
+    consecutive_failures: int = 0
+    failures: int = 0
+    rejected: int = 0
+    retry_in: typing.Optional[float] = None
+    last_error: typing.Optional[str] = None
+
+
+class ServerHealth(object):
+    """
+    Tracks whether a server answers requests, see module description.
+
+    Parameters
+    ----------
+    failure_threshold : int
+        Number of consecutive failures after which the server is considered unreachable
+    retry_interval : float
+        Seconds until the first request to an unreachable server is let through again
+    max_retry_interval : float
+        Maximum seconds between requests to an unreachable server
+    clock : callable
+        Source of the current time, in seconds
+    name : str
+        Name of the server, for logging
+    """
+
+    def __init__(self,
+                 failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 retry_interval: float = DEFAULT_RETRY_INTERVAL,
+                 max_retry_interval: float = DEFAULT_MAX_RETRY_INTERVAL,
+                 clock: typing.Callable[[], float] = time.monotonic,
+                 name: str = 'Server'):
+        self._name = name
+        self._failure_threshold = max(1, failure_threshold)
+        self._retry_interval = retry_interval
+        self._max_retry_interval = max_retry_interval
+        self._clock = clock
+        self._consecutive_failures = 0
+        self._failures = 0
+        self._rejected = 0
+        self._next_interval = retry_interval
+        self._retry_at: typing.Optional[float] = None
+        self._probing = False
+        self._last_error: typing.Optional[str] = None
+
+    @property
+    def state(self) -> HealthState:
+        if self._retry_at is not None:
+            return HealthState.UNREACHABLE
+        if self._consecutive_failures > 0:
+            return HealthState.DEGRADED
+        return HealthState.HEALTHY
+
+    @property
+    def available(self) -> bool:
+        """
+        Whether a request would be sent, i.e. the server is not unreachable or may be probed now.
+        """
+        return self._retry_at is None or (not self._probing and self._retry_at <= self._clock())
+
+    @property
+    def statistics(self) -> HealthStatistics:
+        retry_in = None
+        if self._retry_at is not None:
+            retry_in = max(0.0, self._retry_at - self._clock())
+        return HealthStatistics(state=self.state,
+                                consecutive_failures=self._consecutive_failures,
+                                failures=self._failures,
+                                rejected=self._rejected,
+                                retry_in=retry_in,
+                                last_error=self._last_error)
+
+    async def run(self, call: typing.Callable[[], typing.Awaitable[T]]) -> T:
+        """
+        Await `call()` and track its outcome, raises `ServerUnavailableError` without calling if the server
+        is unreachable.
+        """
+        probe = self._admit()
+        try:
+            result = await call()
+        except Exception as e:
+            if is_connection_error(e):
+                self._record_failure(e, probe)
+            else:
+                # the server answered, even though with an error
+                self._record_success()
+            raise
+        finally:
+            if probe:
+                self._probing = False
+        self._record_success()
+        return result
+
+    def _admit(self) -> bool:
+        if self._retry_at is None:
+            return False
+        if not self.available:
+            self._rejected += 1
+            raise ServerUnavailableError(0.0 if self._probing else self._retry_at - self._clock())
+        self._probing = True
+        return True
+
+    def _record_success(self):
+        if self._retry_at is not None:
+            _logger.info('%s is reachable again', self._name)
+        self._consecutive_failures = 0
+        self._retry_at = None
+        self._next_interval = self._retry_interval
+
+    def _record_failure(self, error: BaseException, probe: bool):
+        self._consecutive_failures += 1
+        self._failures += 1
+        self._last_error = repr(error)
+        if self._retry_at is None and self._consecutive_failures < self._failure_threshold:
+            return
+        if self._retry_at is not None and not probe:
+            # a request sent before the server became unreachable, the retry is already scheduled
+            return
+        _logger.warning('%s is unreachable (%s), retrying in %.0f seconds', self._name, self._last_error,
+                        self._next_interval)
+        self._retry_at = self._clock() + self._next_interval
+        self._next_interval = min(self._next_interval * 2, self._max_retry_interval)
@@ -0,0 +1,86 @@
+from dataclasses import dataclass
+from . import browse_cache
+from . import device_scheduler
+from . import prefetch
+from . import server_health
+from .browse_cache import BrowseCache
+from .device_scheduler import DeviceScheduler
+from .prefetch import Prefetcher
+from .server_health import ServerHealth
+
+#: seconds each media server has to answer a search of all servers, defined here as `federated_search` depends on
+#: the media server, which depends on this module
+DEFAULT_SEARCH_TIMEOUT = 5.0
+
+
+@dataclass
+class ControlPointSettings(object):
+    """
+    Settings of an `AVControlPoint`, applied to the devices it discovers.
+
+    Attributes
+    ----------
+    browse_cache_ttl : float
+        Seconds a browse result is cached, 0 disables the cache
+    browse_cache_max_entries : int
+        Maximum number of browse results cached per media server
+    browse_cache_max_size : int
+        Maximum accumulated size of the browse results cached per media server
+    browse_cache_max_stale : float
+        Seconds expired browse results are retained to be served while the media server is unreachable
+    device_max_concurrency : int
+        Maximum number of actions in flight per device
+    device_max_wait : float
+        Seconds after which a queued action is sent regardless of its priority
+    server_failure_threshold : int
+        Number of consecutive failures after which a media server is considered unreachable
+    server_retry_interval : float
+        Seconds until the first request to an unreachable media server is let through again
+    server_max_retry_interval : float
+        Maximum seconds between requests to an unreachable media server
+    prefetch_budget : int
+        Maximum number of prefetch requests per media server and `prefetch_budget_interval`, 0 disables prefetching
+    prefetch_budget_interval : float
+        Seconds in which the prefetch budget is refilled completely
+    prefetch_children : int
+        Number of child containers prefetched after browsing a container
+    prefetch_max_pending : int
+        Maximum number of prefetch requests per media server pending at the same time
+    search_timeout : float
+        Seconds each media server has to answer a search of all servers
+    """
+    browse_cache_ttl: float = browse_cache.DEFAULT_TTL
+    browse_cache_max_entries: int = browse_cache.DEFAULT_MAX_ENTRIES
+    browse_cache_max_size: int = browse_cache.DEFAULT_MAX_SIZE
+    browse_cache_max_stale: float = browse_cache.DEFAULT_MAX_STALE
+    device_max_concurrency: int = device_scheduler.DEFAULT_MAX_CONCURRENCY
+    device_max_wait: float = device_scheduler.DEFAULT_MAX_WAIT
+    server_failure_threshold: int = server_health.DEFAULT_FAILURE_THRESHOLD
+    server_retry_interval: float = server_health.DEFAULT_RETRY_INTERVAL
+    server_max_retry_interval: float = server_health.DEFAULT_MAX_RETRY_INTERVAL
+    prefetch_budget: int = prefetch.DEFAULT_BUDGET
+    prefetch_budget_interval: float = prefetch.DEFAULT_BUDGET_INTERVAL
+    prefetch_children: int = prefetch.DEFAULT_MAX_CHILDREN
+    prefetch_max_pending: int = prefetch.DEFAULT_MAX_PENDING
+    search_timeout: float = DEFAULT_SEARCH_TIMEOUT
+
+    def create_browse_cache(self) -> BrowseCache:
+        return BrowseCache(ttl=self.browse_cache_ttl,
+                           max_entries=self.browse_cache_max_entries,
+                           max_size=self.browse_cache_max_size,
+                           max_stale=self.browse_cache_max_stale)
+
+    def create_scheduler(self) -> DeviceScheduler:
+        return DeviceScheduler(max_concurrency=self.device_max_concurrency, max_wait=self.device_max_wait)
+
+    def create_health(self, name: str = 'Server') -> ServerHealth:
+        return ServerHealth(failure_threshold=self.server_failure_threshold,
+                            retry_interval=self.server_retry_interval,
+                            max_retry_interval=self.server_max_retry_interval,
+                            name=name)
+
+    def create_prefetcher(self) -> Prefetcher:
+        return Prefetcher(budget=self.prefetch_budget,
+                          budget_interval=self.prefetch_budget_interval,
+                          max_children=self.prefetch_children,
+                          max_pending=self.prefetch_max_pending)
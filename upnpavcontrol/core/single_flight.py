@@ -0,0 +1,113 @@
+"""
+Coalescing of concurrent identical requests to UPnP devices.
+
+Several clients (e.g. browser tabs) opening the same view at once would make the control point send
+the very same SOAP action once per client, which is more than cheap embedded devices can handle.
+Idempotent actions are therefore sent only once while a request with the same arguments is in flight,
+all callers share its (parsed) result or exception.
+"""
+import asyncio
+import logging
+import typing
+from async_upnp_client.client import UpnpService
+from .device_scheduler import DeviceScheduler, current_priority
+
+_logger = logging.getLogger(__name__)
+
+T = typing.TypeVar('T')
+
+#: actions without side effects, concurrent calls with equal arguments may share a single request
+IDEMPOTENT_ACTIONS = frozenset([
+    'Browse',
+    'Search',
+    'GetSearchCapabilities',
+    'GetSortCapabilities',
+    'GetSystemUpdateID',
+    'GetProtocolInfo',
+    'GetCurrentConnectionIDs',
+    'GetCurrentConnectionInfo',
+    'GetVolume',
+    'GetMute',
+    'GetTransportInfo',
+    'GetPositionInfo',
+    'GetMediaInfo',
+])
+
+
+class SingleFlight(object):
+    """
+    Runs at most one call per key at a time, concurrent callers with the same key share its outcome.
+
+    The call runs as a task of its own, so cancelling one of the callers doesn't affect the others.
+    Nothing is cached: once the call completed, the next caller starts a new one.
+    """
+
+    def __init__(self):
+        self._in_flight: typing.Dict[typing.Hashable, asyncio.Future] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._in_flight)
+
+    def pending(self, key: typing.Hashable) -> typing.Optional[asyncio.Future]:
+        """
+        The task of the call for `key` still in flight, if any.
+        """
+        return self._in_flight.get(key)
+
+    async def run(self,
+                  key: typing.Hashable,
+                  call: typing.Callable[[], typing.Awaitable[T]],
+                  scheduler: typing.Optional[DeviceScheduler] = None) -> T:
+        """
+        Await `call()`, or the outcome of the call for `key` still in flight.
+
+        The call runs with the priority of the caller starting it. If it is still queued by `scheduler`,
+        callers joining it with a higher priority promote it to theirs.
+        """
+        future = self._in_flight.get(key)
+        if future is None:
+            self.calls += 1
+            future = asyncio.ensure_future(call())
+            self._in_flight[key] = future
+            future.add_done_callback(lambda f: self._complete(key, f))
+        else:
+            self.coalesced += 1
+            _logger.debug('Joining request in flight %s', key)
+            if scheduler is not None:
+                scheduler.promote(future, current_priority())
+        return await asyncio.shield(future)
+
+    def _complete(self, key: typing.Hashable, future: asyncio.Future):
+        if self._in_flight.get(key) is future:
+            del self._in_flight[key]
+        # all callers might have been cancelled, don't let asyncio complain about an unretrieved exception
+        if not future.cancelled():
+            future.exception()
+
+
+def action_key(service: UpnpService, action: str, arguments: typing.Mapping[str, typing.Any]) -> typing.Hashable:
+    return (service.service_type, action, tuple(sorted(arguments.items())))
+
+
+async def call_action(flight: SingleFlight,
+                      service: UpnpService,
+                      action: str,
+                      *,
+                      scheduler: typing.Optional[DeviceScheduler] = None,
+                      **kwargs) -> typing.Dict[str, typing.Any]:
+    """
+    Call `action` of `service`, coalesced by `flight` if the action is idempotent.
+
+    If a `scheduler` is given, the request is sent as soon as the scheduler admits it.
+    """
+
+    async def call():
+        if scheduler is None:
+            return await service.async_call_action(action, **kwargs)
+        return await scheduler.run(lambda: service.async_call_action(action, **kwargs))
+
+    if action not in IDEMPOTENT_ACTIONS:
+        return await call()
+    return await flight.run(action_key(service, action, kwargs), call, scheduler)
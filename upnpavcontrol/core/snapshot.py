@@ -0,0 +1,278 @@
+"""
+Snapshots of the control point's state on disk, for a warm start.
+
+Without a snapshot, the control point knows nothing after a restart until the devices answered the SSDP search and
+their descriptions have been fetched again, and all browse requests go to the servers. A snapshot contains
+
+* the known media servers and renderers, along with their device and service descriptions,
+* the most recently used results of the browse cache of each server,
+* the playback queue of each renderer.
+
+The devices of a snapshot are restored from the saved descriptions without any request, so they are available
+right away. They are unconfirmed though, until discovery announces them again: see `AVControlPoint`.
+"""
+from dataclasses import dataclass, field, asdict
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import time
+import typing
+from async_upnp_client.client import UpnpDevice, UpnpRequester
+from . import didllite
+from .browse_cache import BrowseCache
+from .mediaserver import BrowseResult
+from .playback.queue import PlaybackItem, PlaybackQueue
+
+_logger = logging.getLogger(__name__)
+
+#: version of the snapshot format, snapshots of other versions are ignored
+SNAPSHOT_VERSION = 1
+#: seconds between periodic snapshots
+DEFAULT_INTERVAL = 300.0
+#: maximum number of browse results saved per server
+DEFAULT_MAX_BROWSE_RESULTS = 64
+#: maximum accumulated size (in characters of the DIDL-Lite documents) of the browse results saved per server
+DEFAULT_MAX_BROWSE_SIZE = 4 * 1024 * 1024
+#: seconds restored devices are kept without being announced by discovery
+DEFAULT_CONFIRM_TIMEOUT = 60.0
+
+
+class DescriptionRecorder(UpnpRequester):
+    """
+    Requester recording the documents fetched through it, i.e. the device and service descriptions
+    if used by a `UpnpFactory`. All requests are sent by the wrapped `requester`, except for preloaded documents.
+    """
+
+    def __init__(self, requester: UpnpRequester):
+        self._requester = requester
+        self._documents: typing.Dict[str, str] = {}
+        self._preloaded: typing.Dict[str, str] = {}
+
+    def documents(self, device: UpnpDevice) -> typing.Optional[typing.Dict[str, str]]:
+        """
+        The descriptions of `device` and its services by URL, None unless all of them have been recorded.
+        """
+        urls = [device.device_url] + [service.scpd_url for service in device.all_services]
+        if any(url not in self._documents for url in urls):
+            return None
+        return {url: self._documents[url] for url in urls}
+
+    @contextlib.contextmanager
+    def preloaded(self, documents: typing.Mapping[str, str]):
+        """
+        Answer requests for the given documents without sending them, within the context.
+        """
+        self._preloaded = dict(documents)
+        try:
+            yield
+        finally:
+            self._preloaded = {}
+
+    async def async_http_request(self,
+                                 method: str,
+                                 url: str,
+                                 headers: typing.Optional[typing.Mapping[str, str]] = None,
+                                 body: typing.Optional[str] = None) -> typing.Tuple[int, typing.Mapping, str]:
+        if method == 'GET' and url in self._preloaded:
+            document = self._preloaded[url]
+            self._documents[url] = document
+            return 200, {}, document
+        status, response_headers, response_body = await self._requester.async_http_request(
+            method, url, headers, body)
+        if method == 'GET' and status == 200:
+            self._documents[url] = response_body
+        return status, response_headers, response_body
+
+
+@dataclass
+class BrowseResultSnapshot(object):
+    """
+    A cached browse result, see `BrowseCache.put` for the attributes.
+    """
+    key: typing.Tuple[str, str, int, int, str, str]
+    xml: str
+    number_returned: typing.Optional[int] = None
+    total_matches: typing.Optional[int] = None
+    update_id: typing.Optional[int] = None
+    containers: typing.List[str] = field(default_factory=list)
+
+
+@dataclass
+class DeviceSnapshot(object):
+    """
+    A media server or renderer.
+
+    Attributes
+    ----------
+    udn : str
+        UDN of the device
+    device_type : str
+        Device type, e.g. 'urn:schemas-upnp-org:device:MediaServer:1'
+    location : str
+        URL of the device description
+    documents : dict
+        Device and service descriptions by URL
+    system_update_id : int, optional
+        SystemUpdateID of a media server, the browse results are valid for
+    browse_results : list
+        The most recently used browse results of a media server, most recent first
+    """
+    udn: str
+    device_type: str
+    location: str
+    documents: typing.Dict[str, str]
+    system_update_id: typing.Optional[int] = None
+    browse_results: typing.List[BrowseResultSnapshot] = field(default_factory=list)
+
+
+@dataclass
+class QueueSnapshot(object):
+    items: typing.List[PlaybackItem] = field(default_factory=list)
+    current_item_index: typing.Optional[int] = None
+
+
+@dataclass
+class ControlPointSnapshot(object):
+    """
+    State of a control point, see module description.
+
+    Attributes
+    ----------
+    created : float
+        Time the snapshot has been taken, in seconds since the epoch
+    devices : list
+        The known media servers and renderers
+    queues : dict
+        Playback queues by UDN of their renderer
+    """
+    created: float = field(default_factory=time.time)
+    devices: typing.List[DeviceSnapshot] = field(default_factory=list)
+    queues: typing.Dict[str, QueueSnapshot] = field(default_factory=dict)
+
+    def to_json(self) -> str:
+        return json.dumps(dict(version=SNAPSHOT_VERSION, **asdict(self)))
+
+    @classmethod
+    def from_json(cls, text: str) -> 'ControlPointSnapshot':
+        """
+        Parse a snapshot as returned by `to_json`, raises ValueError for malformed snapshots or other versions.
+        """
+        data = json.loads(text)
+        if data.get('version') != SNAPSHOT_VERSION:
+            raise ValueError(f'Unsupported snapshot version {data.get("version")}')
+        try:
+            devices = [
+                DeviceSnapshot(**dict(device,
+                                      browse_results=[
+                                          BrowseResultSnapshot(**dict(result, key=tuple(result['key'])))
+                                          for result in device.get('browse_results', [])
+                                      ])) for device in data['devices']
+            ]
+            queues = {
+                udn: QueueSnapshot(items=[PlaybackItem(**item) for item in queue['items']],
+                                   current_item_index=queue.get('current_item_index'))
+                for udn, queue in data['queues'].items()
+            }
+        except (KeyError, TypeError) as e:
+            raise ValueError(f'Malformed snapshot: {e!r}')
+        return cls(created=data['created'], devices=devices, queues=queues)
+
+
+def snapshot_browse_cache(cache: BrowseCache,
+                          max_results: int = DEFAULT_MAX_BROWSE_RESULTS,
+                          max_size: int = DEFAULT_MAX_BROWSE_SIZE) -> typing.List[BrowseResultSnapshot]:
+    """
+    The most recently used valid results of `cache`, as far as within `max_results` and `max_size`.
+    """
+    results: typing.List[BrowseResultSnapshot] = []
+    size = 0
+    for key, value, update_id, containers in cache.export():
+        if len(results) >= max_results:
+            break
+        if not isinstance(value, BrowseResult) or size + len(value.xml) > max_size:
+            continue
+        size += len(value.xml)
+        results.append(
+            BrowseResultSnapshot(key=key,
+                                 xml=value.xml,
+                                 number_returned=value.number_returned,
+                                 total_matches=value.total_matches,
+                                 update_id=update_id,
+                                 containers=list(containers)))
+    return results
+
+
+def restore_browse_cache(cache: BrowseCache, results: typing.Sequence[BrowseResultSnapshot]):
+    """
+    Put the `results` of a snapshot into `cache`, keeping their order of use.
+
+    The results are considered valid for the TTL of the cache from now on, the documents are parsed on first use.
+    """
+    for result in reversed(results):
+        value = BrowseResult(result.xml,
+                             number_returned=result.number_returned,
+                             total_matches=result.total_matches,
+                             update_id=result.update_id,
+                             cache=didllite.shared_cache)
+        cache.put(result.key, value, len(result.xml), result.update_id, result.containers)
+
+
+def snapshot_queue(queue: PlaybackQueue) -> QueueSnapshot:
+    return QueueSnapshot(items=list(queue.items), current_item_index=queue.current_item_index)
+
+
+class SnapshotStore(object):
+    """
+    Saves and loads snapshots of a control point to a file, replacing it atomically.
+
+    Parameters
+    ----------
+    path : str
+        File name of the snapshot
+    interval : float
+        Seconds between periodic snapshots taken by the control point
+    max_browse_results : int
+        Maximum number of browse results saved per server
+    confirm_timeout : float
+        Seconds restored devices are kept without being announced by discovery
+    """
+
+    def __init__(self,
+                 path: str,
+                 interval: float = DEFAULT_INTERVAL,
+                 max_browse_results: int = DEFAULT_MAX_BROWSE_RESULTS,
+                 confirm_timeout: float = DEFAULT_CONFIRM_TIMEOUT):
+        self.path = path
+        self.interval = interval
+        self.max_browse_results = max_browse_results
+        self.confirm_timeout = confirm_timeout
+
+    async def load(self) -> typing.Optional[ControlPointSnapshot]:
+        """
+        The saved snapshot, None if there's none or it can't be read.
+        """
+        try:
+            text = await asyncio.get_running_loop().run_in_executor(None, self._read)
+            return ControlPointSnapshot.from_json(text)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            _logger.warning('Ignoring snapshot %s: %s', self.path, e)
+            return None
+
+    async def save(self, snapshot: ControlPointSnapshot):
+        text = snapshot.to_json()
+        await asyncio.get_running_loop().run_in_executor(None, self._write, text)
+        _logger.debug('Saved snapshot of %d devices to %s', len(snapshot.devices), self.path)
+
+    def _read(self) -> str:
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def _write(self, text: str):
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(temporary, self.path)
@@ -0,0 +1,129 @@
+"""
+Pluggable XML parsing backend.
+
+All XML documents received from UPnP devices (e.g. DIDL-Lite documents or LastChange events)
+are parsed using the functions of this module, which delegate to the active backend.
+
+Two backends are available:
+
+* `lxml`, used by default if lxml is installed. Considerably faster, configured to neither
+  resolve entities nor access the network.
+* `defusedxml`, the fallback based on the standard library ElementTree, hardened against
+  malicious XML.
+
+Both provide ElementTree compatible elements.
+"""
+import defusedxml.ElementTree as _defused_etree
+import io
+import threading
+import typing
+
+try:
+    from lxml import etree as _lxml_etree
+except ImportError:
+    _lxml_etree = None
+
+XMLData = typing.Union[str, bytes]
+
+
+class DefusedXMLBackend(object):
+    name = 'defusedxml'
+
+    def fromstring(self, data: XMLData):
+        return _defused_etree.fromstring(data)
+
+    def iterparse(self, data: XMLData, events: typing.Sequence[str]):
+        source = io.StringIO(data) if isinstance(data, str) else io.BytesIO(data)
+        return _defused_etree.iterparse(source, events=events)
+
+    def tostring(self, element) -> str:
+        return _defused_etree.tostring(element).decode()
+
+
+class LxmlBackend(object):
+    name = 'lxml'
+    _parser_options = dict(resolve_entities=False, no_network=True, load_dtd=False, remove_comments=True)
+
+    def __init__(self):
+        if _lxml_etree is None:
+            raise RuntimeError('lxml is not available')
+        # parsers must not be shared between threads (documents may be parsed by worker threads)
+        self._local = threading.local()
+
+    def _parsers(self):
+        parsers = getattr(self._local, 'parsers', None)
+        if parsers is None:
+            # lxml refuses unicode strings with an encoding declaration, so strings are passed on as UTF-8
+            # and the parser is told to ignore the declared encoding in this case
+            parsers = (_lxml_etree.XMLParser(**self._parser_options),
+                       _lxml_etree.XMLParser(encoding='utf-8', **self._parser_options))
+            self._local.parsers = parsers
+        return parsers
+
+    def fromstring(self, data: XMLData):
+        parser, str_parser = self._parsers()
+        if isinstance(data, str):
+            return _lxml_etree.fromstring(data.encode('utf-8'), parser=str_parser)
+        return _lxml_etree.fromstring(data, parser=parser)
+
+    def iterparse(self, data: XMLData, events: typing.Sequence[str]):
+        options: typing.Dict[str, typing.Any] = dict(self._parser_options)
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+            options['encoding'] = 'utf-8'
+        return _lxml_etree.iterparse(io.BytesIO(data), events=events, **options)
+
+    def tostring(self, element) -> str:
+        return _lxml_etree.tostring(element).decode()
+
+
+XMLBackend = typing.Union[DefusedXMLBackend, LxmlBackend]
+
+_backend_types = {DefusedXMLBackend.name: DefusedXMLBackend, LxmlBackend.name: LxmlBackend}
+
+
+def available_backends() -> typing.List[str]:
+    """
+    Names of all backends that can be used in this environment.
+    """
+    if _lxml_etree is None:
+        return [DefusedXMLBackend.name]
+    return [LxmlBackend.name, DefusedXMLBackend.name]
+
+
+def create_backend(name: typing.Optional[str] = None) -> XMLBackend:
+    """
+    Create the backend with the given name, or the preferred available backend if no name is given.
+    """
+    if name is None:
+        name = available_backends()[0]
+    if name not in available_backends():
+        raise ValueError(f'XML backend {name} is not available')
+    return _backend_types[name]()
+
+
+_active_backend = create_backend()
+
+
+def use_backend(name: typing.Optional[str] = None):
+    """
+    Switch the active backend, see `create_backend`.
+    """
+    global _active_backend
+    _active_backend = create_backend(name)
+
+
+def active_backend() -> XMLBackend:
+    return _active_backend
+
+
+def fromstring(data: XMLData):
+    return _active_backend.fromstring(data)
+
+
+def iterparse(data: XMLData, events: typing.Sequence[str] = ('end', )):
+    return _active_backend.iterparse(data, events)
+
+
+def tostring(element) -> str:
+    return _active_backend.tostring(element)
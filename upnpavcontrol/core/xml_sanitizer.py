@@ -0,0 +1,78 @@
+"""
+Repair of broken entity references in XML documents received from UPnP devices.
+
+Quite a few media servers don't escape ampersands in titles or URLs of their DIDL-Lite documents
+(e.g. ``Simon & Garfunkel`` or ``?album=1&track=2``), which would make the whole Browse result unparseable.
+Every ampersand that doesn't start a reference valid in XML (one of the five predefined entities or a
+character reference) is escaped, everything else is passed on unmodified.
+
+Named entities not known to XML (e.g. ``&nbsp;``) are escaped as well, they'll be resolved when extracting
+the text content of DIDL-Lite elements.
+"""
+import re
+import typing
+
+_broken_ampersand = re.compile(r'&(?!(?:amp|lt|gt|quot|apos|#[0-9]+|#x[0-9a-fA-F]+);)')
+
+# any valid reference is way shorter, an ampersand followed by more characters without ';' is broken for sure
+_MAX_REFERENCE_LENGTH = 32
+
+
+def sanitize_entities(text: str) -> str:
+    """
+    Escape all ampersands of `text` that don't start a valid XML reference.
+
+    `text` is returned as is (not copied) if there's nothing to repair.
+    """
+    if '&' not in text:
+        return text
+    return _broken_ampersand.sub('&amp;', text)
+
+
+class EntitySanitizer(object):
+    """
+    Incremental version of `sanitize_entities`, for documents received or parsed chunk by chunk.
+
+    Each call to `feed` returns the repaired part of the data fed so far, which may be fed to an incremental
+    parser right away. A trailing ampersand, whose reference might continue in the next chunk, is held back until
+    more data is available or `close` is called.
+
+    >>> sanitizer = EntitySanitizer()
+    >>> sanitizer.feed('Tom & Jerry &am') + sanitizer.feed('p; Friends &') + sanitizer.close()
+    'Tom &amp; Jerry &amp; Friends &amp;'
+    """
+
+    def __init__(self):
+        self._pending = ''
+
+    def feed(self, chunk: str) -> str:
+        data = self._pending + chunk if self._pending else chunk
+        last_ampersand = data.rfind('&')
+        tail = data[last_ampersand:] if last_ampersand != -1 else ''
+        if tail and len(tail) < _MAX_REFERENCE_LENGTH and ';' not in tail:
+            self._pending = tail
+            data = data[:last_ampersand]
+        else:
+            self._pending = ''
+        return sanitize_entities(data)
+
+    def close(self) -> str:
+        """
+        Return the repaired remainder of the document.
+        """
+        data, self._pending = self._pending, ''
+        return sanitize_entities(data)
+
+
+def iter_sanitized(chunks: typing.Iterable[str]) -> typing.Iterator[str]:
+    """
+    Repair a document provided in chunks, see `EntitySanitizer`.
+    """
+    sanitizer = EntitySanitizer()
+    for chunk in chunks:
+        sanitized = sanitizer.feed(chunk)
+        if sanitized:
+            yield sanitized
+    remainder = sanitizer.close()
+    if remainder:
+        yield remainder
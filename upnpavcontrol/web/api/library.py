@@ -1,15 +1,27 @@
 from .media_proxy import get_media_proxy_url
-from ...core.mediaserver import BrowseFlags
-from fastapi import APIRouter, Request, HTTPException
+from ...core.mediaserver import BrowseFlags, BrowseResult
+from ...core.library_index import IndexedObject
+from ...core.library_views import LibraryViews, ViewContainer, VIEWS_UDN, parse_view_id
+from ...core import federated_search
+from ...core import server_health
+from fastapi import APIRouter, Request, Response, HTTPException, Query, Header
+from fastapi.responses import StreamingResponse
 import urllib.parse
+import base64
+import binascii
 import logging
 import asyncio
+import math
+import dataclasses
 from .. import models
 import typing
 
 router = APIRouter()
 _logger = logging.getLogger(__name__)
 
+#: Warning header of responses served from the browse cache or index, since the media server couldn't be reached
+STALE_WARNING = '110 - "Response is Stale"'
+
 
 def create_library_item_id(udn: str, objectID: typing.Optional[str] = None):
     assert '.' not in udn
@@ -55,12 +67,15 @@ def get_item_artwork_url(item):
     return None
 
 
+def _library_parent_id(udn: str, parentID: str):
+    if parentID == '-1':
+        return None
+    return create_library_item_id(udn, parentID)
+
+
 def _fixup_item_ids(item, udn):
     item.id = create_library_item_id(udn, item.id)
-    if item.parentID == '-1':
-        item.parentID = None
-    else:
-        item.parentID = create_library_item_id(udn, item.parentID)
+    item.parentID = _library_parent_id(udn, item.parentID)
     return item
 
 
@@ -72,16 +87,199 @@ def _map_item_class(itemclass: str):
 
 
 def format_library_item(item, udn: str):
-    item = _fixup_item_ids(item, udn)
     return {
         'title': item.title,
-        'id': item.id,
-        'parentID': item.parentID,
+        'id': create_library_item_id(udn, item.id),
+        'parentID': _library_parent_id(udn, item.parentID),
         'upnpclass': _map_item_class(item.upnpclass),
         'image': get_item_artwork_url(item)
     }
 
 
+def format_indexed_object(item: IndexedObject):
+    return {
+        'title': item.title,
+        'id': create_library_item_id(item.udn, item.id),
+        'parentID': _library_parent_id(item.udn, item.parent_id),
+        'upnpclass': _map_item_class(item.upnp_class),
+        'image': get_media_proxy_url(item.artwork_uri) if item.artwork_uri is not None else None
+    }
+
+
+def format_indexed_metadata(item: IndexedObject):
+    return models.LibraryItemMetadata(
+        id=create_library_item_id(item.udn, item.id),
+        parentID=_library_parent_id(item.udn, item.parent_id),
+        upnpclass=item.upnp_class,
+        title=item.title,
+        artist=item.artist,
+        genre=item.genre,
+        album=item.album,
+        originalTrackNumber=item.track_number,
+        albumArtURI=get_media_proxy_url(item.artwork_uri) if item.artwork_uri is not None else None)
+
+
+def format_view_container(container: ViewContainer):
+    return {
+        'title': container.title,
+        'id': create_library_item_id(VIEWS_UDN, container.id),
+        'parentID': _library_parent_id(VIEWS_UDN, container.parent_id),
+        'upnpclass': models.LibraryItemType.CONTAINER,
+        'image': None
+    }
+
+
+def _library_views(request: Request) -> typing.Optional[LibraryViews]:
+    indexer = request.app.av_control_point.library_indexer
+    return LibraryViews(indexer.index) if indexer is not None else None
+
+
+def _view_object(views: LibraryViews, id: str):
+    # the child of a view with the given library item ID, as `after` of `LibraryViews.children`
+    udn, objectID = split_library_item_id(id)
+    if udn == VIEWS_UDN:
+        return parse_view_id(objectID or '0')
+    return views.index.get(udn, objectID or '0')
+
+
+def _browse_views(views: LibraryViews, objectID: str, page: int, pagesize: int, after: typing.Optional[str]):
+    last = None
+    if after is not None:
+        last = _view_object(views, after)
+        if last is None:
+            raise HTTPException(status_code=400, detail='Unknown item to continue after')
+    children = views.children(objectID, after=last, offset=page * pagesize, limit=pagesize or None)
+    return [
+        format_view_container(x) if isinstance(x, ViewContainer) else format_indexed_object(x) for x in children
+    ]
+
+
+def _is_unreachable(error: Exception) -> bool:
+    # KeyError: the server is gone, at least it's not discovered currently
+    return isinstance(error, KeyError) or server_health.is_connection_error(error)
+
+
+def _browse_index(request: Request,
+                  udn: str,
+                  objectID: str,
+                  starting_index: int,
+                  requested_count: int,
+                  after: typing.Optional[str] = None):
+    indexer = request.app.av_control_point.library_indexer
+    if indexer is None or not indexer.index.has_container(udn, objectID):
+        return None
+    last = None
+    if after is not None:
+        after_udn, after_objectID = split_library_item_id(after)
+        if after_udn == udn and after_objectID is not None:
+            last = indexer.index.get(udn, after_objectID)
+    children = indexer.index.children(udn,
+                                      objectID,
+                                      after=last,
+                                      offset=0 if last is not None else starting_index,
+                                      limit=requested_count or None)
+    return [format_indexed_object(x) for x in children]
+
+
+def encode_cursor(starting_index: int, pagesize: int, after: typing.Optional[str] = None) -> str:
+    cursor = f'{starting_index}:{pagesize}' if after is None else f'{starting_index}:{pagesize}:{after}'
+    return base64.urlsafe_b64encode(cursor.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> typing.Tuple[int, int, typing.Optional[str]]:
+    """
+    Starting index, page size and ID of the last item of the previous page (if known) of a cursor created
+    by `encode_cursor`, raises ValueError if malformed.
+    """
+    try:
+        decoded = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        parts = decoded.split(':', 2)
+        starting_index, pagesize = (int(x) for x in parts[:2])
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise ValueError(f'Malformed cursor {cursor}') from e
+    if starting_index < 0 or pagesize < 1 or parts[2:] == ['']:
+        raise ValueError(f'Malformed cursor {cursor}')
+    return starting_index, pagesize, parts[2] if len(parts) > 2 else None
+
+
+def browse_etag(result: BrowseResult, system_update_id: typing.Optional[int]) -> typing.Optional[str]:
+    """
+    Weak ETag of a browse result, derived from the UpdateID of the browsed container, or the SystemUpdateID
+    of the server if the container has none. None if neither is known.
+    """
+    if result.update_id is not None:
+        return f'W/"c{result.update_id}"'
+    if system_update_id is not None:
+        return f'W/"s{system_update_id}"'
+    return None
+
+
+def _opaque_tag(etag: str) -> str:
+    etag = etag.strip()
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+def _etag_matches(etag: str, if_none_match: typing.Optional[str]) -> bool:
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    # weak comparison, see RFC 7232 section 2.3.2
+    return any(_opaque_tag(tag) == _opaque_tag(etag) for tag in if_none_match.split(','))
+
+
+async def _browse_server(request: Request,
+                         response: Response,
+                         udn: str,
+                         objectID: str,
+                         starting_index: int,
+                         requested_count: int,
+                         bypass_cache: bool,
+                         after: typing.Optional[str] = None,
+                         if_none_match: typing.Optional[str] = None):
+    """
+    Browse the children of a container, falling back to the library index if the server can't be reached.
+
+    Returns the formatted children and the browse result, None if served by the index. The index continues
+    after the item with ID `after`, if given and known. The ETag of the result (see `browse_etag`) is set
+    on `response`, if any. What is browsed next is prefetched, unless the ETag matches `if_none_match`:
+    the client has the page already then and is just revalidating it.
+    """
+    try:
+        device = request.app.av_control_point.get_mediaserver_by_UDN(udn)
+        result = await device.browse(objectID,
+                                     starting_index=starting_index,
+                                     requested_count=requested_count,
+                                     use_cache=not bypass_cache,
+                                     allow_stale=True)
+    except Exception as e:
+        # neither the server nor the browse cache can answer, the index might still know the container
+        indexed = None
+        if _is_unreachable(e):
+            indexed = _browse_index(request, udn, objectID, starting_index, requested_count, after)
+        if indexed is None:
+            raise
+        response.headers['Warning'] = STALE_WARNING
+        return indexed, None
+    etag = browse_etag(result, device.browse_cache.system_update_id)
+    if etag is not None:
+        response.headers['ETag'] = etag
+    if result.stale:
+        response.headers['Warning'] = STALE_WARNING
+    elif not bypass_cache and (etag is None or not _etag_matches(etag, if_none_match)):
+        device.prefetch_after(result, objectID, starting_index=starting_index, requested_count=requested_count)
+    return [format_library_item(x, udn) for x in result.iter_records()], result
+
+
+def format_server_search_result(result: federated_search.ServerSearchResult):
+    udn = result.server.udn
+    return models.ServerSearchResult(id=create_library_item_id(udn),
+                                     title=result.server.friendly_name,
+                                     status=result.status,
+                                     total_matches=result.total_matches,
+                                     items=[format_library_item(x, udn) for x in result.records])
+
+
 @router.get('/', response_model=typing.List[models.LibraryListItem])
 def get_library_collections(request: Request):
     items = [{
@@ -89,39 +287,250 @@ def get_library_collections(request: Request):
         'id': create_library_item_id(x.udn),
         'upnpclass': models.LibraryItemType.CONTAINER
     } for x in request.app.av_control_point.mediaservers]
+    if request.app.av_control_point.library_indexer is not None:
+        items.insert(0, format_view_container(parse_view_id('0')))
     return items
 
 
+# must be declared before '/{id}', which would match as well
+@router.get('/search', response_model=typing.List[models.LibraryListItem])
+def search_library(request: Request,
+                   q: str = Query(..., min_length=1),
+                   page: int = Query(0, ge=0),
+                   pagesize: int = Query(50, ge=1, le=500)):
+    indexer = request.app.av_control_point.library_indexer
+    if indexer is None:
+        raise HTTPException(status_code=404, detail='Library index not enabled')
+    # objects of servers currently offline can't be browsed or played
+    udns = [server.udn for server in request.app.av_control_point.mediaservers]
+    results = indexer.index.search(q, udns=udns, offset=page * pagesize, limit=pagesize)
+    return [format_indexed_object(item) for item in results]
+
+
+# streams one models.ServerSearchResult per line, as soon as the respective server answered
+@router.get('/search/servers', response_class=StreamingResponse)
+async def search_servers(request: Request,
+                         q: str = Query(..., min_length=1),
+                         pagesize: int = Query(federated_search.DEFAULT_REQUESTED_COUNT, ge=1, le=500),
+                         timeout: typing.Optional[float] = Query(None, gt=0)):
+    servers = list(request.app.av_control_point.mediaservers)
+    if timeout is None:
+        timeout = request.app.av_control_point.settings.search_timeout
+
+    async def lines():
+        async for result in federated_search.federated_search(servers, q, timeout=timeout, requested_count=pagesize):
+            yield format_server_search_result(result).json() + '\n'
+
+    return StreamingResponse(lines(), media_type='application/x-ndjson')
+
+
+@router.get('/{id}/cache', response_model=models.BrowseCacheStatistics)
+def get_library_cache_statistics(request: Request, id: str):
+    udn, _ = split_library_item_id(id)
+    try:
+        device = request.app.av_control_point.get_mediaserver_by_UDN(udn)
+    except KeyError:
+        raise HTTPException(status_code=404)
+    return models.BrowseCacheStatistics.from_orm(device.browse_cache.statistics)
+
+
+@router.get('/{id}/scheduler', response_model=models.SchedulerStatistics)
+def get_library_scheduler_statistics(request: Request, id: str):
+    udn, _ = split_library_item_id(id)
+    try:
+        device = request.app.av_control_point.get_mediaserver_by_UDN(udn)
+    except KeyError:
+        raise HTTPException(status_code=404)
+    return models.SchedulerStatistics.from_orm(device.scheduler.statistics)
+
+
+@router.get('/{id}/health', response_model=models.ServerHealthStatistics)
+def get_library_health_statistics(request: Request, id: str):
+    udn, _ = split_library_item_id(id)
+    try:
+        device = request.app.av_control_point.get_mediaserver_by_UDN(udn)
+    except KeyError:
+        raise HTTPException(status_code=404)
+    return models.ServerHealthStatistics.from_orm(device.health.statistics)
+
+
+@router.get('/{id}/prefetch', response_model=models.PrefetchStatistics)
+def get_library_prefetch_statistics(request: Request, id: str):
+    udn, _ = split_library_item_id(id)
+    try:
+        device = request.app.av_control_point.get_mediaserver_by_UDN(udn)
+    except KeyError:
+        raise HTTPException(status_code=404)
+    return models.PrefetchStatistics.from_orm(device.prefetcher.statistics)
+
+
+@router.get('/{id}/index', response_model=models.LibraryIndexStatus)
+def get_library_index_status(request: Request, id: str):
+    udn, _ = split_library_item_id(id)
+    indexer = request.app.av_control_point.library_indexer
+    if indexer is None:
+        raise HTTPException(status_code=404, detail='Library index not enabled')
+    progress = indexer.progress(udn)
+    server = indexer.index.server(udn)
+    if progress is None and server is None:
+        raise HTTPException(status_code=404)
+    status = dataclasses.asdict(progress) if progress is not None else {}
+    return models.LibraryIndexStatus(crawling=indexer.is_crawling(udn),
+                                     eta_seconds=progress.eta() if progress is not None else None,
+                                     indexed_objects=indexer.index.count(udn),
+                                     indexed_at=server.indexed_at if server is not None else None,
+                                     **status)
+
+
 @router.get('/{id}/metadata', response_model=models.LibraryItemMetadata)
-async def get_library_item(request: Request, id: str):
+async def get_library_item(request: Request, response: Response, id: str, bypass_cache: bool = False):
     try:
         udn, objectID = split_library_item_id(id)
         if objectID is None:
             objectID = '0'
-        device = request.app.av_control_point.get_mediaserver_by_UDN(udn)
-        result = await device.browse(objectID, browse_flag=BrowseFlags.BrowseMetadata)
-        payload = models.LibraryItemMetadata.from_orm(_fixup_item_ids(_fixup_item_media_urls(result.objects[0]), udn))
+        if udn == VIEWS_UDN and _library_views(request) is not None:
+            container = parse_view_id(objectID)
+            return models.LibraryItemMetadata(id=create_library_item_id(VIEWS_UDN, container.id),
+                                              parentID=_library_parent_id(VIEWS_UDN, container.parent_id),
+                                              upnpclass=container.upnp_class,
+                                              title=container.title,
+                                              artist=container.artist)
+        try:
+            device = request.app.av_control_point.get_mediaserver_by_UDN(udn)
+            result = await device.browse(objectID,
+                                         browse_flag=BrowseFlags.BrowseMetadata,
+                                         use_cache=not bypass_cache,
+                                         allow_stale=True)
+        except Exception as e:
+            indexer = request.app.av_control_point.library_indexer
+            indexed = indexer.index.get(udn, objectID) if indexer is not None and _is_unreachable(e) else None
+            if indexed is None:
+                raise
+            response.headers['Warning'] = STALE_WARNING
+            return format_indexed_metadata(indexed)
+        if result.stale:
+            response.headers['Warning'] = STALE_WARNING
+        # parsed records may be shared with the didl cache, don't modify them in place
+        item = result.records[0].copy()
+        payload = models.LibraryItemMetadata.from_orm(_fixup_item_ids(_fixup_item_media_urls(item), udn))
         return payload
+    except server_health.ServerUnavailableError as e:
+        raise HTTPException(status_code=503,
+                            detail='Mediaserver unreachable',
+                            headers={'Retry-After': str(math.ceil(e.retry_in))})
     except Exception as e:
         _logger.exception(e)
         raise HTTPException(status_code=404)
 
 
 @router.get('/{id}')
-async def browse_library(request: Request, id: str, page: int = 0, pagesize: int = 0):
+async def browse_library(request: Request,
+                         response: Response,
+                         id: str,
+                         page: int = 0,
+                         pagesize: int = 0,
+                         bypass_cache: bool = False,
+                         after: typing.Optional[str] = None):
     try:
         # id = urllib.parse.unquote_plus(id)
         udn, objectID = split_library_item_id(id)
         if objectID is None:
             objectID = '0'
-        device = request.app.av_control_point.get_mediaserver_by_UDN(udn)
-        result = await device.browse(objectID, starting_index=page * pagesize, requested_count=pagesize)
-
-        payload = [format_library_item(x, udn) for x in result.objects]
+        views = _library_views(request)
+        if udn == VIEWS_UDN and views is not None:
+            # `after` (the ID of the last item of the previous page) allows paging without skipping
+            return _browse_views(views, objectID, page, pagesize, after)
+        payload, _ = await _browse_server(request, response, udn, objectID, page * pagesize, pagesize, bypass_cache)
         return payload
+    except HTTPException:
+        raise
+    except server_health.ServerUnavailableError as e:
+        raise HTTPException(status_code=503,
+                            detail='Mediaserver unreachable',
+                            headers={'Retry-After': str(math.ceil(e.retry_in))})
     except asyncio.TimeoutError:
         _logger.error('Mediaserver browse request timed out')
         raise HTTPException(status_code=504, detail="Request to mediaserver timed out")
     except Exception as e:
         _logger.exception(e)
         raise HTTPException(status_code=404)
+
+
+# a page of the children along with the paging information, as opposed to the plain list of `browse_library`
+@router.get('/{id}/children', response_model=models.LibraryPage)
+async def browse_library_page(request: Request,
+                              response: Response,
+                              id: str,
+                              cursor: typing.Optional[str] = None,
+                              pagesize: int = Query(50, ge=1, le=500),
+                              bypass_cache: bool = False,
+                              if_none_match: typing.Optional[str] = Header(None)):
+    """
+    Browse a page of the children of a container.
+
+    Without `cursor`, the first page of `pagesize` children is returned, otherwise the page the cursor
+    (`next` or `previous` of another page) refers to, of the page size the cursor has been created with.
+    Pages of media servers carry an ETag derived from the container's UpdateID. If it matches `If-None-Match`,
+    304 is returned, without a request to the server if the page is still cached.
+    Pages of the views and of the library index continue after the last item of the previous page.
+    """
+    starting_index = 0
+    after = None
+    if cursor is not None:
+        try:
+            starting_index, pagesize, after = decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    try:
+        udn, objectID = split_library_item_id(id)
+        if objectID is None:
+            objectID = '0'
+        views = _library_views(request)
+        if udn == VIEWS_UDN and views is not None:
+            # an item removed meanwhile can't be continued after, the starting index is the next best thing
+            last = _view_object(views, after) if after is not None else None
+            children = views.children(objectID,
+                                      after=last,
+                                      offset=0 if last is not None else starting_index,
+                                      limit=pagesize)
+            items = [
+                format_view_container(x) if isinstance(x, ViewContainer) else format_indexed_object(x)
+                for x in children
+            ]
+            result = None
+        else:
+            items, result = await _browse_server(request, response, udn, objectID, starting_index, pagesize,
+                                                 bypass_cache, after, if_none_match)
+    except HTTPException:
+        raise
+    except server_health.ServerUnavailableError as e:
+        raise HTTPException(status_code=503,
+                            detail='Mediaserver unreachable',
+                            headers={'Retry-After': str(math.ceil(e.retry_in))})
+    except asyncio.TimeoutError:
+        _logger.error('Mediaserver browse request timed out')
+        raise HTTPException(status_code=504, detail="Request to mediaserver timed out")
+    except Exception as e:
+        _logger.exception(e)
+        raise HTTPException(status_code=404)
+
+    etag = response.headers.get('ETag')
+    if etag is not None and _etag_matches(etag, if_none_match):
+        headers = {name: response.headers[name] for name in ('ETag', 'Warning') if name in response.headers}
+        return Response(status_code=304, headers=headers)
+    total_matches = result.total_matches if result is not None else None
+    update_id = result.update_id if result is not None else None
+    next_index = starting_index + len(items)
+    if total_matches is not None:
+        has_more = len(items) > 0 and next_index < total_matches
+    else:
+        has_more = len(items) >= pagesize
+    # browse results are paged by index only, the views and the index continue after the last item
+    last_id = items[-1]['id'] if result is None and items else None
+    return models.LibraryPage(items=items,
+                              number_returned=len(items),
+                              total_matches=total_matches,
+                              update_id=update_id,
+                              next=encode_cursor(next_index, pagesize, last_id) if has_more else None,
+                              previous=encode_cursor(max(0, starting_index - pagesize), pagesize)
+                              if starting_index > 0 else None)
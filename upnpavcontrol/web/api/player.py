@@ -1,24 +1,19 @@
 from fastapi import APIRouter, Request, HTTPException
+import asyncio
 import logging
 from .json_api_response import JsonApiResponse
 from .library import split_library_item_id, create_library_item_id, get_item_artwork_url
 from .. import models
 from ...core import AVControlPoint
 from ...core.mediarenderer import TransportState
-from ...core.playback.queue import PlaybackItem
-from typing import List
+from ...core.playback.queue import PlaybackItem, PlaybackQueue
+from typing import Dict, List, Optional, Tuple
 
 router = APIRouter(default_response_class=JsonApiResponse)
 _logger = logging.getLogger(__name__)
 
 
-async def _resolve_queue_item(cp: AVControlPoint, item: models.PlaybackQueueItem):
-    dms_udn, object_id = split_library_item_id(item.id)
-    if object_id is None:
-        return None
-    dms = cp.get_mediaserver_by_UDN(dms_udn)
-    didl = await dms.browse_metadata(object_id)
-    meta = didl.objects[0]
+def _create_playback_item(dms_udn: str, object_id: str, meta) -> PlaybackItem:
     img = get_item_artwork_url(meta)
     return PlaybackItem(dms_udn,
                         object_id,
@@ -28,6 +23,58 @@ async def _resolve_queue_item(cp: AVControlPoint, item: models.PlaybackQueueItem
                         image=img)
 
 
+async def _resolve_queue_item(cp: AVControlPoint, item: models.PlaybackQueueItem):
+    dms_udn, object_id = split_library_item_id(item.id)
+    if object_id is None:
+        return None
+    dms = cp.get_mediaserver_by_UDN(dms_udn)
+    didl = await dms.browse_metadata(object_id)
+    return _create_playback_item(dms_udn, object_id, didl.records[0])
+
+
+async def _resolve_queue_items(cp: AVControlPoint,
+                               items: List[models.PlaybackQueueItem]) -> List[Optional[PlaybackItem]]:
+    """
+    Resolve the metadata of all items, each distinct item only once.
+
+    Metadata already contained in cached browse results (e.g. of the album the items have been selected from)
+    is used as is, all other items are looked up concurrently. The number of concurrent requests to each
+    media server is limited by its scheduler.
+    """
+    unique = {item.id: item for item in items}
+    resolved: Dict[str, Optional[PlaybackItem]] = {}
+    ids_by_server: Dict[str, List[Tuple[str, str]]] = {}
+    for item_id in unique:
+        dms_udn, object_id = split_library_item_id(item_id)
+        if object_id is None:
+            resolved[item_id] = None
+        else:
+            ids_by_server.setdefault(dms_udn, []).append((item_id, object_id))
+    pending = []
+    for dms_udn, ids in ids_by_server.items():
+        cached = cp.get_mediaserver_by_UDN(dms_udn).lookup_cached_records(object_id for _, object_id in ids)
+        for item_id, object_id in ids:
+            if object_id in cached:
+                resolved[item_id] = _create_playback_item(dms_udn, object_id, cached[object_id])
+            else:
+                pending.append(unique[item_id])
+    if pending:
+        _logger.debug('Resolving %d of %d queue items by browsing', len(pending), len(unique))
+    lookups = await asyncio.gather(*[_resolve_queue_item(cp, item) for item in pending])
+    resolved.update((item.id, playback_item) for item, playback_item in zip(pending, lookups))
+    return [resolved[item.id] for item in items]
+
+
+def _append_records(queue: PlaybackQueue, dms_udn: str, records):
+    for record in records:
+        queue.appendItem(_create_playback_item(dms_udn, record.id, record))
+
+
+async def _playback_items(dms_udn: str, batches):
+    async for records in batches:
+        yield [_create_playback_item(dms_udn, record.id, record) for record in records]
+
+
 def control_point_from_request(request) -> AVControlPoint:
     return request.app.av_control_point
 
@@ -95,7 +142,7 @@ async def get_queued_items(request: Request, udn: str):
 async def append_items_to_queue(request: Request, udn: str, payload: models.PlaybackQueueIn):
     try:
         pc = request.app.av_control_point.get_controller_for_renderer(udn)
-        items = [await _resolve_queue_item(request.app.av_control_point, i) for i in payload.items]
+        items = await _resolve_queue_items(request.app.av_control_point, payload.items)
         for item in items:
             if item is not None:
                 pc.queue.appendItem(item)
@@ -109,7 +156,7 @@ async def append_items_to_queue(request: Request, udn: str, payload: models.Play
 async def set_queue_items(request: Request, udn: str, payload: models.PlaybackQueueIn):
     try:
         pc = request.app.av_control_point.get_controller_for_renderer(udn)
-        items = [await _resolve_queue_item(request.app.av_control_point, i) for i in payload.items]
+        items = await _resolve_queue_items(request.app.av_control_point, payload.items)
         pc.clear()
         for item in items:
             pc.queue.appendItem(item)
@@ -117,3 +164,28 @@ async def set_queue_items(request: Request, udn: str, payload: models.PlaybackQu
     except Exception as e:
         _logger.exception(e)
         raise HTTPException(status_code=404)
+
+
+@router.post('/{udn}/queue/container', status_code=202)
+async def append_container_to_queue(request: Request, udn: str, payload: models.PlaybackQueueContainerIn):
+    """
+    Append all items of a container to the queue, optionally including those of nested containers.
+
+    The first batch of items is appended before responding, so playback can start right away.
+    All others are appended in the background as soon as they have been browsed.
+    """
+    try:
+        cp = control_point_from_request(request)
+        pc = cp.get_controller_for_renderer(udn)
+        dms_udn, object_id = split_library_item_id(payload.id)
+        dms = cp.get_mediaserver_by_UDN(dms_udn)
+        batches = dms.walk_items(object_id if object_id is not None else '0', payload.recursive, payload.max_depth)
+        if not pc.is_appending:
+            try:
+                _append_records(pc.queue, dms_udn, await batches.__anext__())
+            except StopAsyncIteration:
+                return
+        pc.append_in_background(_playback_items(dms_udn, batches))
+    except Exception as e:
+        _logger.exception(e)
+        raise HTTPException(status_code=404)
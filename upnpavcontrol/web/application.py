@@ -3,6 +3,12 @@ from .static_files_spa import StaticFilesSPA
 from starlette.websockets import WebSocket
 from upnpavcontrol.core import AVControlPoint
 from upnpavcontrol.core import notification_backend
+from upnpavcontrol.core import xml_backend
+from upnpavcontrol.core import parse_pool
+from upnpavcontrol.core.library_index import LibraryIndex
+from upnpavcontrol.core.library_indexer import LibraryIndexer
+from upnpavcontrol.core.settings import ControlPointSettings
+from upnpavcontrol.core.snapshot import SnapshotStore
 from async_upnp_client.aiohttp import AiohttpRequester
 from .websocket_event_bus import WebsocketEventBus, MediaDeviceDiscoveryCallback
 from . import api
@@ -63,10 +69,30 @@ app.mount('/', static_files, name='static')
 
 
 def create_control_point_from_settings():
+    xml_backend.use_backend(settings.XML_BACKEND)
+    parse_pool.configure(threshold=settings.PARSE_OFFLOAD_THRESHOLD, executor_kind=settings.PARSE_EXECUTOR)
     endpoint = notification_backend.AiohttpNotificationEndpoint(port=settings.EVENT_CALLBACK_PORT,
                                                                 public_ip=settings.PUBLIC_IP)
     notification = notification_backend.NotificationBackend(endpoint, AiohttpRequester())
-    cp = AVControlPoint(notifcation_backend=notification)
+    indexer = None
+    if settings.LIBRARY_INDEX:
+        indexer = LibraryIndexer(LibraryIndex(settings.LIBRARY_INDEX), workers=settings.LIBRARY_INDEX_WORKERS)
+    snapshot_store = None
+    if settings.SNAPSHOT:
+        snapshot_store = SnapshotStore(settings.SNAPSHOT, interval=settings.SNAPSHOT_INTERVAL)
+    control_point_settings = ControlPointSettings(browse_cache_ttl=settings.BROWSE_CACHE_TTL,
+                                                  browse_cache_max_entries=settings.BROWSE_CACHE_MAX_ENTRIES,
+                                                  browse_cache_max_stale=settings.BROWSE_CACHE_MAX_STALE,
+                                                  device_max_concurrency=settings.DEVICE_MAX_CONCURRENCY,
+                                                  server_failure_threshold=settings.SERVER_FAILURE_THRESHOLD,
+                                                  server_retry_interval=settings.SERVER_RETRY_INTERVAL,
+                                                  prefetch_budget=settings.PREFETCH_BUDGET,
+                                                  prefetch_children=settings.PREFETCH_CHILDREN,
+                                                  search_timeout=settings.SEARCH_TIMEOUT)
+    cp = AVControlPoint(notifcation_backend=notification,
+                        library_indexer=indexer,
+                        snapshot_store=snapshot_store,
+                        settings=control_point_settings)
     return cp
 
 
@@ -92,3 +118,6 @@ async def init_event_bus():
 async def stop_av_control_point():
     if app.av_control_point is not None:
         await app.av_control_point.async_stop()
+        if app.av_control_point.library_indexer is not None:
+            app.av_control_point.library_indexer.index.close()
+    parse_pool.shared_pool.shutdown()
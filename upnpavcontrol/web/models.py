@@ -3,6 +3,8 @@ from pydantic import Field, BaseModel
 import typing
 from upnpavcontrol.core import typing_compat
 from upnpavcontrol.core.mediarenderer import TransportState
+from upnpavcontrol.core.federated_search import SearchStatus
+from upnpavcontrol.core.server_health import HealthState
 
 
 class ApiInfo(BaseModel):
@@ -52,6 +54,12 @@ class PlaybackQueueIn(BaseModel):
     items: typing.List[PlaybackQueueItem]
 
 
+class PlaybackQueueContainerIn(BaseModel):
+    id: str
+    recursive: bool = False
+    max_depth: typing.Optional[int] = None
+
+
 class LibraryItemType(Enum):
     CONTAINER = 'container'
     ITEM = 'item'
@@ -68,6 +76,15 @@ class LibraryListItem(BaseModel):
         orm_mode = True
 
 
+class LibraryPage(BaseModel):
+    items: typing.List[LibraryListItem]
+    number_returned: int
+    total_matches: typing.Optional[int]
+    update_id: typing.Optional[int]
+    next: typing.Optional[str]
+    previous: typing.Optional[str]
+
+
 class LibraryItemMetadata(BaseModel):
     id: str
     parentID: typing.Optional[str]
@@ -83,3 +100,90 @@ class LibraryItemMetadata(BaseModel):
     class Config:
         orm_mode = True
         allow_population_by_field_name = True
+
+
+class ServerSearchResult(BaseModel):
+    id: str
+    title: str
+    status: SearchStatus
+    total_matches: typing.Optional[int]
+    items: typing.List[LibraryListItem]
+
+    class Config:
+        use_enum_values = True
+
+
+class SchedulerLaneStatistics(BaseModel):
+    queued: int
+    max_queued: int
+    admitted: int
+    mean_wait: float
+    max_wait: float
+
+    class Config:
+        orm_mode = True
+
+
+class SchedulerStatistics(BaseModel):
+    max_concurrency: int
+    active: int
+    lanes: typing.Dict[str, SchedulerLaneStatistics]
+
+    class Config:
+        orm_mode = True
+
+
+class LibraryIndexStatus(BaseModel):
+    crawling: bool
+    incremental: bool = False
+    containers: int = 0
+    unchanged: int = 0
+    objects: int = 0
+    deleted: int = 0
+    pending: int = 0
+    failed: int = 0
+    eta_seconds: typing.Optional[float]
+    indexed_objects: int
+    indexed_at: typing.Optional[float]
+
+
+class BrowseCacheStatistics(BaseModel):
+    hits: int
+    misses: int
+    evictions: int
+    expirations: int
+    invalidations: int
+    bypasses: int
+    stale_hits: int
+    entries: int
+    size: int
+
+    class Config:
+        orm_mode = True
+
+
+class PrefetchStatistics(BaseModel):
+    scheduled: int
+    completed: int
+    failed: int
+    skipped: int
+    lookups: int
+    hits: int
+    hit_rate: float
+    accuracy: float
+
+    class Config:
+        orm_mode = True
+
+
+class ServerHealthStatistics(BaseModel):
+    state: HealthState
+    consecutive_failures: int
+    failures: int
+    rejected: int
+    retry_in: typing.Optional[float]
+    last_error: typing.Optional[str]
+
+    class Config:
+        orm_mode = True
+        use_enum_values = True
@@ -1,5 +1,6 @@
 from starlette.config import Config
 from starlette.datastructures import Secret
+from ..core.settings import DEFAULT_SEARCH_TIMEOUT
 
 config = Config(".env")
 
@@ -8,3 +9,19 @@ EVENT_CALLBACK_PORT = config('UPNP_AV_CONTROL_EVENT_CALLBACK_PORT', cast=int, de
 PUBLIC_IP = config('UPNP_AV_CONTROL_PUBLIC_IP', cast=str, default=None)
 QUIET = config('UPNP_AV_CONTROL_QUIET', cast=bool, default=False)
 DEBUG = config('UPNP_AV_CONTROL_DEBUG', cast=bool, default=False)
+XML_BACKEND = config('UPNP_AV_CONTROL_XML_BACKEND', cast=str, default=None)
+PARSE_OFFLOAD_THRESHOLD = config('UPNP_AV_CONTROL_PARSE_OFFLOAD_THRESHOLD', cast=int, default=256 * 1024)
+PARSE_EXECUTOR = config('UPNP_AV_CONTROL_PARSE_EXECUTOR', cast=str, default='thread')
+BROWSE_CACHE_TTL = config('UPNP_AV_CONTROL_BROWSE_CACHE_TTL', cast=float, default=300.0)
+BROWSE_CACHE_MAX_ENTRIES = config('UPNP_AV_CONTROL_BROWSE_CACHE_MAX_ENTRIES', cast=int, default=256)
+BROWSE_CACHE_MAX_STALE = config('UPNP_AV_CONTROL_BROWSE_CACHE_MAX_STALE', cast=float, default=24 * 3600.0)
+SERVER_FAILURE_THRESHOLD = config('UPNP_AV_CONTROL_SERVER_FAILURE_THRESHOLD', cast=int, default=2)
+SERVER_RETRY_INTERVAL = config('UPNP_AV_CONTROL_SERVER_RETRY_INTERVAL', cast=float, default=10.0)
+DEVICE_MAX_CONCURRENCY = config('UPNP_AV_CONTROL_DEVICE_MAX_CONCURRENCY', cast=int, default=2)
+LIBRARY_INDEX = config('UPNP_AV_CONTROL_LIBRARY_INDEX', cast=str, default=None)
+LIBRARY_INDEX_WORKERS = config('UPNP_AV_CONTROL_LIBRARY_INDEX_WORKERS', cast=int, default=2)
+SEARCH_TIMEOUT = config('UPNP_AV_CONTROL_SEARCH_TIMEOUT', cast=float, default=DEFAULT_SEARCH_TIMEOUT)
+PREFETCH_BUDGET = config('UPNP_AV_CONTROL_PREFETCH_BUDGET', cast=int, default=30)
+PREFETCH_CHILDREN = config('UPNP_AV_CONTROL_PREFETCH_CHILDREN', cast=int, default=3)
+SNAPSHOT = config('UPNP_AV_CONTROL_SNAPSHOT', cast=str, default=None)
+SNAPSHOT_INTERVAL = config('UPNP_AV_CONTROL_SNAPSHOT_INTERVAL', cast=float, default=300.0)